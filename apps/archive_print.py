@@ -0,0 +1,17 @@
+import sys
+
+from cdmft.h5reader import ArchiveReader
+
+
+for fname in sys.argv[1:]:
+    arch = ArchiveReader(fname)
+    n_loops = arch.get_completed_loops()
+    print fname+':', n_loops, 'loops'
+    if n_loops == 0:
+        continue
+    for key in sorted(arch.keys()):
+        quantity = arch.load(key)
+        if isinstance(quantity, (int, long, float, complex, str)) or getattr(quantity, 'shape', None) == ():
+            print ' ', key, '=', quantity
+        else:
+            print ' ', key
@@ -0,0 +1,28 @@
+import sys
+
+from cdmft.catalog import Catalog
+
+# catalog_query.py catalog.sqlite [condition [values...]] [-update path ...]
+# prints the archives that fulfill the SQL condition, e.g.
+# catalog_query.py sweep.sqlite "beta = ? and average_sign > ?" 40 .5 -update runs/
+
+
+def to_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+args = sys.argv[1:]
+update_paths = []
+if '-update' in args:
+    update_paths = args[args.index('-update') + 1:]
+    args = args[:args.index('-update')]
+cat = Catalog(args[0])
+if update_paths:
+    cat.update(update_paths)
+condition = args[1] if len(args) > 1 else None
+for path in cat.query(condition, *[to_number(v) for v in args[2:]]):
+    print path
+cat.close()
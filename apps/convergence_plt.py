@@ -9,7 +9,7 @@ for fname in sys.argv[1:]:
     ax = fig.add_axes([.12,.13,.75,.8])
     ax2 = ax.twinx()
     indices = None
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     ys = []
     x = np.array(range(sto.get_completed_loops()))
     #x = np.array(range(5))
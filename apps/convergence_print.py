@@ -3,8 +3,11 @@ from cdmft.h5interface import Storage
 from cdmft.convergence import Criterion
 
 
-for fname in sys.argv[1:]:
-    sto = Storage(fname)
+follow = '-follow' in sys.argv[1:]
+for fname in [arg for arg in sys.argv[1:] if arg != '-follow']:
+    sto = Storage(fname, read_only=True)
     crit = Criterion(sto)
     print fname+':',crit.confirms_convergence()
-
+    if follow:
+        for loop_nr in sto.follow(timeout=24*3600):
+            print fname+', loop '+str(loop_nr)+':',crit.confirms_convergence()
@@ -9,7 +9,7 @@ from cdmft.plot.cfg import plt, ax
 
 only_diag = False
 for arch_name in sys.argv[1:]:
-    sto = Storage(arch_name)
+    sto = Storage(arch_name, read_only=True)
     g = sto.load("delta_tau")
     inds = [(b, i, j) for b, i, j in g.all_indices if i == j or not only_diag]
     colors = [matplotlib.cm.jet(i/float(max(1, len(inds)-1)))
@@ -8,7 +8,7 @@ x = []
 xlabs = []
 for i, fname in enumerate(sys.argv[1:]):
     print 'loading '+fname+'...'
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     y.append(sto.load("density"))
     x.append(i)
     xlabs.append(fname[fname.find('tb')+2:-3])
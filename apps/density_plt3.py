@@ -6,7 +6,7 @@ from cdmft.plot.cfg import plt, ax
 
 colors = [matplotlib.cm.jet(i/max(1.,float(len(sys.argv[1:])-1))) for i in range(len(sys.argv[1:]))]
 for fname, c in zip(sys.argv[1:], colors):
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     y = []
     y0 = []
     x = []
@@ -9,7 +9,7 @@ w_max = 10
 orb1 = ('up-X', 0, 0)
 orb2 = ('dn-X', 0, 0)
 for fname in sys.argv[1:]:
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     n_loops = min(10, sto.get_completed_loops())
     colors = [matplotlib.cm.jet(i/float(max(1,n_loops-1))) for i in range(n_loops)]
     for l, c in zip(range(-n_loops, 0), colors):
@@ -6,18 +6,17 @@ from cdmft.plot.cfg import plt, ax
 
 for fname in sys.argv[1:]:
     w_max = 20
-    sto = Storage(fname)
-    g = sto.load("g_imp_iw")
-    supermesh = np.array([iw.imag for iw in g.mesh])
-    n_iw0 = int(len(supermesh)*.5)
-    n_w_max = np.argwhere(supermesh <= w_max)[-1,0]
-    mesh = supermesh[n_iw0:n_w_max]
-    orbs = [i for i in g.all_indices]
+    sto = Storage(fname, read_only=True)
+    block_names = sto.load_block_names("g_imp_iw")
+    supermesh = sto.load_matsubara_frequencies("g_imp_iw", block_names[0])
+    mesh = supermesh[(supermesh > 0) & (supermesh <= w_max)]
+    blocks = [sto.load_slice("g_imp_iw", -1, b, frequency_range = (0, len(mesh)))[0] for b in block_names]
+    orbs = [(b, i, j) for b, data in zip(block_names, blocks) for i in range(data.shape[1]) for j in range(data.shape[2])]
     n_orbs = len(orbs)
     colors = [matplotlib.cm.jet(i/float(max(1,n_orbs-1))) for i in range(n_orbs)]
     for orb, c in zip(orbs, colors):
         b, i, j = orb
-        y = g[b][i[0], j[0]].data[n_iw0:n_w_max].imag
+        y = blocks[block_names.index(b)][:, i, j].imag
         ax.plot(mesh, y, label = '$'+b+str(i)+str(j)+'$', color = c)
     ax.set_xlabel("$i\\omega_n$")
     ax.set_ylabel("$\\Im G(i\\omega_n)$")
@@ -13,7 +13,7 @@ ax = fig.add_axes([.13, .12, .76, .82])
 ax2 = ax.twinx()
 for fname in sys.argv[1:]:
     w_max = 1
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     g = sto.load("g_imp_iw")
     #g << inverse(g)
     # print g['XY'][0,1].total_density()
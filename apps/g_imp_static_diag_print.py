@@ -5,7 +5,7 @@ from cdmft.h5interface import Storage
 
 
 for fname in sys.argv[1:]:
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     ev = Evaluation(sto)
     print
     print fname+':'
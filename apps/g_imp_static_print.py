@@ -5,7 +5,7 @@ from cdmft.h5interface import Storage
 
 for fname in sys.argv[1:]:
     print fname+':'
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     g = sto.load('g_imp_iw')
     for s, b in g:
         print s
@@ -5,7 +5,7 @@ from cdmft.plot.cfg import plt, ax
 
 
 for fname in sys.argv[1:]:
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     loop_nr = sto.get_last_loop_nr()
     g = sto.load("g_sol_l", loop_nr)
     x = [l.real for l in g.mesh]
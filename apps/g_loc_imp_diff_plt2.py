@@ -7,7 +7,7 @@ from cdmft.plot.cfg import plt, ax
 nc = len(sys.argv[1:])
 colors = [matplotlib.cm.viridis(i/float(max(1,nc-1))) for i in range(nc)]
 for fname, color in zip(sys.argv[1:], colors):
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     n_freq = 20
     n_loops = sto.get_completed_loops()
     x = []
@@ -9,7 +9,7 @@ from cdmft.plot.cfg import plt, ax
 
 for arch_name in sys.argv[1:]:
     print 'loading', arch_name+'...'
-    sto = Storage(arch_name)
+    sto = Storage(arch_name, read_only=True)
     for loop, alpha in zip([-2, -1], [.2, 1.]):
         giw = sto.load("g_imp_iw", loop)
         g = BlockGf(name_block_generator=[(s, GfImTime(
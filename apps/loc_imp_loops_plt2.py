@@ -8,7 +8,7 @@ index = None
 w_max = 10
 orb_nr = 1
 for fname in sys.argv[1:]:
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     n_loops = min(10, sto.get_completed_loops())
     g_loc = sto.load("g_loc_iw")
     g_imp = sto.load("g_imp_iw")
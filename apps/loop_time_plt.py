@@ -1,6 +1,7 @@
 import matplotlib, sys, numpy as np
 
 from cdmft.h5interface import Storage
+from cdmft.evaluation.common import Evaluation
 from cdmft.plot.cfg import plt, ax
 
 
@@ -8,14 +9,9 @@ n = len(sys.argv[1:])
 colors = [matplotlib.cm.jet(i/float(max(1,n-1))) for i in range(n)]
 for fname, color in zip(sys.argv[1:], colors):
     print "loading "+fname+"..."
-    sto = Storage(fname)
-    y = []
-    x = []
-    n_loops = sto.get_completed_loops()
-    for l in range(n_loops):
-        t = sto.load("loop_time", l)
-        y.append(t/float(60))
-        x.append(l)
+    summary = Evaluation(Storage(fname, read_only=True)).get_summary()
+    x = summary["loop"]
+    y = summary["loop_time"].real/float(60)
     ax.plot(x, y, marker = "+", color = color, label = '$\\mathrm{'+fname[:-3]+'}$')
 ax.set_xlabel("$\mathrm{DMFT-Loop}$")
 ax.set_ylabel("$t[min]$")
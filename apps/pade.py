@@ -15,7 +15,7 @@ nambu = False
 pade_orbital = False
 for archive_name in sys.argv[1:]:
     print "loading "+archive_name+"..."
-    sto = Storage(archive_name)
+    sto = Storage(archive_name, read_only=True)
     giw = sto.load("g_imp_iw")
     #giw = BlockGf(name_block_generator = [(s, GfImFreq(indices = [i for i in b.indices], beta = gtau.mesh.beta, n_points = n_iw))for s, b in gtau], make_copies=False)
     # for s, b in giw:
@@ -12,7 +12,7 @@ from cdmft.plot.cfg import plt
 for archive_name in sys.argv[1:]:
     fig = plt.figure()
     ax = fig.add_axes([.12, .12, .83, .82])
-    archive = Storage(archive_name)
+    archive = Storage(archive_name, read_only=True)
     histos_orb = archive.load('perturbation_order', bcast=False)
     histo_tot = archive.load('perturbation_order_total', bcast=False)
     if histo_tot is None:
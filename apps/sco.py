@@ -9,7 +9,7 @@ from cdmft.plot.cfg import plt, ax
 
 for fname in sys.argv[1:]:
     print 'loading '+fname+'...'
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     n_loops = sto.get_completed_loops()
     loops = range(n_loops)
     orbs = [(k, i, i) for k, i in itt.product(['G', 'M'], [0, 1])] + \
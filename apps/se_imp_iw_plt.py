@@ -17,7 +17,7 @@ ax2 = ax.twinx()
 for fname in sys.argv[1:]:
     print 'loading', fname+'...'
     w_max = 100
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     g = sto.load("se_imp_iw")
     supermesh = np.array([iw.imag for iw in g.mesh])
     n_iw0 = int(len(supermesh)*.5)
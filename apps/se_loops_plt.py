@@ -11,7 +11,7 @@ index = None
 w_max = 10
 orb_nr = 1
 for fname in sys.argv[1:]:
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
     n_loops = min(10, sto.get_completed_loops())
     colors = [matplotlib.cm.jet(i/float(max(1, n_loops-1)))
               for i in range(n_loops)]
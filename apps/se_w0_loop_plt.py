@@ -8,17 +8,16 @@ for fname in sys.argv[1:]:
     fig = plt.figure()
     ax = fig.add_axes([.12,.13,.75,.8])
     ax2 = ax.twinx()
-    indices = None
-    sto = Storage(fname)
+    sto = Storage(fname, read_only=True)
+    loops = range(sto.get_completed_loops())
+    x = np.array(loops)
+    g = sto.load("se_imp_iw")
+    indices = [str(b)+str(i[0])+str(j[0]) for b,i,j in g.all_indices]
     ys = []
-    x = np.array(range(sto.get_completed_loops()))
-    for l in range(sto.get_completed_loops()):
-        g = sto.load("se_imp_iw", l)
-        if indices is None:
-            indices = [str(b)+str(i[0])+str(j[0]) for b,i,j in g.all_indices]
-        n_iw0 = int(len([iw for iw in g.mesh])*.5)
-        ys.append([g[b][i[0],j[0]].data[n_iw0] for b,i,j in g.all_indices])
-    ys = np.array(ys).T
+    for b,i,j in g.all_indices:
+        ys.append(sto.load_slice("se_imp_iw", loops, b, (i[0], j[0]), (0, 1))[:, 0])
+    del g
+    ys = np.array(ys)
     n_y = ys.shape[0]
     colors = [matplotlib.cm.jet(i/float(n_y-1)) for i in range(n_y)]
     for y, label, color in zip(ys, indices, colors):
@@ -1,17 +1,14 @@
 import matplotlib, sys, numpy as np
 
 from cdmft.h5interface import Storage
+from cdmft.evaluation.common import Evaluation
 from cdmft.plot.cfg import plt, ax
 
 
 for fname in sys.argv[1:]:
-    sto = Storage(fname)
-    y = []
-    x = []
-    n_loops = sto.get_completed_loops()
-    for l in range(n_loops):
-        y.append(sto.load("average_sign", l))
-        x.append(l)
+    summary = Evaluation(Storage(fname, read_only=True)).get_summary()
+    x = summary["loop"]
+    y = summary["average_sign"].real
     ax.plot(x, y, marker = "+")
     ax.set_xlabel("$\mathrm{DMFT-Loop}$")
     ax.set_ylabel("$<\\mathrm{sign}>$")
@@ -5,7 +5,7 @@ from cdmft.setups.bethelattice import TriangleMomentum as Setup
 from cdmft.operators.hubbard import TriangleMomentum as Ops
 from cdmft.h5interface import Storage
 from cdmft.evaluation.common import Evaluation
-from cdmft.evaluation.densitymatrix import StaticObservable
+from cdmft.evaluation.densitymatrix import StaticObservables
 from cdmft.plot.cfg import plt, ax
 
 
@@ -45,11 +45,8 @@ for arch in sys.argv[1:]:
     if omega_max is None:
         omega_max = bins[-1]
     if degeneracy_labels:
-        n_obs = StaticObservable(ops.n_tot(), sto)
-        obs1 = n_obs.get_expectation_value_statewise()
-        #s2_obs = StaticObservable(ops.s2_tot(), sto)
-        s2_obs = StaticObservable(ops.ss_tot(), sto)
-        obs2 = s2_obs.get_expectation_value_statewise()
+        #obs1, obs2 = StaticObservables([ops.n_tot(), ops.s2_tot()], sto).get_expectation_values_statewise()
+        obs1, obs2 = StaticObservables([ops.n_tot(), ops.ss_tot()], sto).get_expectation_values_statewise()
         bin_degeneracies = np.zeros([len(bins)])
         bin_obs1 = np.zeros([len(bins)])
         bin_obs2 = np.zeros([len(bins)])
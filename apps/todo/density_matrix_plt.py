@@ -11,7 +11,7 @@ for arch in sys.argv[1:]:
     roh = ev.get_density_matrix()
     fig = plt.figure()
     ax = fig.add_axes([.1,.1,.8,.75])
-    ax.matshow(roh)
+    ax.matshow(roh.toarray())
     ax.set_title("$\\rho$")
     plt.savefig(arch[:-3]+"_density_matrix.pdf")
     plt.close()
@@ -1,5 +1,4 @@
 import numpy as np, sys
-from scipy.linalg import logm
 from getnr.getnr import get_nr
 
 from cdmft.evaluation.common import Evaluation
@@ -14,11 +13,7 @@ for arch in sys.argv[1:]:
     x = get_nr(arch, 'u')[0]
     sto = Storage(arch)
     ev = Evaluation(sto)
-    rho = ev.get_density_matrix()
-    ent = -np.trace(rho.dot(logm(rho)))
-    if not np.allclose(ent.imag, 0, atol = 1e-3):
-        print 'dropping non-vanishing imaginary part!'
-    ent = ent.real
+    ent = ev.get_entropy()
     print 'S = '+str(ent)
     entropies.append(ent)
     xs.append(x)
@@ -2,31 +2,29 @@ import matplotlib, sys, numpy as np
 from scipy.stats import sem
 
 from cdmft.h5interface import Storage
+from cdmft.evaluation.common import Evaluation
 from cdmft.plot.cfg import plt, ax
 
 
+def get_sz(g):
+    up = 0
+    dn = 0
+    for s, b in g:
+        if 'up' in s:
+            up += b.total_density()
+        elif 'dn' in s or 'down' in s:
+            dn += b.total_density()
+        else:
+            assert False, 'need up/dn-blocks'
+    return (up - dn).real*.5
+
+
 nc = len(sys.argv[1:])
 colors = [matplotlib.cm.jet(i/float(max(1,nc-1))) for i in range(nc)]
 for fname, c in zip(sys.argv[1:], colors):
-    sto = Storage(fname)
-    y = []
-    x = []
-    n_loops = sto.get_completed_loops()
-    for l in range(n_loops):
-        g = sto.load('g_imp_iw', l)
-        up = 0
-        dn = 0
-        n_blocks = 0
-        for s, b in g:
-            if 'up' in s:
-                up += b.total_density()
-            elif 'dn' in s or 'down' in s:
-                dn += b.total_density()
-            else:
-                assert False, 'need up/dn-blocks'
-            n_blocks += 1
-        y.append((up - dn).real*.5)
-        x.append(l)
+    sto = Storage(fname, read_only=True)
+    y = Evaluation(sto).series('g_imp_iw', get_sz)
+    x = range(len(y))
     print fname, np.mean(y[-6:]), sem(y[-6:])
     ax.plot(x, y, marker = "+", label = '$\\mathrm{'+fname[:-3]+'}$', color = c)
 #ax.plot([0,16], [0,0], color = 'gray')
@@ -0,0 +1,196 @@
+import os
+import sqlite3
+import h5py
+import numpy as np
+
+from h5reader import read_physical_labels, read_gf_beta, read_loop_summary, open_file
+
+
+class Catalog:
+    """
+    an index of the metadata of many archives in an SQLite file, for queries over parameter
+    sweeps without opening the archives. Each archive is a row of the table archives with
+    the columns path, mtime, n_loops, beta, the scalars of the last loop, the scalars of its
+    last_solve_parameters prefixed by solver_ and the last row of the loop summary. Columns
+    are added as new quantities appear, archives lacking a quantity have NULL.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.connection = sqlite3.connect(file_name)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS archives (path TEXT PRIMARY KEY, mtime REAL)")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def columns(self):
+        return [str(row[1]) for row in self.connection.execute("PRAGMA table_info(archives)")]
+
+    def update(self, paths, pattern=".h5"):
+        """
+        (re)indexes the archives in paths whose modification time changed since the last update
+        and forgets archives that don't exist anymore, directories are searched recursively for
+        file names ending with pattern. Returns the paths of the (re)indexed archives.
+        """
+        mtimes = dict(self.connection.execute("SELECT path, mtime FROM archives").fetchall())
+        updated = []
+        for file_name in find_archives(paths, pattern):
+            mtime = os.path.getmtime(file_name)
+            if mtimes.get(file_name) == mtime:
+                continue
+            try:
+                metadata = read_archive_metadata(file_name)
+            except (IOError, KeyError, RuntimeError):
+                continue
+            metadata["mtime"] = mtime
+            self._write_row(file_name, metadata)
+            updated.append(file_name)
+        for file_name in mtimes.keys():
+            if not os.path.exists(file_name):
+                self.connection.execute("DELETE FROM archives WHERE path = ?", (file_name,))
+        self.connection.commit()
+        return updated
+
+    def _write_row(self, file_name, metadata):
+        """
+        SQLite column names are case-insensitive, of names that differ only in case the first
+        one in sorted order is kept
+        """
+        columns = [name.lower() for name in self.columns()]
+        names = ["path"]
+        for name in sorted(metadata.keys()):
+            if name.lower() in [n.lower() for n in names]:
+                print "warning: skipping", name, "of", file_name, "as its column exists in another case"
+                continue
+            names.append(name)
+            if name.lower() not in columns:
+                self.connection.execute("ALTER TABLE archives ADD COLUMN "+_quote(name))
+        self.connection.execute("DELETE FROM archives WHERE path = ?", (file_name,))
+        self.connection.execute(
+            "INSERT INTO archives ("+", ".join([_quote(n) for n in names])+") VALUES ("+", ".join(["?"] * len(names))+")",
+            [file_name] + [metadata[n] for n in names[1:]])
+
+    def query(self, condition=None, *values):
+        """
+        paths of the archives that fulfill condition, an SQL expression of the columns, e.g.
+        query("beta = ? and average_sign > ?", 40, .5)
+        """
+        sql = "SELECT path FROM archives"
+        if condition:
+            sql += " WHERE "+condition
+        return [str(row[0]) for row in self.connection.execute(sql+" ORDER BY path", values)]
+
+    def get(self, path):
+        """
+        the metadata of an archive as dict, without NULL entries
+        """
+        cursor = self.connection.execute(
+            "SELECT * FROM archives WHERE path = ?", (os.path.abspath(path),))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict([(str(d[0]), v) for d, v in zip(cursor.description, row) if v is not None])
+
+
+def find_archives(paths, pattern=".h5"):
+    """
+    absolute file names of the files in paths and of the files ending with pattern in the
+    directories in paths
+    """
+    file_names = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, dirs, files in os.walk(path):
+                file_names += [os.path.join(directory, f) for f in sorted(files) if f.endswith(pattern)]
+        elif os.path.isfile(path):
+            file_names.append(path)
+    return [os.path.abspath(f) for f in file_names]
+
+
+def read_archive_metadata(file_name):
+    """
+    the metadata of an archive that Catalog records, only the number of loops for archives
+    that aren't written by Storage
+    """
+    metadata = {"n_loops": None}
+    with open_file(file_name, lock=False) as disk:
+        if "dmft_results" not in disk:
+            return metadata
+        results = disk["dmft_results"]
+        n_loops = metadata["n_loops"] = int(results["n_dmft_loops"][()])
+        if n_loops == 0:
+            return metadata
+        loop = results[read_physical_labels(results, [-1])[0]]
+        metadata.update(read_scalars(loop))
+        if "last_solve_parameters" in loop:
+            for name, value in read_scalars(loop["last_solve_parameters"]).items():
+                metadata["solver_"+name] = value
+        beta = read_beta(loop)
+        if beta is not None:
+            metadata["beta"] = beta
+        summary = read_loop_summary(disk)
+        if summary is not None:
+            for name, column in summary.items():
+                if name.endswith("_labels") or name == "loop":
+                    continue
+                if name+"_labels" in summary:
+                    for label, value in zip(summary[name+"_labels"], column[-1]):
+                        metadata[name+"_"+label] = _to_sql(value)
+                else:
+                    metadata[name] = _to_sql(column[-1])
+    return dict([(name, value) for name, value in metadata.items()
+                 if value is not None or name == "n_loops"])
+
+
+def read_scalars(group):
+    """
+    the scalar datasets of group as dict
+    """
+    scalars = {}
+    for name, node in group.items():
+        if isinstance(node, h5py.Dataset) and node.shape == ():
+            value = _to_sql(node[()])
+            if value is not None:
+                scalars[str(name)] = value
+    return scalars
+
+
+def read_beta(loop):
+    """
+    beta of the first Green's function found in loop, None if there is none
+    """
+    for name in ["g_weiss_iw", "g_imp_iw", "g_loc_iw", "se_imp_iw", "g0_iw"]:
+        if name not in loop:
+            continue
+        try:
+            return read_gf_beta(loop[name])
+        except KeyError:
+            continue
+    return None
+
+
+def _to_sql(value):
+    """
+    numbers and strings as the types SQLite stores, None for other types and nan
+    """
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, (bool, np.bool_)):
+        return int(value)
+    if isinstance(value, (int, long, np.integer)):
+        return int(value)
+    if isinstance(value, (complex, np.complexfloating)):
+        if value.imag != 0:
+            return None
+        value = value.real
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, unicode):
+        return value
+    return None
+
+
+def _quote(name):
+    return '"'+name.replace('"', '""')+'"'
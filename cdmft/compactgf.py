@@ -0,0 +1,107 @@
+import numpy as np
+from scipy.special import spherical_jn
+
+
+def legendre_to_matsubara_matrix(n_min, n_max, n_l):
+    """
+    T[n, l] with G(iw_n) = sum_l T[n, l] G_l for the fermionic Matsubara frequencies
+    n_min <= n < n_max, independent of beta, using j_l(-x) = (-1)^l j_l(x) for n < 0
+    """
+    n = np.arange(n_min, n_max)
+    l = np.arange(n_l)
+    x = (2 * n + 1) * np.pi * .5
+    j = spherical_jn(l[None, :], np.abs(x)[:, None]) * np.where(x < 0, -1., 1.)[:, None]**l[None, :]
+    return (-1.)**n[:, None] * 1j**(l[None, :] + 1) * np.sqrt(2 * l[None, :] + 1) * j
+
+
+def estimate_constant_moment(data):
+    """
+    the constant term of the high-frequency expansion, e.g. the Hartree term of a self-energy,
+    from the two largest frequencies of data on a symmetric Matsubara mesh (mesh, i, j)
+    assuming data(iw) + data(-iw) = 2 m_0 - 2 m_2 / w^2
+    """
+    n_half = data.shape[0] // 2
+    n1, n2 = n_half - 1, n_half // 2
+    w1, w2 = 2 * n1 + 1, 2 * n2 + 1
+    s1 = .5 * (data[n_half + n1] + data[n_half - n1 - 1])
+    s2 = .5 * (data[n_half + n2] + data[n_half - n2 - 1])
+    return (s1 * w1**2 - s2 * w2**2) / float(w1**2 - w2**2)
+
+
+def compress(data, n_l_max=120, tol=1e-6, n_l_step=10):
+    """
+    expands data on a symmetric Matsubara mesh (mesh, i, j) into the constant moment and as
+    few Legendre coefficients as needed to reproduce data within the relative error tol,
+    returns coefficients (l, i, j), the constant moment (i, j) and the relative error
+    """
+    n_mesh = data.shape[0]
+    moment_0 = estimate_constant_moment(data)
+    rhs = (data - moment_0[None, :, :]).reshape(n_mesh, -1)
+    norm = max(np.max(np.abs(data)), 1e-300)
+    for n_l in range(n_l_step, n_l_max + 1, n_l_step):
+        t = legendre_to_matsubara_matrix(-(n_mesh // 2), n_mesh - n_mesh // 2, n_l)
+        coefficients = np.linalg.lstsq(t, rhs, rcond=None)[0]
+        error = np.max(np.abs(t.dot(coefficients) - rhs)) / norm
+        if error < tol:
+            break
+    return coefficients.reshape((n_l,) + data.shape[1:]), moment_0, error
+
+
+def decompress(coefficients, moment_0, n_min, n_max):
+    """
+    data (mesh, i, j) for the Matsubara frequencies n_min <= n < n_max
+    """
+    t = legendre_to_matsubara_matrix(n_min, n_max, coefficients.shape[0])
+    data = t.dot(coefficients.reshape(coefficients.shape[0], -1))
+    return data.reshape((n_max - n_min,) + coefficients.shape[1:]) + moment_0[None, :, :]
+
+
+def compress_blocks(block_names, block_data, beta, n_l_max=120, tol=1e-6):
+    """
+    the compact representation of a BlockGf on a Matsubara mesh as dict that HDFArchive can
+    store, None if any block can't be represented within tol
+    """
+    compact = {"compact_basis": "legendre", "beta": float(beta),
+               "n_mesh": int(block_data[0].shape[0]), "n_blocks": len(block_names)}
+    for i, (bn, data) in enumerate(zip(block_names, block_data)):
+        coefficients, moment_0, error = compress(data, n_l_max, tol)
+        if error >= tol:
+            return None
+        compact["block_"+str(i)] = {"name": bn, "coefficients": coefficients,
+                                    "moment_0": moment_0}
+    return compact
+
+
+def is_compact(obj):
+    return hasattr(obj, "keys") and "compact_basis" in obj.keys()
+
+
+def decompress_blocks(compact, frequency_range=None):
+    """
+    block names and the list of data (mesh, i, j) of a compact BlockGf, compact can be a dict
+    or a group of HDFArchive or h5py with the structure of compress_blocks
+    frequency_range: (n_min, n_max), None for the whole mesh
+    """
+    n_mesh = int(_value(compact["n_mesh"]))
+    if frequency_range is None:
+        frequency_range = (-(n_mesh // 2), n_mesh - n_mesh // 2)
+    block_names, block_data = [], []
+    for i in range(int(_value(compact["n_blocks"]))):
+        block = compact["block_"+str(i)]
+        name = _value(block["name"])
+        block_names.append(str(name.decode()) if isinstance(name, bytes) else str(name))
+        block_data.append(decompress(_value(block["coefficients"]), _value(block["moment_0"]),
+                                     *frequency_range))
+    return block_names, block_data
+
+
+def _value(node):
+    """
+    h5py returns datasets, HDFArchive and dicts return values
+    """
+    if hasattr(node, "attrs") and hasattr(node, "dtype"):
+        complex_pairs = node.attrs.get("__complex__", 0)
+        node = node[()]
+        if complex_pairs:
+            node = node[..., 0] + 1j * node[..., 1]
+    return node
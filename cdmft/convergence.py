@@ -1,6 +1,6 @@
 import numpy as np
 import itertools as itt
-from scipy.stats import sem, linregress
+from collections import deque
 from pytriqs.utility import mpi
 from cdmft.evaluation.common import Evaluation
 
@@ -39,75 +39,245 @@ class DMuMaxSqueezer:
 
 
 class Criterion:
-    def __init__(self, storage, loops=range(-8, 0, 1), n_omega=30, lim_absgdiff=1e-3, lim_slopes=1e-3, lim_staticslopes=1e-3, lim_staticsem=3e-3, verbose=True):
+    """
+    history: LoopHistory to read the loops from instead of the archive, the verdict is then
+    found on the master node without I/O and broadcasted, Cycle.add_convergence_criterion sets it
+    noise_factor: also converged if the changes of g_imp between the loops and g_loc - g_imp are
+    within noise_factor times the Monte Carlo error of a difference of two loops, needs the
+    error estimates of the history. Off by default: the errors are a heuristic of the solver,
+    see impuritysolver.estimate_legendre_noise, which overestimates them if G_l hasn't decayed
+    within n_l and then declares convergence too early. Use it only if the tail of G_l is flat.
+    """
+    def __init__(self, storage, loops=range(-8, 0, 1), n_omega=30, lim_absgdiff=1e-3, lim_slopes=1e-3, lim_staticslopes=1e-3, lim_staticsem=3e-3, verbose=True, history=None, noise_factor=None):
         self.loops, self.n_omega, self.lim_absgdiff, self.lim_slopes, self.lim_staticslopes, self.lim_staticsem = loops, n_omega, lim_absgdiff, lim_slopes, lim_staticslopes, lim_staticsem
         self.storage = storage
         self.evaluation = Evaluation(storage)
         self.verbose = verbose
+        self.history = history
+        self.noise_factor = noise_factor
+        if noise_factor is not None and mpi.is_master_node():
+            print "warning: noise-limited convergence relies on heuristic error estimates, check that G_l decays within n_l"
+        self._block_names = None
+        self._orbitals = None
 
     def confirms_convergence(self):
+        if self.history is None:
+            return self._evaluate(self.storage.get_completed_loops(), self._load_orbital_data, self._load_static)
+        converged = None
+        if mpi.is_master_node():
+            converged = self._evaluate(len(self.history), self._get_orbital_data_from_history,
+                                       self._get_static_from_history)
+        converged = mpi.bcast(converged)
+        return converged
+
+    def _evaluate(self, n_loops_available, get_orbital_data, get_static):
         loops, n_omega, lim_absgdiff, lim_slopes, lim_staticslopes, lim_staticsem = self.loops, self.n_omega, self.lim_absgdiff, self.lim_slopes, self.lim_staticslopes, self.lim_staticsem
         converged = False
-        gimp0 = self.storage.load("g_imp_iw")
-        #orbs = [threetuple for threetuple in gimp0.all_indices]
-        orbs = list()
-        for bn, b in gimp0:
-            for i, j in itt.product(*[range(b.data.shape[1])] * 2):
-                orbs.append((bn, i, j))
-        mesh = np.array([w.imag for w in gimp0[orbs[1][0]].mesh])
-        del gimp0
-        meshinds = np.where(mesh >= 0)[0][:n_omega]
-        if self.storage.get_completed_loops() < len(loops):
-            absgdiff = np.empty((len(orbs), len(meshinds)))
-            gloc_loop = self.storage.load("g_loc_iw")
-            gimp_loop = self.storage.load("g_imp_iw")
-            gdiftmp = gloc_loop.copy()
-            gdiftmp << gloc_loop - gimp_loop
-            for (iorb, orb), (iomega, omega) in itt.product(enumerate(orbs), enumerate(meshinds)):
-                b, i, j = orb[0], int(orb[1]), int(orb[2])
-                absgdiff[iorb, iomega] = np.absolute(gdiftmp[b].data[omega, i, j]) / np.max(
-                    (np.absolute(gimp_loop[b].data[omega, i, j]), np.absolute(gloc_loop[b].data[omega, i, j])))
-            if (absgdiff[:, :] < lim_absgdiff).all():
+        if n_loops_available < len(loops):
+            gloc, gimp = get_orbital_data([-1])
+            absgdiff = np.absolute(gloc - gimp) / np.maximum(np.absolute(gimp), np.absolute(gloc))
+            if (absgdiff < lim_absgdiff).all() or self._is_noise_limited(gloc, gimp):
                 converged = True
             if self.verbose and mpi.is_master_node():
                 print 'Convergence-Criterion:'
-                print 'absgdiff <', lim_absgdiff, ':', (absgdiff[:, :] < lim_absgdiff).all(), absgdiff[:, :].max()
+                print 'absgdiff <', lim_absgdiff, ':', (absgdiff < lim_absgdiff).all(), absgdiff.max()
         else:
-            gdiff = np.empty(
-                (len(orbs), len(meshinds), len(loops)), dtype=complex)
-            gimp = np.empty((len(orbs), len(meshinds), len(loops)))
-            gimpstatic = np.empty((len(orbs), len(loops)))
-            absgdiff = np.empty((len(orbs), len(meshinds), len(loops)))
-            for iloop, loop in enumerate(loops):
-                gloc_loop = self.storage.load("g_loc_iw", loop)
-                gimp_loop = self.storage.load("g_imp_iw", loop)
-                gdiftmp = gloc_loop.copy()
-                gdiftmp << gloc_loop - gimp_loop
-                for (iorb, orb), (iomega, omega) in itt.product(enumerate(orbs), enumerate(meshinds)):
-                    b, i, j = orb[0], int(orb[1]), int(orb[2])
-                    gdiff[iorb, iomega, iloop] = gdiftmp[b].data[omega, i, j] / np.max((np.absolute(
-                        gimp_loop[b].data[omega, i, j]), np.absolute(gloc_loop[b].data[omega, i, j])))
-                    gimp[iorb, iomega, iloop] = np.absolute(
-                        gimp_loop[b].data[omega, i, j])
-                    if iomega == 0:
-                        gimpstatic[iorb, iloop] = np.absolute(
-                            gimp_loop[b][i, j].density())
-            absgdiff = np.absolute(gdiff)
-            gdiffslopes = np.array([[linregress(loops, absgdiff[iorb, iomega, :])[
-                                   0] for iomega in range(len(meshinds))] for iorb in range(len(orbs))])
-            gimpslopes = np.array([[linregress(loops, gimp[iorb, iomega, :])[
-                                  0] for iomega in range(len(meshinds))] for iorb in range(len(orbs))])
-            gimpstaticslopes = np.array([linregress(loops, gimpstatic[iorb, :])[
-                                        0] for iorb in range(len(orbs))])
-            gimpstaticsem = np.array([sem(gimpstatic[iorb, :])
-                                      for iorb in range(len(orbs))])
-            if (absgdiff[:, :, -1] < lim_absgdiff).all() or ((np.abs(gdiffslopes) < lim_slopes).all() and (np.abs(gimpslopes) < lim_slopes).all() and (np.abs(gimpstaticslopes) < lim_staticslopes).all() and (gimpstaticsem < lim_staticsem).all()):
+            gloc, gimp = get_orbital_data(loops)
+            absgdiff = np.absolute(gloc - gimp) / np.maximum(np.absolute(gimp), np.absolute(gloc))
+            gimpstatic = np.absolute(get_static(loops))
+            gdiffslopes = get_slopes(loops, absgdiff)
+            gimpslopes = get_slopes(loops, np.absolute(gimp))
+            gimpstaticslopes = get_slopes(loops, gimpstatic)
+            gimpstaticsem = np.std(gimpstatic, axis=0, ddof=1) / np.sqrt(len(loops))
+            if (absgdiff[-1] < lim_absgdiff).all() or self._is_noise_limited(gloc, gimp) or ((np.abs(gdiffslopes) < lim_slopes).all() and (np.abs(gimpslopes) < lim_slopes).all() and (np.abs(gimpstaticslopes) < lim_staticslopes).all() and (gimpstaticsem < lim_staticsem).all()):
                 converged = True
             if self.verbose and mpi.is_master_node():
                 print 'Convergence-Criterion:'
-                print 'absgdiff <', lim_absgdiff, ':', (absgdiff[:, :, -1] < lim_absgdiff).all(), absgdiff[:, :, -1].max()
+                print 'absgdiff <', lim_absgdiff, ':', (absgdiff[-1] < lim_absgdiff).all(), absgdiff[-1].max()
                 print 'gdiffslopes <', lim_slopes, ':', (np.abs(gdiffslopes) < lim_slopes).all(), np.abs(gdiffslopes).max()
                 print 'gimpslopes <', lim_slopes, ':', (np.abs(gimpslopes) < lim_slopes).all(), np.abs(gimpslopes).max()
                 print 'gimpstaticslopes <', lim_staticslopes, ':', (np.abs(gimpstaticslopes) < lim_staticslopes).all(), np.abs(gimpstaticslopes).max()
                 print 'gimpstaticsem <', lim_staticsem, ':', (gimpstaticsem < lim_staticsem).all(), gimpstaticsem.max()
         return converged
+
+    def _is_noise_limited(self, gloc, gimp):
+        """
+        whether g_loc - g_imp of the last loop and the rms of the changes of g_imp between the
+        loops are consistent with the Monte Carlo error
+        """
+        if self.noise_factor is None or self.history is None:
+            return False
+        error = self.history.latest("g_imp_iw_error")
+        if error is None:
+            return False
+        limit = self.noise_factor * np.sqrt(2) * error[:self.n_omega]
+        noise_limited = (np.absolute(gloc[-1] - gimp[-1]) <= limit).all()
+        if len(gimp) > 1:
+            changes = np.sqrt(np.mean(np.absolute(np.diff(gimp, axis=0))**2, axis=0))
+            noise_limited = noise_limited and (changes <= limit).all()
+        if self.verbose and mpi.is_master_node():
+            print 'noise limited, factor', self.noise_factor, ':', noise_limited
+        return noise_limited
+
+    def _load_orbital_data(self, loops):
+        """
+        g_loc and g_imp of the first n_omega positive Matsubara frequencies as arrays with the
+        axes loop, frequency, orbital (block, i, j)
+        """
+        return [load_orbital_data(self.storage, name, loops, self._get_block_names(), self.n_omega)
+                for name in ["g_loc_iw", "g_imp_iw"]]
+
+    def _load_static(self, loops):
+        return load_static(self.storage, loops, self._get_orbitals())
+
+    def _get_orbital_data_from_history(self, loops):
+        return [self.history.get(name, loops)[:, :self.n_omega] for name in ["g_loc_iw", "g_imp_iw"]]
+
+    def _get_static_from_history(self, loops):
+        return self.history.get("g_imp_static", loops)
+
+    def _get_block_names(self):
+        if self._block_names is None:
+            self._block_names = self.storage.load_block_names("g_imp_iw")
+        return self._block_names
+
+    def _get_orbitals(self):
+        if self._orbitals is None:
+            self._orbitals = load_orbitals(self.storage, self._get_block_names())
+        return self._orbitals
+
+
+class LoopHistory:
+    """
+    ring buffer of the arrays of the last size loops that are needed while running, e.g. by
+    the convergence criteria, such that they aren't read from the archive in every loop.
+    Quantities in latest_only are kept for the last loop only.
+    """
+
+    def __init__(self, size=8, latest_only=[]):
+        self.size = size
+        self.latest_only = latest_only
+        self.entries = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def resize(self, size):
+        if size != self.size:
+            self.size = size
+            self.entries = deque(self.entries, maxlen=size)
+
+    def append(self, **quantities):
+        if len(self.entries) > 0:
+            for name in self.latest_only:
+                self.entries[-1].pop(name, None)
+        self.entries.append(quantities)
+
+    def get(self, name, loops):
+        """
+        the quantity of the loops as array with the loops as first axis, loops count backwards
+        from the last loop, i.e. are negative
+        """
+        return np.array([self.entries[loop][name] for loop in loops])
+
+    def latest(self, name):
+        """
+        the quantity of the last loop, None if it has none
+        """
+        if len(self.entries) == 0:
+            return None
+        return self.entries[-1].get(name)
+
+    def drop(self, name):
+        for entry in self.entries:
+            entry.pop(name, None)
+
+    def seed(self, storage, n_omega):
+        """
+        fills the history with g_loc_iw, g_imp_iw and g_imp_static of the last loops of storage,
+        e.g. on restart. Only the master node reads them, it evaluates the criteria.
+        """
+        self.entries.clear()
+        n_loops = min(storage.get_completed_loops(), self.size)
+        if n_loops == 0:
+            return
+        block_names = storage.load_block_names("g_imp_iw")
+        if not mpi.is_master_node():
+            return
+        loops = range(-n_loops, 0)
+        gloc, gimp = [load_orbital_data(storage, name, loops, block_names, n_omega, bcast=False)
+                      for name in ["g_loc_iw", "g_imp_iw"]]
+        static = load_static(storage, loops, load_orbitals(storage, block_names, bcast=False), bcast=False)
+        for i in range(n_loops):
+            self.entries.append({"g_loc_iw": gloc[i], "g_imp_iw": gimp[i], "g_imp_static": static[i]})
+
+
+def get_orbital_data(g):
+    """
+    the positive Matsubara frequencies of a BlockGf as array with the axes frequency, orbital
+    (block, i, j), in the order of load_orbital_data
+    """
+    return np.concatenate([b.data[b.data.shape[0] // 2:].reshape(b.data.shape[0] - b.data.shape[0] // 2, -1)
+                           for bn, b in g], axis=1)
+
+
+def get_static(g):
+    """
+    the static elements of a BlockGf as array in the order of get_orbital_data
+    """
+    return np.array([b[i, j].density() for bn, b in g
+                     for i, j in itt.product(range(b.data.shape[1]), range(b.data.shape[1]))])
+
+
+def load_orbital_data(storage, quantity_name, loops, block_names, n_omega, bcast=True):
+    """
+    the first n_omega positive Matsubara frequencies of a stored BlockGf as array with the axes
+    loop, frequency, orbital (block, i, j)
+    """
+    blocks = [storage.load_slice(quantity_name, loops, bn, frequency_range=(0, n_omega), bcast=bcast)
+              for bn in block_names]
+    if blocks[0] is None:
+        return None
+    return np.concatenate([b.reshape(b.shape[:2] + (-1,)) for b in blocks], axis=2)
+
+
+def load_static(storage, loops, orbitals, bcast=True):
+    """
+    the static elements of g_imp with the axes loop, orbital, from the loop summary if it
+    has them for all loops
+    """
+    labels = [bn+'_'+str(i)+str(j) for bn, i, j in orbitals]
+    summary = storage.load_summary(bcast)
+    if summary is not None and "g_imp_static" in summary:
+        columns = [summary["g_imp_static_labels"].index(label) for label in labels]
+        static = summary["g_imp_static"][loops][:, columns]
+        if not np.isnan(static).any():
+            return static
+    static = []
+    for loop in loops:
+        gimp_loop = storage.load("g_imp_iw", loop, bcast)
+        if gimp_loop is None:
+            return None
+        static.append([gimp_loop[bn][i, j].density() for bn, i, j in orbitals])
+    return np.array(static)
+
+
+def load_orbitals(storage, block_names, bcast=True):
+    """
+    (block, i, j) of the stored g_imp_iw in the order of the orbital axis of load_orbital_data
+    """
+    orbitals = []
+    for bn in block_names:
+        n_orbs = storage.load_slice("g_imp_iw", [-1], bn, frequency_range=(0, 1), bcast=bcast).shape[-1]
+        orbitals += [(bn, i, j) for i, j in itt.product(range(n_orbs), range(n_orbs))]
+    return orbitals
+
+
+def get_slopes(x, y):
+    """
+    least squares slopes of y along its first axis over x, for all other axes at once
+    """
+    x = np.array(x, dtype=float)
+    x = x - x.mean()
+    x = x.reshape((len(x),) + (1,) * (y.ndim - 1))
+    return np.sum(x * (y - y.mean(axis=0)), axis=0) / np.sum(x**2)
@@ -1,52 +1,172 @@
+import os
+import hashlib
 import numpy as np
 import itertools as itt
-from scipy.linalg import logm
+from collections import OrderedDict
+from scipy import sparse
+from scipy.linalg import eigvalsh
 from pytriqs.atom_diag import AtomDiag, atomic_density_matrix
 from pytriqs.gf import BlockGf, GfImTime
+from pytriqs.utility import mpi
+from mpi4py import MPI
+
+from cdmft import mpiarrays
+from cdmft.h5interface import Storage
 
 
 class Evaluation:
+    """
+    the last memo_size objects loaded from the archive, e.g. (quantity, loop), and derived
+    results like the atomic density matrix are kept in memory, the least recently used are
+    dropped. Loaded objects are shared between the methods and must not be modified, loaded
+    numpy arrays and the results of series are shared read-only by the ranks of a node. The number
+    of loops is read at initialization, call refresh if the archive has grown since.
+    """
 
-    def __init__(self, archive):
+    def __init__(self, archive, memo_size=32):
         self.archive = archive
         self.n_loops = self.archive.get_completed_loops()
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+
+    def refresh(self):
+        self.n_loops = self.archive.get_completed_loops()
+        self._memo = OrderedDict()
+
+    def _memoize(self, key, function, *args):
+        if key in self._memo:
+            value = self._memo.pop(key)
+        else:
+            value = function(*args)
+        self._memo[key] = value
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return value
+
+    def _loop(self, loop):
+        return self.n_loops + loop if loop < 0 else loop
+
+    def _load(self, quantity_name, loop, bcast=True):
+        loop = self._loop(loop)
+        return self._memoize((quantity_name, loop, bcast), self.archive.load, quantity_name, loop, bcast, bcast)
+
+    def get_beta(self, loop=-1):
+        """
+        read from the mesh of g_loc_iw, the Green's function itself is not loaded
+        """
+        loop = self._loop(loop)
+        return self._memoize(("beta", loop), self.archive.load_beta, "g_loc_iw", loop)
+
+    def get_h_loc_diagonalization(self, loop=-1):
+        """
+        the AtomDiag of the local Hamiltonian, loaded on the master only
+        """
+        return self._load("h_loc_diagonalization", loop, False)
+
+    def get_density_matrix_blocks(self, loop=-1):
+        """
+        the impurity density matrix blocked like get_h_loc_diagonalization, loaded on the master
+        only
+        """
+        return self._load("density_matrix", loop, False)
+
+    def get_atomic_density_matrix_blocks(self, loop=-1, beta=None):
+        """
+        the density matrix of the isolated impurity at beta, computed on the master only. The
+        default beta of the loop is broadcast, i.e. without beta all ranks have to call it
+        """
+        loop = self._loop(loop)
+        if beta is None:
+            beta = self.get_beta(loop)
+        rho = None
+        if mpi.is_master_node():
+            atom = self.get_h_loc_diagonalization(loop)
+            rho = self._memoize(("atomic_density_matrix", loop, beta), atomic_density_matrix, atom, beta)
+        return rho
+
+    def series(self, quantity_name, reducer, loops=None, cache_dir=None):
+        """
+        reducer(quantity) for every loop in loops (default: all), stacked along the first axis
+        the loops are split over the MPI ranks, each reads its loops with its own read-only
+        Storage, see reduce_loops. With cache_dir the result is stored there keyed by the
+        modification time of the archive, quantity_name, reducer and loops.
+        """
+        if loops is None:
+            loops = range(self.n_loops)
+        loops = [self._loop(loop) for loop in loops]
+        values = None
+        cache_file = None
+        if mpi.is_master_node() and cache_dir is not None:
+            cache_file = self._get_series_cache_file(cache_dir, quantity_name, reducer, loops)
+            if os.path.isfile(cache_file):
+                values = np.load(cache_file)
+        if not mpi.bcast(values is not None):
+            archive = Storage(self.archive.file_name, read_only=True)
+            values = reduce_loops(lambda loop: archive.load_on_rank(quantity_name, loop), reducer, loops)
+            if cache_file is not None:
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir)
+                np.save(cache_file, values)
+        values = mpiarrays.bcast(values, shared=True)
+        return values
+
+    def _get_series_cache_file(self, cache_dir, quantity_name, reducer, loops):
+        file_name = os.path.abspath(self.archive.file_name)
+        key = repr((file_name, os.path.getmtime(file_name), quantity_name,
+                    reducer.__module__, reducer.__name__, list(loops)))
+        return os.path.join(cache_dir, hashlib.sha1(key).hexdigest()+".npy")
 
     def get_sign_loop(self):
-        signs = np.empty([self.n_loops]*2)
-        for i in range(self.n_loops):
-            signs[i, 0] = i
-            signs[i, 1] = self.archive.load("average_sign", i)
+        signs = np.empty([self.n_loops, 2])
+        signs[:, 0] = range(self.n_loops)
+        signs[:, 1] = self.series("average_sign", np.real)
         return signs
 
+    def get_summary(self):
+        """
+        the scalars of all loops as dict of arrays, see Storage.load_summary
+        loops without summary row, e.g. of archives written before the summary existed, are read
+        loop by loop
+        """
+        summary = self._memoize("summary", self.archive.load_summary)
+        summary = {"loop": np.arange(self.n_loops)} if summary is None else dict(summary)
+        for name in ["mu", "density", "density0", "average_sign", "loop_time"]:
+            values = summary.get(name)
+            if values is None:
+                values = np.full(self.n_loops, np.nan)
+            missing = np.isnan(values)
+            if missing.any():
+                values = list(values)
+                for i in np.argwhere(missing)[:, 0]:
+                    value = self._load(name, i)
+                    if isinstance(value, dict):
+                        value = value.values()[0][0, 0]
+                    values[i] = np.nan if value is None else value
+            summary[name] = np.array(values)
+        return summary
+
     def get_density(self, loop=-1):
-        return self.archive.load("density", loop)
+        return self._load("density", loop)
 
     def get_density_matrix(self, loop=-1):
-        rhoblocked = self.archive.load("density_matrix", loop, bcast=False)
-        atom = self.archive.load("h_loc_diagonalization", loop, bcast=False)
-        rho = np.zeros([atom.full_hilbert_space_dim]*2)
-        for i_block, block in enumerate(rhoblocked):
-            dim = atom.get_block_dim(i_block)
-            for i, j in itt.product(*[range(dim)]*2):
-                k = atom.flatten_block_index(i_block, i)
-                l = atom.flatten_block_index(i_block, j)
-                rho[k, l] = block[i, j]
-                # if not np.allclose(rho[k,l], 0):
-                #    print k, l, rho[k,l]
-        return rho
+        """
+        sparse matrix on the full Hilbert space, order corresponds to energies of get_energies
+        """
+        rhoblocked = self.get_density_matrix_blocks(loop)
+        atom = self.get_h_loc_diagonalization(loop)
+        return blocks_to_sparse(rhoblocked, atom)
 
     def get_entropy(self, loop=-1):
-        rhoblocked = self.archive.load("density_matrix", loop, bcast=False)
-        s = 0
-        for block in rhoblocked:
-            if np.allclose(block, 0):
-                continue
-            lnrho = logm(block)
-            s -= np.trace(block.dot(lnrho))
-        return s
+        """
+        von Neumann entropy of the impurity density matrix
+        """
+        return von_neumann_entropy(self.get_density_matrix_blocks(loop))
+
+    def get_atomic_entropy(self, loop=-1, beta=None):
+        return von_neumann_entropy(self.get_atomic_density_matrix_blocks(loop, beta))
 
     def get_energies(self, loop=-1):
-        atom = self.archive.load("h_loc_diagonalization", loop, bcast=False)
+        atom = self.get_h_loc_diagonalization(loop)
         energies = []
         for energy_block in atom.energies:
             for i in range(len(energy_block)):
@@ -55,7 +175,7 @@ class Evaluation:
 
     def get_density_matrix_diag(self, loop=-1):
         """order corresponds to energies of get_energies"""
-        rho = self.archive.load("density_matrix", loop, bcast=False)
+        rho = self.get_density_matrix_blocks(loop)
         probabilities = []
         for rho_block in rho:
             for i in range(len(rho_block)):
@@ -64,8 +184,8 @@ class Evaluation:
 
     def get_density_matrix_row(self, row, loop=-1):
         """order corresponds to energies of get_energies"""
-        rhoblocked = self.archive.load("density_matrix", loop, bcast=False)
-        atom = self.archive.load("h_loc_diagonalization", loop, bcast=False)
+        rhoblocked = self.get_density_matrix_blocks(loop)
+        atom = self.get_h_loc_diagonalization(loop)
         rhorow = np.zeros([atom.full_hilbert_space_dim])
         energies = np.zeros([atom.full_hilbert_space_dim])
         for i_block, block in enumerate(rhoblocked):
@@ -82,36 +202,19 @@ class Evaluation:
         return rhorow
 
     def get_atomic_density_matrix(self, loop=-1, beta=None):
-        """order corresponds to energies of get_energies"""
-        atom = self.archive.load("h_loc_diagonalization", loop, bcast=False)
-        if beta is None:
-            g = self.archive.load("g_loc_iw", loop)
-            beta = g.mesh.beta
-        rhoblocked = atomic_density_matrix(atom, beta)
-        rho = np.zeros([atom.full_hilbert_space_dim]*2)
-        for i_block, block in enumerate(rhoblocked):
-            dim = atom.get_block_dim(i_block)
-            for i, j in itt.product(*[range(dim)]*2):
-                k = atom.flatten_block_index(i_block, i)
-                l = atom.flatten_block_index(i_block, j)
-                rho[k, l] = block[i, j]
-        return rho
+        """
+        sparse matrix on the full Hilbert space, order corresponds to energies of get_energies
+        """
+        atom = self.get_h_loc_diagonalization(loop)
+        return blocks_to_sparse(self._get_atomic_density_matrix_blocks(loop, beta), atom)
 
     def get_atomic_blocksizes(self, loop=-1, beta=None):
-        atom = self.archive.load("h_loc_diagonalization", loop, bcast=False)
-        if beta is None:
-            g = self.archive.load("g_loc_iw", loop)
-            beta = g.mesh.beta
-        rhoblocked = atomic_density_matrix(atom, beta)
+        rhoblocked = self._get_atomic_density_matrix_blocks(loop, beta)
         return np.array([len(r) for r in rhoblocked])
 
     def get_atomic_density_matrix_diag(self, loop=-1, beta=None):
         """order corresponds to energies of get_energies"""
-        atom = self.archive.load("h_loc_diagonalization", loop, bcast=False)
-        if beta is None:
-            g = self.archive.load("g_loc_iw", loop)
-            beta = g.mesh.beta
-        rho = atomic_density_matrix(atom, beta)
+        rho = self._get_atomic_density_matrix_blocks(loop, beta)
         probabilities = []
         for rho_block in rho:
             for i in range(len(rho_block)):
@@ -119,7 +222,12 @@ class Evaluation:
         return np.array(probabilities)
 
     def get_g_static_diags(self, loop=-1):
-        g = self.archive.load("g_imp_iw", loop)
+        summary = self._memoize("summary", self.archive.load_summary)
+        if summary is not None and "occupations" in summary.keys():
+            occupations = summary["occupations"][loop]
+            if not np.isnan(occupations).any():
+                return dict(zip(summary["occupations_labels"], occupations))
+        g = self._load("g_imp_iw", loop)
         """
         gf_struct = []
         for s, b in g:
@@ -139,7 +247,7 @@ class Evaluation:
         return gsd
 
     def get_g_static(self, loop=-1):
-        g = self.archive.load("g_imp_iw", loop)
+        g = self._load("g_imp_iw", loop)
         inds = [i for i in g.all_indices]
         gsd = {}
         for ind in inds:
@@ -150,14 +258,14 @@ class Evaluation:
         return gsd
 
     def get_g_static_blockdiags(self, loop=-1):
-        g = self.archive.load("g_imp_iw", loop)
+        g = self._load("g_imp_iw", loop)
         gsd = {}
         for bn, b in g:
             gsd[bn] = b.total_density().real
         return gsd
 
     def get_quasiparticle_residue(self, n_freq, block='up', index=(0, 0)):
-        sigma = self.archive.load("se_imp_iw")
+        sigma = self._load("se_imp_iw", -1)
         mesh = np.array([w.imag for w in sigma.mesh])
         for n, w in enumerate(mesh):
             if w > 0:
@@ -176,3 +284,52 @@ class Evaluation:
         der = np.array([(deg - n - 1) * polynomial_coefficients[n]
                         for n in range(deg - 1)])
         return der
+
+
+def blocks_to_sparse(blocks, atom):
+    """
+    block diagonal scipy.sparse matrix on the full Hilbert space of an AtomDiag, blocks is a
+    list of matrices per invariant subspace like the density matrix of the solver. The states
+    of a subspace are consecutive in the flattened index.
+    """
+    dim = atom.full_hilbert_space_dim
+    rows, cols, values = [], [], []
+    for i_block, block in enumerate(blocks):
+        block = np.asarray(block)
+        indices = atom.flatten_block_index(i_block, 0) + np.arange(block.shape[0])
+        rows.append(np.repeat(indices, block.shape[0]))
+        cols.append(np.tile(indices, block.shape[0]))
+        values.append(block.ravel())
+    if len(values) == 0:
+        return sparse.csr_matrix((dim, dim))
+    return sparse.coo_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(dim, dim)).tocsr()
+
+
+def von_neumann_entropy(blocks, eps=1e-14):
+    """
+    -tr(rho ln rho) from the eigenvalues of the hermitian blocks of a block diagonal rho,
+    eigenvalues below eps are dropped
+    """
+    s = 0
+    for block in blocks:
+        if len(block) == 0:
+            continue
+        p = eigvalsh(block)
+        p = p[p > eps]
+        s -= np.sum(p * np.log(p))
+    return s
+
+
+def reduce_loops(load, reducer, loops, comm=None):
+    """
+    reducer(load(loop)) for every loop, the loops are dealt out to the ranks of comm (default
+    MPI.COMM_WORLD) and the results are gathered. Returns the stacked results on rank 0 and
+    None on the other ranks.
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    values = comm.gather([reducer(load(loop)) for loop in loops[comm.rank::comm.size]], root=0)
+    if comm.rank != 0:
+        return None
+    return np.array([values[i % comm.size][i // comm.size] for i in range(len(loops))])
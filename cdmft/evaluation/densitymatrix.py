@@ -1,27 +1,137 @@
 import numpy as np
-from pytriqs.atom_diag import AtomDiag, trace_rho_op, act, atomic_density_matrix
+from pytriqs.atom_diag import AtomDiag, trace_rho_op, atomic_density_matrix
 from pytriqs.operators import c as C, c_dag as CDag, n as N
+from pytriqs.utility import mpi
+
+from cdmft.evaluation.common import Evaluation
 
 
 class StaticObservable:
 
     def __init__(self, operator, storage, loop=-1, atomic=False):
-        self.operator = operator
-        self.atom = storage.load("h_loc_diagonalization", loop, bcast=False)
-        if atomic:
-            g = storage.load("g_loc_iw", loop)
-            self.rho = atomic_density_matrix(self.atom, g.mesh.beta)
-            del g
-        else:
-            self.rho = storage.load("density_matrix")
+        self.observables = StaticObservables([operator], storage, [loop], atomic)
+        self.loop = loop
 
     def get_expectation_value(self):
-        return trace_rho_op(self.rho, self.operator, self.atom)
+        return self.observables.get_expectation_values()[0, 0]
 
     def get_expectation_value_statewise(self):
-        evs = []
-        for i in range(self.atom.full_hilbert_space_dim):
-            state = np.zeros([self.atom.full_hilbert_space_dim])
-            state[i] = 1
-            evs.append(state.dot(act(self.operator, state, self.atom)))
-        return evs
+        return self.observables.get_expectation_values_statewise(self.loop)[0]
+
+
+class StaticObservables:
+    """
+    expectation values of many operators for many loops. The atom diagonalization and the
+    density matrix of each loop are loaded once, every operator is transformed once per atom
+    diagonalization into block matrices in its eigenbasis, consecutive loops with the same
+    local Hamiltonian share them.
+    atomic: uses the atomic density matrix at beta (default: beta of the loop)
+    """
+
+    def __init__(self, operators, storage, loops=[-1], atomic=False, beta=None):
+        self.operators = operators
+        self.loops = loops
+        self.atomic = atomic
+        self.beta = beta
+        self.evaluation = Evaluation(storage)
+        self._atom = None
+        self._operator_blocks = None
+
+    def get_expectation_values(self):
+        """
+        array of tr(rho O) with the axes loops, operators
+        """
+        values = None
+        betas = [self._get_beta(loop) for loop in self.loops]
+        if mpi.is_master_node():
+            values = np.empty((len(self.loops), len(self.operators)), dtype=complex)
+            for i_loop, loop in enumerate(self.loops):
+                rho = self._get_density_matrix_blocks(loop, betas[i_loop])
+                for i_op, operator_blocks in enumerate(self._get_operator_blocks(loop)):
+                    values[i_loop, i_op] = np.sum([np.sum(r * o.T) for r, o in zip(rho, operator_blocks)])
+        values = mpi.bcast(values)
+        return values
+
+    def get_expectation_values_statewise(self, loop=-1):
+        """
+        array of the diagonal elements of the operators in the eigenbasis with the axes
+        operators, states. The order of the states corresponds to Evaluation.get_energies
+        """
+        values = None
+        if mpi.is_master_node():
+            values = np.array([np.concatenate([np.diag(o) for o in operator_blocks]).real
+                               for operator_blocks in self._get_operator_blocks(loop)])
+        values = mpi.bcast(values)
+        return values
+
+    def _get_beta(self, loop):
+        """
+        the beta of the atomic density matrix, reading it from the archive is collective
+        """
+        if self.atomic and self.beta is None:
+            return self.evaluation.get_beta(loop)
+        return self.beta
+
+    def _get_density_matrix_blocks(self, loop, beta):
+        if self.atomic:
+            return self.evaluation.get_atomic_density_matrix_blocks(loop, beta)
+        return self.evaluation.get_density_matrix_blocks(loop)
+
+    def _get_operator_blocks(self, loop):
+        atom = self.evaluation.get_h_loc_diagonalization(loop)
+        if self._atom is None or not is_same_diagonalization(self._atom, atom):
+            self._atom = atom
+            self._operator_blocks = [get_operator_blocks(op, atom) for op in self.operators]
+        return self._operator_blocks
+
+
+def get_operator_blocks(operator, atom):
+    """
+    the blocks of operator in the eigenbasis of atom that belong to its invariant subspaces,
+    i.e. all that tr(rho O) needs. They are assembled from the matrices of c and c_dag between
+    the subspaces that atom holds, the full Hilbert space is never used.
+    """
+    linear_indices = dict([(tuple(index), i) for i, index in enumerate(atom.fops)])
+    blocks = [np.zeros((atom.get_block_dim(i_block), atom.get_block_dim(i_block)), dtype=complex)
+              for i_block in range(atom.n_subspaces)]
+    for monomial, coefficient in operator:
+        for i_block, block in enumerate(blocks):
+            matrix = get_monomial_matrix(monomial, i_block, atom, linear_indices)
+            if matrix is not None:
+                block += coefficient * matrix
+    return blocks
+
+
+def get_monomial_matrix(monomial, i_block, atom, linear_indices):
+    """
+    the matrix of a product of c and c_dag on the subspace i_block of atom, None if the product
+    doesn't map the subspace onto itself
+    """
+    matrix = np.identity(atom.get_block_dim(i_block))
+    j_block = i_block
+    for dagger, index in reversed(monomial):
+        i_op = linear_indices[tuple(index)]
+        connection, op_matrix = (atom.cdag_connection, atom.cdag_matrix) if dagger else (atom.c_connection, atom.c_matrix)
+        k_block = connection(i_op, j_block)
+        if k_block == -1:
+            return None
+        matrix = np.dot(op_matrix(i_op, j_block), matrix)
+        j_block = k_block
+    if j_block != i_block:
+        return None
+    return matrix
+
+
+def is_same_diagonalization(atom1, atom2):
+    if atom1 is atom2:
+        return True
+    if atom1.full_hilbert_space_dim != atom2.full_hilbert_space_dim or atom1.n_subspaces != atom2.n_subspaces:
+        return False
+    for e1, e2 in zip(atom1.energies, atom2.energies):
+        if len(e1) != len(e2) or not np.allclose(e1, e2):
+            return False
+    if hasattr(atom1, "unitary_matrices"):
+        for u1, u2 in zip(atom1.unitary_matrices, atom2.unitary_matrices):
+            if not np.allclose(u1, u2):
+                return False
+    return True
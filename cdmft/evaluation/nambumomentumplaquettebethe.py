@@ -6,10 +6,6 @@ from cdmft.evaluation.common import Evaluation as CommonEvaluation
 
 
 class Evaluation(CommonEvaluation):
-    def __init__(self, archive):
-        self.archive = archive
-        self.n_loops = self.archive.get_completed_loops()
-
     def get_scorder(self, loop=-1):
         g = self.get_g_imp_tau(loop)
         scos = np.array([-g["X"].data[-1, 0, 1].real,
@@ -35,7 +31,7 @@ class Evaluation(CommonEvaluation):
         return np.array([[i, np.mean(scoset_loop[i, :]), np.std(scoset_loop[i, :], ddof=1)] for i in range(self.n_loops)])
 
     def get_g_imp_tau(self, loop=-1):
-        giw = self.archive.load("g_imp_iw", loop)
+        giw = self._load("g_imp_iw", loop)
         g_imp_tau = BlockGf(name_block_generator=[(s, GfImTime(
             beta=giw.mesh.beta, n_points=10001, indices=[i for i in b.indices])) for s, b in giw], make_copies=False)
         for s, b in giw:
@@ -1,4 +1,4 @@
-from cdmft.storage import LoopStorage
+from cdmft.h5interface import Storage
 import matplotlib
 import sys
 import numpy as np
@@ -19,22 +19,19 @@ arg_max = int(sys.argv[9])
 part = sys.argv[10]
 assert part in ["real", "imag"], "only real or imag available"
 
-archive = LoopStorage(archive_name)
+archive = Storage(archive_name)
 fig = plt.figure()
 ax = fig.add_axes([.12, .12, .85, .85])
-for loop_nr in range(first_loop, last_loop + 1):
-    f = archive.load(function, loop_nr)
-    if loop_nr == first_loop:
-        mesh = np.array([xi for xi in f.mesh]).imag
-        arg_min += int(len(mesh) * .5)
-        arg_max += int(len(mesh) * .5)
-        x = np.array(mesh)[arg_min: arg_max]
+loops = range(first_loop, last_loop + 1)
+x = archive.load_matsubara_frequencies(function, block, first_loop, (arg_min, arg_max))
+fs = archive.load_slice(function, loops, block, (ind1, ind2), (arg_min, arg_max))
+for loop_nr, f in zip(loops, fs):
     if part == "imag":
-        y = f[block].data[arg_min: arg_max, ind1, ind2].imag
+        y = f.imag
     elif part == "real":
-        y = f[block].data[arg_min: arg_max, ind1, ind2].real
+        y = f.real
     ax.plot(x, y, label=loop_nr)
-ax.set_xlim(mesh[arg_min], mesh[arg_max])
+ax.set_xlim(x[0], x[-1])
 ax.legend(title="loop")
 plt.savefig(archive_name[:-3] + ".pdf")
 plt.close()
@@ -113,13 +113,20 @@ class MatsubaraGreensFunction(BlockGf):
     def prepare_mix(self):
         self._gf_lastloop = self.copy()
 
-    def mix(self, coeff):
+    def mix(self, coeff, last_loop=None):
         """
         mixes with the solution of the previous loop, coeff is the weight of the new state
+        last_loop: the data arrays of the blocks of the previous loop, default is the state
+        of prepare_mix
         """
-        if not coeff is None:
+        if coeff is None:
+            return
+        if last_loop is None:
             self << coeff * self + (1 - coeff) * self._gf_lastloop
             self._gf_lastloop << self
+        else:
+            for (bn, b), data in zip(self, last_loop):
+                b.data[:, :, :] = coeff * b.data + (1 - coeff) * data
 
     def symmetrize(self, block_symmetries):
         """
@@ -1,10 +1,17 @@
 import os
+import h5py
+import numpy as np
+from collections import OrderedDict
 from pytriqs.archive import HDFArchive
 from pytriqs.operators import Operator
 from pytriqs.atom_diag import AtomDiag
-from pytriqs.gf import BlockGf
+from pytriqs.gf import BlockGf, GfImFreq, MeshImFreq, inverse
 from pytriqs.utility import mpi
 
+import mpiarrays
+from compactgf import compress_blocks, decompress_blocks, is_compact
+from h5reader import read_physical_labels, read_gf_slice, read_gf_mesh_size, read_gf_beta, read_block_names, frequency_window, read_loop_summary, read_summary_rows, decode_strings, file_locking, open_file, retry_reads, follow_loops
+
 
 class Storage:
     """
@@ -13,20 +20,40 @@ class Storage:
     internal functions have a leading underscore, avoid using them explicitly
     """
 
-    def __init__(self, file_name, objects_to_store={}):
+    def __init__(self, file_name, objects_to_store={}, read_only=False, compact_gfs=[], compact_tol=1e-6, compact_n_l_max=120, minimal=False):
+        """
+        read_only: for monitoring and analysis, also of archives that are being written by a
+        running job. Such a Storage never writes and opens the archive without file locks, so
+        that it can't block the writer. It sees committed loops only. The reads are best-effort,
+        load and load_slice are retried if they overlap with a commit, see h5reader.retry_reads
+        compact_gfs: names of BlockGfs on Matsubara meshes that are stored as Legendre
+        coefficients plus the constant high-frequency moment instead of the full mesh. A BlockGf
+        that can't be reconstructed within the relative error compact_tol using at most
+        compact_n_l_max coefficients is stored on the full mesh. load reconstructs the BlockGf.
+        minimal: quantities that the derivation_rules can compute from the other quantities of
+        the loop, e.g. g_imp_iw by Dyson's equation, are not written. load derives them.
+        """
         self.disk = None
         self.dmft_results = None
         self.file_name = file_name
-        if mpi.is_master_node():
+        self.read_only = read_only
+        self.compact_gfs = compact_gfs
+        self.compact_tol = compact_tol
+        self.compact_n_l_max = compact_n_l_max
+        self.minimal = minimal
+        self._derived = OrderedDict()
+        if not read_only and mpi.is_master_node():
             self._open_archive()
             self._close_archive()
         self.memory_container = objects_to_store
 
     def _open_archive(self, read_only=False):
-        assert mpi.is_master_node(), "Only the master node shall access the disk."
+        assert mpi.is_master_node() or (read_only and self.read_only), "Only the master node shall access the disk, other nodes can read read-only Storages."
         assert not self._archive_is_open(), "Archive has already been opened."
+        assert read_only or not self.read_only, "Storage has been opened read-only."
         if read_only:
-            self.disk = HDFArchive(self.file_name, 'r')
+            with file_locking(not self.read_only):
+                self.disk = HDFArchive(self.file_name, 'r')
         else:
             self.disk = HDFArchive(self.file_name, 'a')
             if not self.disk.is_group("dmft_results"):
@@ -34,23 +61,46 @@ class Storage:
                 self.disk["dmft_results"]["n_dmft_loops"] = 0
         self.dmft_results = self.disk["dmft_results"]
 
+    def _open_file(self):
+        """
+        the archive opened read-only with h5py
+        """
+        return open_file(self.file_name, not self.read_only)
+
+    def _read(self, read, *args):
+        if self.read_only:
+            return retry_reads(read, args)
+        return read(*args)
+
     def _close_archive(self):
         del self.dmft_results
         self.dmft_results = None
         del self.disk
         self.disk = None
 
-    def save_loop(self, objects_to_store={}, *args):
-        """args can be an arbitrary number of dicts"""
+    def save_loop(self, objects_to_store={}, *args, **kwargs):
+        """
+        args can be an arbitrary number of dicts
+        all scalars of the loop and the optional kwarg summary, a dict of scalars or of dicts
+        of labeled scalars, are appended as a row to the loop summary
+        """
         for arg in args:
             objects_to_store.update(arg)
+        summary = dict([(name, obj) for name, obj in objects_to_store.items()
+                        if isinstance(obj, (int, float, complex, np.number))])
+        summary.update(kwargs.get('summary', {}))
         self.memory_container.update(objects_to_store)
-        new_loop_nr = self.get_completed_loops()
+        self._derived.clear()
         if mpi.is_master_node():
+            derivable = self._get_derivable() if self.minimal else []
             self._open_archive()
-            self.dmft_results.create_group(str(new_loop_nr))
-            place_to_store = self.dmft_results[str(new_loop_nr)]
+            if self.dmft_results.is_group("staging"):
+                del self.dmft_results["staging"]
+            self.dmft_results.create_group("staging")
+            place_to_store = self.dmft_results["staging"]
             for name, obj in self.memory_container.items():
+                if name in derivable:
+                    continue
                 if isinstance(obj, dict):
                     place_to_store.create_group(name)
                     for dname, dobj in obj.items():
@@ -59,13 +109,98 @@ class Storage:
                         except TypeError:
                             print "warning: TypeError while writing dict", dname, "of type", type(dobj), "to archive, skipping this one"
                 elif not obj is None:
+                    if name in self.compact_gfs:
+                        obj = self._compact(obj)
                     try:
                         place_to_store[name] = obj
                     except TypeError:
                         if mpi.is_master_node():
                             print "warning: TypeError while writing", name, "of type", type(obj), "to archive, skipping this one"
-            self.dmft_results["n_dmft_loops"] += 1
             self._close_archive()
+            self._commit_staged_loop(summary)
+
+    def _get_derivable(self):
+        """
+        the quantities of memory_container that derivation_rules can compute from the others
+        """
+        stored = set([name for name, obj in self.memory_container.items() if obj is not None])
+        derivable = []
+        for name in derivation_rules.keys():
+            if name in stored and is_derivable(name, stored - set([name])):
+                stored.remove(name)
+                derivable.append(name)
+        return derivable
+
+    def _compact(self, gf):
+        """
+        the compact representation of gf if it is accurate enough, gf otherwise
+        """
+        if not isinstance(gf, BlockGf) or not isinstance(gf.mesh, MeshImFreq):
+            return gf
+        block_names = [bn for bn, b in gf]
+        compact = compress_blocks(block_names, [b.data for bn, b in gf], gf.mesh.beta,
+                                  self.compact_n_l_max, self.compact_tol)
+        if compact is None:
+            return gf
+        return compact
+
+    def _expand(self, compact):
+        block_names, block_data = decompress_blocks(compact)
+        n_iw = block_data[0].shape[0] // 2
+        gf = BlockGf(name_list=block_names, block_list=[GfImFreq(
+            indices=range(data.shape[1]), beta=compact["beta"], n_points=n_iw) for data in block_data])
+        for bn, data in zip(block_names, block_data):
+            gf[bn].data[:, :, :] = data
+        return gf
+
+    def _commit_staged_loop(self, summary):
+        """
+        the loop is written into the group staging first, then it is moved to its label and
+        finally n_dmft_loops is increased, a loop counts as saved only after this last step
+        """
+        with h5py.File(self.file_name, 'a') as disk:
+            results = disk["dmft_results"]
+            loop_index = [int(label) for label in read_physical_labels(
+                results, range(int(results["n_dmft_loops"][()])))]
+            new_label = new_physical_label(results)
+            append_summary_row(disk, new_label, summary)
+            results.move("staging", str(new_label))
+            write_loop_index(results, loop_index + [new_label])
+
+    def verify(self):
+        """
+        returns the uncommitted groups, i.e. the staging group and loop groups that are not
+        referenced by the loop index, and whether the loop index is consistent with n_dmft_loops
+        """
+        uncommitted, index_is_consistent = None, None
+        if mpi.is_master_node():
+            with self._open_file() as disk:
+                uncommitted, index_is_consistent = find_uncommitted(
+                    disk["dmft_results"])
+        uncommitted = mpi.bcast(uncommitted)
+        index_is_consistent = mpi.bcast(index_is_consistent)
+        return uncommitted, index_is_consistent
+
+    def repair(self):
+        """
+        discards everything that verify finds, e.g. the remainder of a loop that has been
+        interrupted while being saved, and returns the discarded groups. Don't repair archives
+        that are being written by another process.
+        """
+        assert not self.read_only, "Storage has been opened read-only."
+        uncommitted, index_is_consistent = self.verify()
+        discarded = []
+        if mpi.is_master_node() and (len(uncommitted) > 0 or not index_is_consistent):
+            with h5py.File(self.file_name, 'a') as disk:
+                results = disk["dmft_results"]
+                if not index_is_consistent:
+                    repair_loop_index(results)
+                discarded = find_uncommitted(results)[0]
+                for name in discarded:
+                    del results[name]
+            print "warning: discarded uncommitted data", discarded, "of", self.file_name
+        discarded = mpi.bcast(discarded)
+        return discarded
 
     def _archive_is_open(self):
         if self.disk is None:
@@ -83,85 +218,271 @@ class Storage:
             assert loop_nr >= 0, "loop not available"
         return loop_nr
 
-    def load(self, quantity_name, loop_nr=None, bcast=True):
+    def _get_loop_index(self):
+        """
+        physical group labels of the logical loops 0, 1, ..., n_dmft_loops - 1
+        archives without a loop_index store loop l in the group str(l)
+        """
+        assert self._archive_is_open(), "Archive has to be open, when the loop index is read"
+        if 'loop_index' in self.dmft_results.keys():
+            return [int(label) for label in self.dmft_results['loop_index']]
+        return range(self.dmft_results["n_dmft_loops"])
+
+    def _set_loop_index(self, loop_index):
+        """
+        only the index is rewritten, the groups of the loops are not touched
+        """
+        with h5py.File(self.file_name, 'a') as disk:
+            write_loop_index(disk["dmft_results"], loop_index)
+
+    def _get_physical_label(self, loop_nr):
+        return str(self._get_loop_index()[self._asc_loop_nr(loop_nr)])
+
+    def load(self, quantity_name, loop_nr=None, bcast=True, shared=False):
         """
         allows for negative loop numbers counting backwards from the end
         don't bcast, if you want to load an AtomDiag of TRIQS
+        Green's functions and arrays are broadcasted as buffers, see mpiarrays.bcast
+        shared: numpy arrays are kept once per node and are read-only
         """
         quantity = None
         if mpi.is_master_node():
-            self._open_archive(True)
-            loop_nr = self._asc_loop_nr(loop_nr)
+            quantity = self._read(self._load_from_disk, quantity_name, loop_nr)
+        if bcast:
+            quantity = mpiarrays.bcast(quantity, shared=shared)
+        return quantity
+
+    def load_on_rank(self, quantity_name, loop_nr=None):
+        """
+        like load, but reads on the calling rank without any communication, e.g. to split loops
+        over the ranks. Other ranks than the master can read read-only Storages only.
+        """
+        return self._read(self._load_from_disk, quantity_name, loop_nr)
+
+    def _load_from_disk(self, quantity_name, loop_nr):
+        quantity = None
+        self._open_archive(True)
+        try:
+            label = self._get_physical_label(loop_nr)
             try:
-                quantity = self.dmft_results[str(loop_nr)][quantity_name]
+                quantity = self._load_from_label(label, quantity_name)
             except KeyError:
                 if mpi.is_master_node():
                     'Warning:', quantity_name, 'could not be loaded'
+        finally:
             self._close_archive()
-        if bcast:
-            quantity = mpi.bcast(quantity)
         return quantity
 
+    def _load_from_label(self, label, quantity_name):
+        """
+        quantities that are missing in the loop are derived from the stored ones if possible,
+        the last derived quantities are kept in memory
+        """
+        loop = self.dmft_results[label]
+        if quantity_name in loop:
+            quantity = loop[quantity_name]
+            if is_compact(quantity):
+                quantity = self._expand(quantity)
+            return quantity
+        if quantity_name not in derivation_rules or not is_derivable(quantity_name, loop.keys()):
+            raise KeyError(quantity_name)
+        key = (label, quantity_name)
+        if key not in self._derived:
+            sources, derive = derivation_rules[quantity_name]
+            self._derived[key] = derive(*[self._load_from_label(label, source) for source in sources])
+            if len(self._derived) > 8:
+                self._derived.popitem(last=False)
+        return self._derived[key].copy()
+
+    def load_slice(self, quantity_name, loops, block, orbitals=None, frequency_range=None, bcast=True, shared=False):
+        """
+        reads only the hyperslab of the data of a (Block)Gf on a Matsubara mesh that is requested,
+        the first axis of the returned array runs over loops
+        loops: loop number or list of loop numbers, negative numbers count backwards
+        orbitals: (i, j) or None for the whole block
+        frequency_range: (n_min, n_max) counting Matsubara frequencies from the first positive one,
+        n_max excluded, None for the whole mesh
+        shared: the ranks of a node share one read-only copy of the data
+        """
+        data = None
+        if mpi.is_master_node():
+            if not isinstance(loops, (list, tuple, np.ndarray)):
+                loops = [loops]
+            data = self._read(self._load_slice_on_master, quantity_name, loops, block, orbitals, frequency_range)
+        if bcast:
+            data = mpiarrays.bcast(data, shared=shared)
+        return data
+
+    def _load_slice_on_master(self, quantity_name, loops, block, orbitals, frequency_range):
+        with self._open_file() as disk:
+            results = disk["dmft_results"]
+            labels = read_physical_labels(results, loops)
+            data = [read_gf_slice(results[label][quantity_name], block, orbitals, frequency_range)
+                    if quantity_name in results[label] else None for label in labels]
+        for i, label in enumerate(labels):
+            if data[i] is None:
+                data[i] = self._derive_slice(label, quantity_name, block, orbitals, frequency_range)
+        return np.array(data)
+
+    def _derive_slice(self, label, quantity_name, block, orbitals, frequency_range):
+        self._open_archive(True)
+        try:
+            gf = self._load_from_label(label, quantity_name)
+        finally:
+            self._close_archive()
+        data = gf[block].data
+        n_min, n_max = frequency_window(data.shape[0], frequency_range)
+        data = data[n_min + data.shape[0] // 2:n_max + data.shape[0] // 2]
+        if orbitals is not None:
+            data = data[:, int(orbitals[0]), int(orbitals[1])]
+        return data
+
+    def load_matsubara_frequencies(self, quantity_name, block, loop_nr=None, frequency_range=None):
+        """
+        the imaginary parts of the mesh corresponding to load_slice
+        """
+        iw = None
+        if mpi.is_master_node():
+            with self._open_file() as disk:
+                results = disk["dmft_results"]
+                label = read_physical_labels(results, [loop_nr])[0]
+                while quantity_name not in results[label] and quantity_name in derivation_rules:
+                    quantity_name = derivation_rules[quantity_name][0][0]
+                beta, n_mesh = read_gf_mesh_size(
+                    results[label][quantity_name], block)
+                n_min, n_max = frequency_window(n_mesh, frequency_range)
+                iw = (2 * np.arange(n_min, n_max) + 1) * np.pi / beta
+        iw = mpi.bcast(iw)
+        return iw
+
+    def load_beta(self, quantity_name="g_loc_iw", loop_nr=None):
+        """
+        beta from the mesh metadata of a stored Green's function, without loading it
+        """
+        beta = None
+        if mpi.is_master_node():
+            with self._open_file() as disk:
+                results = disk["dmft_results"]
+                label = read_physical_labels(results, [loop_nr])[0]
+                while quantity_name not in results[label] and quantity_name in derivation_rules:
+                    quantity_name = derivation_rules[quantity_name][0][0]
+                beta = read_gf_beta(results[label][quantity_name])
+        beta = mpi.bcast(beta)
+        return beta
+
+    def load_block_names(self, quantity_name, loop_nr=None):
+        """
+        the block names of a stored BlockGf, without loading it
+        """
+        block_names = None
+        if mpi.is_master_node():
+            with self._open_file() as disk:
+                results = disk["dmft_results"]
+                label = read_physical_labels(results, [loop_nr])[0]
+                while quantity_name not in results[label] and quantity_name in derivation_rules:
+                    quantity_name = derivation_rules[quantity_name][0][0]
+                block_names = read_block_names(results[label][quantity_name])
+        block_names = mpi.bcast(block_names)
+        return block_names
+
+    def load_summary(self, bcast=True):
+        """
+        the loop summary as dict of arrays ordered by loop, None if the archive has none
+        see h5reader.read_loop_summary
+        """
+        summary = None
+        if mpi.is_master_node():
+            with self._open_file() as disk:
+                summary = read_loop_summary(disk)
+        if bcast:
+            summary = mpi.bcast(summary)
+        return summary
+
     def get_completed_loops(self, _archive_open=False):
         n_loops = None
         if mpi.is_master_node():
             if _archive_open:
                 n_loops = self.dmft_results["n_dmft_loops"]
             else:
-                self._open_archive(True)
-                n_loops = self.dmft_results["n_dmft_loops"]
-                self._close_archive()
+                with self._open_file() as disk:
+                    n_loops = int(disk["dmft_results"]["n_dmft_loops"][()])
         n_loops = mpi.bcast(n_loops)
         return n_loops
 
     def get_last_loop_nr(self):
         return self.get_completed_loops() - 1
 
-    def _drop_loop(self, loop):
-        results = self.disk["dmft_results"]
-        del results[str(loop)]
-
-    def _relabel_loop(self, old_label, new_label):
-        old_label = str(old_label)
-        new_label = str(new_label)
-        results = self.disk["dmft_results"]
-        assert not results.is_group(
-            new_label), "unable to relabel, group already exists"
-        results.create_group(new_label)
-        for key, val in results[old_label].items():
-            results[new_label][key] = val
-        #self.disk["dmft_results"][new_label_str] = self.disk["dmft_results"][str(old_label)]
-        del results[old_label]
+    def follow(self, poll_interval=10, timeout=None, first_loop=None):
+        """
+        yields the numbers of loops as soon as they are committed by a running job, starts with
+        first_loop or with the next loop and stops after timeout seconds without a new loop
+        """
+        return follow_loops(self.get_completed_loops, poll_interval, timeout, first_loop)
+
+    def _drop_loop(self, label):
+        """
+        unlinks the group of a loop, an external link is removed without touching its target
+        """
+        self._derived.clear()
+        with h5py.File(self.file_name, 'a') as disk:
+            del disk["dmft_results"][str(label)]
 
     def cut_loop(self, loop):
         """
-        deletes a loop
+        deletes a loop, later loops move up by one, only the loop index is rewritten
         """
         self._open_archive()
         loop = self._asc_loop_nr(loop)
-        self._drop_loop(loop)
-        for l in range(self.get_completed_loops(True)):
-            if l > loop:
-                self._relabel_loop(l, l - 1)
-        self.disk["dmft_results"]["n_dmft_loops"] -= 1
+        loop_index = self._get_loop_index()
         self._close_archive()
+        label = loop_index.pop(loop)
+        self._set_loop_index(loop_index)
+        self._drop_loop(label)
 
-    def merge(self, storage_to_append):
+    def reorder_loops(self, new_order):
         """
-        appends a storage on another
+        new_order is a permutation of the (possibly negative) loop numbers, the loop new_order[i]
+        becomes loop i
         """
-        n_loops_sto2 = storage_to_append.get_completed_loops()
-        n_loops_sto = self.get_completed_loops()
         self._open_archive()
-        storage_to_append._open_archive()
-        for l in range(n_loops_sto2):
-            appended_loop_nr = str(n_loops_sto + l)
-            self.dmft_results.create_group(appended_loop_nr)
-            for key, val in storage_to_append.dmft_results[str(l)].items():
-                self.dmft_results[appended_loop_nr][key] = val
-        self.dmft_results["n_dmft_loops"] += n_loops_sto2
+        new_order = [self._asc_loop_nr(l) for l in new_order]
+        loop_index = self._get_loop_index()
         self._close_archive()
+        assert sorted(new_order) == range(
+            len(loop_index)), "new_order must be a permutation of all loops"
+        self._set_loop_index([loop_index[l] for l in new_order])
+
+    def merge(self, storage_to_append, link=False):
+        """
+        appends a storage on another, the loops are copied within hdf5
+        link: the loops of storage_to_append are referenced by external links instead, i.e. only
+        the loop index is written and storage_to_append must stay available
+        """
+        storage_to_append._open_archive(True)
+        labels_to_append = storage_to_append._get_loop_index()
         storage_to_append._close_archive()
+        self._open_archive()
+        loop_index = self._get_loop_index()
+        first_new_label = new_physical_label(self.dmft_results)
+        self._close_archive()
+        new_labels = range(first_new_label,
+                           first_new_label + len(labels_to_append))
+        source_name = os.path.relpath(os.path.abspath(storage_to_append.file_name),
+                                      os.path.dirname(os.path.abspath(self.file_name)))
+        with h5py.File(self.file_name, 'a') as target:
+            with h5py.File(storage_to_append.file_name, 'r') as source:
+                rows = read_summary_rows(source)
+                for label, new_label in zip(labels_to_append, new_labels):
+                    if label in rows:
+                        append_summary_row(target, new_label, rows[label])
+                    path = "dmft_results/"+str(label)
+                    if link:
+                        target["dmft_results"][str(new_label)] = h5py.ExternalLink(
+                            source_name, path)
+                    else:
+                        target["dmft_results"].copy(
+                            source[path], str(new_label))
+            write_loop_index(target["dmft_results"], loop_index + new_labels)
 
     def provide_initial_guess(self, provide_mu=True):
         try:
@@ -175,9 +496,9 @@ class Storage:
             return {"self_energy": sigma}
 
     def has_density_matrix(self):
-        n = self.get_last_loop_nr()
         self._open_archive(read_only=True)
-        if self.disk["dmft_results"][str(n)].is_group('density_matrix'):
+        label = self._get_physical_label(-1)
+        if self.dmft_results[label].is_group('density_matrix'):
             has = True
         else:
             has = False
@@ -193,3 +514,141 @@ class Storage:
             is_da = False
         self._close_archive()
         return is_da
+
+
+def dyson(weiss_field, self_energy):
+    """
+    the Green's function, see GLocalCommon.calc_dyson
+    """
+    return inverse(inverse(weiss_field) - self_energy)
+
+
+derivation_rules = {"g_imp_iw": (["g_weiss_iw", "se_imp_iw"], dyson),
+                    "g0_iw": (["g_weiss_iw"], lambda weiss_field: weiss_field.copy()),
+                    "g_sol_iw": (["g0_iw", "sigma_sol_iw"], dyson)}
+
+
+def register_derivation(quantity_name, sources, derive):
+    """
+    lets Storage derive quantity_name = derive(*sources) of a loop, sources are quantity names,
+    the first source has to be on the mesh of the result
+    """
+    derivation_rules[quantity_name] = (sources, derive)
+
+
+def is_derivable(quantity_name, stored):
+    """
+    whether quantity_name is in stored or can be derived from it
+    """
+    if quantity_name in stored:
+        return True
+    if quantity_name not in derivation_rules:
+        return False
+    return all([is_derivable(source, stored) for source in derivation_rules[quantity_name][0]])
+
+
+def append_summary_row(disk, label, row):
+    """
+    appends a row to the columnar table loop_summary at the archive root, label is the physical
+    label of the loop. Every column is a resizable dataset, dicts of labeled values are
+    stored as vectors with the labels as attribute, missing values are nan
+    """
+    summary = disk.require_group("loop_summary")
+    n_rows = summary["loop"].shape[0] if "loop" in summary else 0
+    values = {"loop": np.array(label)}
+    for name, value in row.items():
+        if isinstance(value, dict):
+            labels = sorted(value.keys())
+            value = np.array([value[l] for l in labels])
+            if name in summary and decode_strings(summary[name].attrs["labels"]) != labels:
+                print "warning: labels of", name, "changed, skipping it in the loop summary"
+                continue
+        else:
+            labels = None
+            value = np.array(value)
+        if name not in summary:
+            dtype = complex if np.iscomplexobj(value) else float
+            summary.create_dataset(name, shape=(n_rows,) + value.shape, maxshape=(None,) + value.shape,
+                                   dtype=dtype, chunks=True, fillvalue=np.nan)
+            if labels is not None:
+                summary[name].attrs["labels"] = labels
+        values[name] = value
+    if "loop" not in summary:
+        summary.create_dataset("loop", shape=(0,), maxshape=(None,), dtype=int, chunks=True)
+    for name, column in summary.items():
+        column.resize(n_rows + 1, axis=0)
+        if name in values:
+            column[n_rows] = values[name]
+
+
+def new_physical_label(results):
+    """
+    a label that no loop group has, works for HDFArchive and h5py groups
+    """
+    labels = [int(key) for key in results.keys() if key.isdigit()]
+    if len(labels) == 0:
+        return 0
+    return max(labels) + 1
+
+
+def write_loop_index(results, loop_index):
+    """
+    writes the loop index of an h5py group dmft_results and n_dmft_loops. The index is written
+    first and n_dmft_loops last, in both directions, so that an interrupted write leaves an
+    index whose length differs from n_dmft_loops: a longer index has been extended in place and
+    repair_loop_index cuts it back to the committed loops, a shorter one has replaced the old
+    index and is complete. The identity is stored without index for compatibility, the index is
+    removed only after n_dmft_loops has been written.
+    """
+    is_identity = loop_index == range(len(loop_index))
+    if not is_identity or "loop_index" in results:
+        old_index = results["loop_index"] if "loop_index" in results else None
+        is_extension = old_index is not None and old_index.maxshape[0] is None and len(
+            loop_index) >= old_index.shape[0] and list(old_index[()]) == loop_index[:old_index.shape[0]]
+        if is_extension:
+            n_old = old_index.shape[0]
+            old_index.resize((len(loop_index),))
+            old_index[n_old:] = loop_index[n_old:]
+        else:
+            results.create_dataset("loop_index_new", data=np.array(loop_index, dtype=int),
+                                   maxshape=(None,), chunks=True)
+            if old_index is not None:
+                del results["loop_index"]
+            results.move("loop_index_new", "loop_index")
+    results["n_dmft_loops"][()] = len(loop_index)
+    if is_identity and "loop_index" in results:
+        del results["loop_index"]
+
+
+def find_uncommitted(results):
+    """
+    see Storage.verify, results is the h5py group dmft_results
+    """
+    n_loops = int(results["n_dmft_loops"][()])
+    index_is_consistent = "loop_index_new" not in results
+    if "loop_index" in results:
+        index_is_consistent = index_is_consistent and results["loop_index"].shape[0] == n_loops
+    committed = []
+    if index_is_consistent:
+        committed = read_physical_labels(results, range(n_loops))
+    uncommitted = [str(name) for name in results.keys() if str(name) == "staging" or (
+        name.isdigit() and str(name) not in committed)]
+    return uncommitted, index_is_consistent
+
+
+def repair_loop_index(results):
+    """
+    completes or rolls back an interrupted write_loop_index
+    """
+    if "loop_index_new" in results:
+        if "loop_index" in results:
+            del results["loop_index_new"]
+        else:
+            results.move("loop_index_new", "loop_index")
+    if "loop_index" in results:
+        n_loops = int(results["n_dmft_loops"][()])
+        loop_index = [int(label) for label in results["loop_index"][()]]
+        if len(loop_index) > n_loops:
+            write_loop_index(results, loop_index[:n_loops])
+        else:
+            write_loop_index(results, loop_index)
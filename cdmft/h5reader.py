@@ -0,0 +1,466 @@
+import os
+import h5py
+import numpy as np
+from time import sleep
+from contextlib import contextmanager
+
+from compactgf import is_compact, decompress_blocks
+
+
+class ArchiveReader:
+    """
+    reads archives written by h5interface.Storage with h5py and numpy only, i.e. without TRIQS
+    and MPI. It knows the dmft_results/<loop>/<quantity> layout including the loop index and
+    returns Green's functions as GfData/BlockGfData holding numpy arrays.
+    mmap: contiguous, uncompressed datasets are returned as read-only memory maps
+    lock: whether to use HDF5 file locking, without it reading never blocks a running job and
+    the loads are retried if they fail, see retry_reads
+    """
+
+    def __init__(self, file_name, mmap=False, lock=False):
+        self.file_name = file_name
+        self.mmap = mmap
+        self.lock = lock
+
+    def _open(self):
+        return open_file(self.file_name, self.lock)
+
+    def _retry(self, read, *args):
+        if self.lock:
+            return read(*args)
+        return retry_reads(read, args)
+
+    def get_completed_loops(self):
+        with self._open() as disk:
+            n_loops = int(disk["dmft_results"]["n_dmft_loops"][()])
+        return n_loops
+
+    def get_last_loop_nr(self):
+        return self.get_completed_loops() - 1
+
+    def follow(self, poll_interval=10, timeout=None, first_loop=None):
+        """
+        see Storage.follow
+        """
+        return follow_loops(self.get_completed_loops, poll_interval, timeout, first_loop)
+
+    def keys(self, loop_nr=None):
+        """
+        names of the quantities stored in a loop
+        """
+        with self._open() as disk:
+            results = disk["dmft_results"]
+            label = read_physical_labels(results, [loop_nr])[0]
+            keys = [str(key) for key in results[label].keys()]
+        return keys
+
+    def load(self, quantity_name, loop_nr=None):
+        """
+        allows for negative loop numbers counting backwards from the end, returns None if the
+        quantity does not exist
+        """
+        return self._retry(self._load, quantity_name, loop_nr)
+
+    def _load(self, quantity_name, loop_nr):
+        with self._open() as disk:
+            results = disk["dmft_results"]
+            label = read_physical_labels(results, [loop_nr])[0]
+            if quantity_name not in results[label]:
+                return None
+            quantity = self._read(results[label][quantity_name])
+        return quantity
+
+    def load_loops(self, quantity_name, loops=None):
+        """
+        loads a scalar quantity of many loops into one array
+        """
+        return self._retry(self._load_loops, quantity_name, loops)
+
+    def _load_loops(self, quantity_name, loops):
+        with self._open() as disk:
+            results = disk["dmft_results"]
+            if loops is None:
+                loops = range(int(results["n_dmft_loops"][()]))
+            values = [self._read(results[label][quantity_name])
+                      for label in read_physical_labels(results, loops)]
+        return np.array(values)
+
+    def load_slice(self, quantity_name, loops, block, orbitals=None, frequency_range=None):
+        """
+        see Storage.load_slice
+        """
+        return self._retry(self._load_slice, quantity_name, loops, block, orbitals, frequency_range)
+
+    def _load_slice(self, quantity_name, loops, block, orbitals, frequency_range):
+        if not isinstance(loops, (list, tuple, np.ndarray)):
+            loops = [loops]
+        with self._open() as disk:
+            results = disk["dmft_results"]
+            data = np.array([read_gf_slice(results[label][quantity_name], block, orbitals, frequency_range)
+                             for label in read_physical_labels(results, loops)])
+        return data
+
+    def load_summary(self):
+        return self._retry(self._load_summary)
+
+    def _load_summary(self):
+        with self._open() as disk:
+            summary = read_loop_summary(disk)
+        return summary
+
+    def _read(self, node):
+        scheme = node.attrs.get("TRIQS_HDF5_data_scheme", "")
+        if isinstance(scheme, bytes):
+            scheme = scheme.decode()
+        if isinstance(node, h5py.Dataset):
+            return self._read_dataset(node)
+        if is_compact(node):
+            return self._read_compact(node)
+        if scheme == "BlockGf":
+            return self._read_blockgf(node)
+        if scheme.startswith("Gf") or ("data" in node and "mesh" in node):
+            return self._read_gf(node)
+        return dict([(str(key), self._read(node[key])) for key in node.keys()])
+
+    def _read_dataset(self, dataset, complex_pairs=False):
+        """
+        complex_pairs: the last dimension holds real and imaginary part, TRIQS marks such
+        datasets by the attribute __complex__
+        """
+        if dataset.shape == ():
+            value = dataset[()]
+            if isinstance(value, bytes):
+                value = value.decode()
+            return value
+        complex_pairs = complex_pairs or dataset.attrs.get("__complex__", 0)
+        data = None
+        if self.mmap and dataset.dtype.kind in 'iuf' and dataset.chunks is None:
+            offset = dataset.id.get_offset()
+            if offset is not None:
+                data = np.memmap(dataset.file.filename, dtype=dataset.dtype,
+                                 mode='r', offset=offset, shape=dataset.shape)
+                if complex_pairs and dataset.dtype == np.float64:
+                    return data.view(np.complex128)[..., 0]
+        if data is None:
+            data = dataset[()]
+        if complex_pairs:
+            data = data[..., 0] + 1j * data[..., 1]
+        return data
+
+    def _read_blockgf(self, group):
+        return BlockGfData([(bn, self._read_gf(group[bn])) for bn in read_block_names(group)])
+
+    def _read_compact(self, group):
+        beta = float(group["beta"][()])
+        block_names, block_data = decompress_blocks(group)
+        return BlockGfData([(bn, GfData(read_mesh_matsubara(beta, data.shape[0]), data))
+                            for bn, data in zip(block_names, block_data)])
+
+    def _read_gf(self, group):
+        dataset = group["data"]
+        data = self._read_dataset(dataset, dataset.ndim == 4 and dataset.dtype.kind != 'c')
+        return GfData(read_mesh(group["mesh"], data.shape[0]), data)
+
+
+class GfData:
+    """
+    mesh and data of a Gf, data has the TRIQS layout (mesh, i, j)
+    """
+
+    def __init__(self, mesh, data):
+        self.mesh = mesh
+        self.data = data
+
+    @property
+    def beta(self):
+        return self.mesh.beta
+
+
+class BlockGfData:
+    """
+    the blocks of a BlockGf in their original order, iterates like a BlockGf
+    """
+
+    def __init__(self, blocks):
+        self.block_names = [bn for bn, b in blocks]
+        self._blocks = dict(blocks)
+
+    def __getitem__(self, block_name):
+        return self._blocks[block_name]
+
+    def __iter__(self):
+        for bn in self.block_names:
+            yield bn, self._blocks[bn]
+
+    @property
+    def mesh(self):
+        return self._blocks[self.block_names[0]].mesh
+
+
+class MeshData:
+    """
+    kind is the TRIQS mesh name, e.g. MeshImFreq, points are the mesh values
+    """
+
+    def __init__(self, kind, points, beta=None, statistic=None):
+        self.kind = kind
+        self.points = points
+        self.beta = beta
+        self.statistic = statistic
+
+    def __len__(self):
+        return len(self.points)
+
+    def __iter__(self):
+        for point in self.points:
+            yield point
+
+
+def read_mesh(group, n_points):
+    kind = group.attrs.get("TRIQS_HDF5_data_scheme", "")
+    if isinstance(kind, bytes):
+        kind = kind.decode()
+    beta, statistic = None, None
+    if "domain" in group:
+        beta = float(group["domain"]["beta"][()])
+        statistic = group["domain"]["statistic"][()] if "statistic" in group["domain"] else "F"
+        if isinstance(statistic, bytes):
+            statistic = statistic.decode()
+    if kind == "MeshImTime":
+        points = np.linspace(0, beta, n_points)
+    elif kind == "MeshLegendre":
+        points = np.arange(n_points)
+    elif beta is not None:
+        return read_mesh_matsubara(beta, n_points, statistic)
+    else:
+        points = np.arange(n_points)
+    return MeshData(kind, points, beta, statistic)
+
+
+def read_mesh_matsubara(beta, n_points, statistic="F"):
+    n_min, n_max = frequency_window(n_points, None)
+    zeta = 1 if statistic == "F" else 0
+    points = 1j * (2 * np.arange(n_min, n_max) + zeta) * np.pi / beta
+    return MeshData("MeshImFreq", points, beta, statistic)
+
+
+def read_physical_labels(results, loops):
+    """
+    h5py variant of Storage._get_physical_label for a list of loops
+    """
+    n_loops = int(results["n_dmft_loops"][()])
+    if "loop_index" in results:
+        loop_index = results["loop_index"][()]
+    else:
+        loop_index = np.arange(n_loops)
+    labels = []
+    for loop_nr in loops:
+        if loop_nr is None:
+            loop_nr = n_loops - 1
+        if loop_nr < 0:
+            loop_nr = n_loops + loop_nr
+        assert 0 <= loop_nr < n_loops, "loop not available"
+        labels.append(str(loop_index[loop_nr]))
+    return labels
+
+
+def frequency_window(n_mesh, frequency_range):
+    """
+    Matsubara indices (n_min, n_max) of frequency_range on a mesh of n_mesh points
+    """
+    if frequency_range is None:
+        return -(n_mesh // 2), n_mesh - n_mesh // 2
+    n_min, n_max = frequency_range
+    assert -(n_mesh // 2) <= n_min < n_max <= n_mesh - n_mesh // 2, \
+        "frequency_range "+str(tuple(frequency_range))+" exceeds the mesh of "+str(n_mesh)+" points"
+    return n_min, n_max
+
+
+def read_gf_data(dataset, orbitals, frequency_range):
+    """
+    reads data[frequencies, i, j] from the dataset of a Gf, TRIQS stores complex numbers in an
+    additional last dimension
+    """
+    n_min, n_max = frequency_window(dataset.shape[0], frequency_range)
+    selection = (slice(n_min + dataset.shape[0] // 2,
+                       n_max + dataset.shape[0] // 2),)
+    if orbitals is not None:
+        selection += (int(orbitals[0]), int(orbitals[1]))
+    data = dataset[selection]
+    if dataset.dtype.kind != 'c' and dataset.ndim == 4:
+        data = data[..., 0] + 1j * data[..., 1]
+    return data
+
+
+def read_gf_slice(quantity, block, orbitals, frequency_range):
+    """
+    read_gf_data for the group of a BlockGf, reconstructs only the requested frequencies of
+    compactly stored BlockGfs
+    """
+    if not is_compact(quantity):
+        return read_gf_data(quantity[block]["data"], orbitals, frequency_range)
+    n_mesh = int(quantity["n_mesh"][()])
+    block_names, block_data = decompress_blocks(quantity, frequency_window(n_mesh, frequency_range))
+    data = block_data[block_names.index(block)]
+    if orbitals is not None:
+        data = data[:, int(orbitals[0]), int(orbitals[1])]
+    return data
+
+
+def read_gf_mesh_size(quantity, block):
+    """
+    beta and number of mesh points of a block of a stored BlockGf
+    """
+    if is_compact(quantity):
+        return float(quantity["beta"][()]), int(quantity["n_mesh"][()])
+    group = quantity[block]
+    return float(group["mesh"]["domain"]["beta"][()]), group["data"].shape[0]
+
+
+def read_block_names(quantity):
+    """
+    the block names of a stored BlockGf in their order
+    """
+    if is_compact(quantity):
+        return decode_strings([quantity["block_"+str(i)]["name"][()]
+                               for i in range(int(quantity["n_blocks"][()]))])
+    if "block_names" in quantity:
+        return decode_strings(quantity["block_names"][()])
+    return sorted([str(key) for key in quantity.keys()])
+
+
+def read_gf_beta(quantity):
+    """
+    beta from the mesh of the first block of a stored (Block)Gf without reading its data
+    """
+    if is_compact(quantity):
+        return float(quantity["beta"][()])
+    if "mesh" in quantity:
+        return float(quantity["mesh"]["domain"]["beta"][()])
+    for name, block in quantity.items():
+        if isinstance(block, h5py.Group) and "mesh" in block:
+            return float(block["mesh"]["domain"]["beta"][()])
+    raise KeyError("no mesh found")
+
+
+def read_summary_rows(disk):
+    """
+    the rows of the loop summary as dict physical label: row
+    """
+    rows = {}
+    if "loop_summary" not in disk:
+        return rows
+    summary = disk["loop_summary"]
+    columns = dict([(str(name), column[()]) for name, column in summary.items()])
+    for i_row, label in enumerate(columns.pop("loop")):
+        row = {}
+        for name, column in columns.items():
+            if "labels" in summary[name].attrs:
+                row[name] = dict(zip(decode_strings(summary[name].attrs["labels"]), column[i_row]))
+            else:
+                row[name] = column[i_row]
+        rows[int(label)] = row
+    return rows
+
+
+def read_loop_summary(disk):
+    """
+    the columns of the loop summary as arrays ordered by the (logical) loop number, the first
+    axis runs over loops. Loops without row are nan, the labels of vector columns are
+    returned as <name>_labels. None if the archive has no summary.
+    """
+    if "loop_summary" not in disk:
+        return None
+    results = disk["dmft_results"]
+    n_loops = int(results["n_dmft_loops"][()])
+    labels = [int(l) for l in read_physical_labels(results, range(n_loops))]
+    summary = disk["loop_summary"]
+    rows = dict([(label, i_row) for i_row, label in enumerate(summary["loop"][()])])
+    has_row = np.array([label in rows for label in labels], dtype=bool)
+    row_inds = np.array([rows.get(label, 0) for label in labels], dtype=int)
+    columns = {"loop": np.arange(n_loops)}
+    for name, column in summary.items():
+        name = str(name)
+        if name == "loop":
+            continue
+        data = column[()]
+        columns[name] = np.full((n_loops,) + data.shape[1:], np.nan, dtype=data.dtype)
+        if len(data) > 0:
+            columns[name][has_row] = data[row_inds[has_row]]
+        if "labels" in column.attrs:
+            columns[name+"_labels"] = decode_strings(column.attrs["labels"])
+    return columns
+
+
+def decode_strings(strings):
+    return [str(s.decode()) if isinstance(s, bytes) else str(s) for s in strings]
+
+
+@contextmanager
+def file_locking(enabled):
+    """
+    HDF5 (>= 1.10) locks files while they are open, a reader holding a lock makes the writer
+    fail to open the file. HDF5 evaluates HDF5_USE_FILE_LOCKING whenever it opens a file, the
+    variable is set only while files are opened within the context, other files of the process,
+    e.g. the ones it writes, keep their locks.
+    """
+    if enabled:
+        yield
+        return
+    previous = os.environ.get("HDF5_USE_FILE_LOCKING")
+    os.environ["HDF5_USE_FILE_LOCKING"] = "FALSE"
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["HDF5_USE_FILE_LOCKING"]
+        else:
+            os.environ["HDF5_USE_FILE_LOCKING"] = previous
+
+
+def open_file(file_name, lock=True):
+    """
+    opens an archive read-only with h5py, see file_locking
+    """
+    with file_locking(lock):
+        disk = h5py.File(file_name, 'r')
+    return disk
+
+
+def retry_reads(read, args=(), n_tries=3, wait=1):
+    """
+    returns read(*args), which is repeated after wait seconds if it fails, at most n_tries
+    times. Unlocked reads of an archive that is being written are best-effort: the writer
+    doesn't use SWMR, because every loop is a new group, which SWMR can't create. A read that
+    overlaps with a commit can see inconsistent metadata, committed loops don't change however.
+    """
+    for i_try in range(n_tries):
+        try:
+            return read(*args)
+        except (IOError, OSError, RuntimeError):
+            if i_try == n_tries - 1:
+                raise
+            sleep(wait)
+
+
+def follow_loops(get_completed_loops, poll_interval=10, timeout=None, first_loop=None):
+    """
+    generator of loop numbers as they are committed, get_completed_loops reads n_dmft_loops
+    """
+    next_loop = get_completed_loops() if first_loop is None else first_loop
+    waited = 0
+    while True:
+        try:
+            n_loops = get_completed_loops()
+        except (IOError, KeyError, RuntimeError):
+            n_loops = next_loop
+        if n_loops > next_loop:
+            for loop_nr in range(next_loop, n_loops):
+                yield loop_nr
+            next_loop = n_loops
+            waited = 0
+        elif timeout is not None and waited >= timeout:
+            return
+        else:
+            sleep(poll_interval)
+            waited += poll_interval
@@ -1,20 +1,35 @@
+import numpy as np
+import itertools as itt
+from scipy.optimize import least_squares
 from triqs_cthyb import Solver
-from pytriqs.gf import LegendreToMatsubara, BlockGf, GfImFreq, inverse
+from pytriqs.gf import LegendreToMatsubara, BlockGf, GfImFreq, inverse, iOmega_n
 from pytriqs.operators.operators import Operator
+from pytriqs.operators import c as C, c_dag as CDag
+from pytriqs.atom_diag import AtomDiag, atomic_g_iw, atomic_density_matrix
 from pytriqs.random_generator import random_generator_names_list
 from pytriqs.utility import mpi
 
 from greensfunctions import MatsubaraGreensFunction
+from gfoperations import cut_coefficients
+from compactgf import legendre_to_matsubara_matrix
 
 
 class ImpuritySolver:
+    """
+    CTHYB backend, the solvers of the other backends share its interface, see make_solver
+    """
+    is_stochastic = True
+    init_parameters = ["n_tau", "n_l", "legendre_noise_factor"]
 
-    def __init__(self, beta, gf_struct, n_iw, n_tau, n_l, *args, **kwargs):
+    def __init__(self, beta, gf_struct, n_iw, n_tau, n_l, legendre_noise_factor=None, *args, **kwargs):
         """
         parameters
         init:
         (required: beta, gf_struct)
         standard: n_iw = 1025, n_tau = 10001, n_l = 50
+        legendre_noise_factor: if given and G_tau is measured, the Legendre coefficients are cut
+        per block where they don't exceed legendre_noise_factor times their noise anymore, see
+        get_legendre_cutoff
         run:
         required: h_int n_cycles
         optional: partition_method, quantum_numbers, length_cycle, n_warmup_cycles, random_seed, random_name, max_time, verbosity, move_shift, move_double, use_trace_estimator, measure_G_tau, measure_G_l, measure_pert_order, measure_density_matrix, use_norm_as_weight, performance_analysis, proposal_prob, imag_threshold, measure_g_pp_tau
@@ -22,58 +37,158 @@ class ImpuritySolver:
         self.gf_struct = gf_struct
         self.beta = beta
         self.n_iw = n_iw
+        self.legendre_noise_factor = legendre_noise_factor
         self.run_parameters = {}
         self.cthyb = Solver(beta, gf_struct, n_iw,
                             n_tau, n_l, *args, **kwargs)
 
         self.blocknames = [bn[0] for bn in gf_struct]
         self.blocksizes = [len(b[1]) for b in gf_struct]
+        self._buffers = {}
+        self._clear_results()
+
+    def _clear_results(self):
+        self._g_iw = {}
+        self._se = {}
+        self._inverse_g0_iw = None
+        self._g_l_errors = None
+        self._legendre_cutoffs = None
 
     def get_g_iw(self, by_tau=False, by_legendre=True):
         """
         by_tau and by_legendre decide whether the DMFT loops depend on the legendre or on the
-        tau measurement
+        tau measurement. G_iw is computed once per solve, the returned object is overwritten
+        by the following solves.
         """
         assert by_tau ^ by_legendre, "G_iw can only be set by one G of the solver, since it is used for the next dmft loop"
+        method = self._get_method(by_tau)
+        if method not in self._g_iw:
+            if method == "tau":
+                self._g_iw[method] = self._get_g_iw_by_tau()
+            else:
+                self._g_iw[method] = self._get_g_iw_by_legendre()
+        return self._g_iw[method]
+
+    def _get_method(self, by_tau):
         if by_tau or not(self.run_parameters['measure_G_l']):
-            return self._get_g_iw_by_tau()
-        elif by_legendre:
-            return self._get_g_iw_by_legendre()
+            return "tau"
+        return "legendre"
 
     def _init_new_giw(self):
         return MatsubaraGreensFunction(self.blocknames, self.blocksizes, self.beta, self.n_iw)
 
+    def _get_buffer(self, name):
+        """
+        a MatsubaraGreensFunction that is allocated once and refilled by every solve
+        """
+        if name not in self._buffers:
+            self._buffers[name] = self._init_new_giw()
+        return self._buffers[name]
+
+    def _get_inverse_g0_iw(self):
+        """
+        the inverse of the solver's G0_iw, inverted in place into a buffer once per solve
+        """
+        if self._inverse_g0_iw is None:
+            g0_inv = self._get_buffer("inverse_g0_iw")
+            for bn, b in g0_inv:
+                b << self.cthyb.G0_iw[bn]
+                b.invert()
+            self._inverse_g0_iw = g0_inv
+        return self._inverse_g0_iw
+
     def _get_g_iw_by_tau(self):
-        g_iw = self._init_new_giw()
+        g_iw = self._get_buffer("g_iw_tau")
         if self.run_parameters["perform_post_proc"]:
+            g0_inv = self._get_inverse_g0_iw()
             for bn, b in g_iw:
-                g_iw[bn] << inverse(
-                    inverse(self.cthyb.G0_iw[bn]) - self.cthyb.Sigma_iw[bn])
+                b << g0_inv[bn]
+                b -= self.cthyb.Sigma_iw[bn]
+                b.invert()
         else:
             g_iw << self.cthyb.G_iw
         return g_iw
 
     def _get_g_iw_by_legendre(self):
-        g_iw = self._init_new_giw()
+        g_iw = self._get_buffer("g_iw_legendre")
+        cutoffs = self.get_legendre_cutoffs()
         for s, b in self.cthyb.G_l:
+            if cutoffs[s] < b.data.shape[0]:
+                b = cut_coefficients(b, cutoffs[s])
             g_iw[s] << LegendreToMatsubara(b)
         return g_iw
 
+    def get_legendre_cutoffs(self):
+        """
+        the number of Legendre coefficients that are used per block. Only the noise of G_tau is
+        a scale independent of the tail of G_l, which still holds signal if G_l doesn't decay
+        within n_l, so without the G_tau measurement all are used.
+        """
+        if self._legendre_cutoffs is None:
+            self._legendre_cutoffs = {}
+            for s, b in self.cthyb.G_l:
+                if self.legendre_noise_factor is None or not self.run_parameters.get("measure_G_tau", True):
+                    self._legendre_cutoffs[s] = b.data.shape[0]
+                else:
+                    self._legendre_cutoffs[s] = get_legendre_cutoff(
+                        b.data, self.get_g_l_errors()[s], self.legendre_noise_factor)
+        return self._legendre_cutoffs
+
     def get_se(self, by_tau=False, by_legendre=True):
         """
-        returns the selfenergy consistent with the impurity greens function used for the dmft cycle
+        returns the selfenergy consistent with the impurity greens function used for the dmft cycle,
+        computed once per solve like G_iw
         """
-        se = self._init_new_giw()
-        if by_tau or not self.run_parameters["measure_G_l"]:
-            g_iw = self._get_g_iw_by_tau()
-        else:
-            assert by_legendre and self.run_parameters[
-                "measure_G_l"], "Need either g_legendre or g_tau to set sigma_iw"
-            g_iw = self._get_g_iw_by_legendre()
-        if self.run_parameters["n_cycles"] > 0:
-            for bn, b in g_iw:
-                se[bn] << inverse(self.cthyb.G0_iw[bn]) - inverse(g_iw[bn])
-        return se
+        if not by_tau and self.run_parameters["measure_G_l"]:
+            assert by_legendre, "Need either g_legendre or g_tau to set sigma_iw"
+        method = self._get_method(by_tau)
+        if method not in self._se:
+            se = self._get_buffer("se_"+method)
+            se.zero()
+            if self.run_parameters["n_cycles"] > 0:
+                g_iw = self.get_g_iw(method == "tau", method == "legendre")
+                g0_inv = self._get_inverse_g0_iw()
+                for bn, b in se:
+                    b << g_iw[bn]
+                    b.invert()
+                    b *= -1
+                    b += g0_inv[bn]
+            self._se[method] = se
+        return self._se[method]
+
+    def get_g_l_errors(self):
+        """
+        heuristic Monte Carlo errors of the Legendre coefficients as dict of (i, j) arrays per
+        block, see estimate_legendre_noise, they are overestimated if G_l hasn't decayed within n_l.
+        If G_tau is measured, its noise bounds them, see estimate_legendre_noise_from_tau.
+        """
+        if self._g_l_errors is None:
+            self._g_l_errors = {}
+            for bn, b in self.cthyb.G_l:
+                self._g_l_errors[bn] = estimate_legendre_noise(b.data)
+                if self.run_parameters.get("measure_G_tau", True):
+                    self._g_l_errors[bn] = np.minimum(self._g_l_errors[bn], estimate_legendre_noise_from_tau(
+                        self.cthyb.G_tau[bn].data, self.beta))
+        return self._g_l_errors
+
+    def get_g_iw_errors(self, n_omega=None):
+        """
+        the errors of G_iw of the Legendre measurement for the first n_omega positive Matsubara
+        frequencies (default all) as dict of (frequency, i, j) arrays per block, propagated from
+        the heuristic get_g_l_errors
+        """
+        if n_omega is None:
+            n_omega = self.n_iw
+        return dict([(bn, get_matsubara_errors(noise, self.get_legendre_cutoffs()[bn], n_omega))
+                     for bn, noise in self.get_g_l_errors().items()])
+
+    def get_density_error(self):
+        """
+        the error of the total density of the Legendre measurement, propagated from the
+        heuristic get_g_l_errors
+        """
+        return np.sqrt(np.sum([get_density_error(noise, self.get_legendre_cutoffs()[bn], self.beta)**2
+                               for bn, noise in self.get_g_l_errors().items()]))
 
     def _get_internal_parameters(self, loop_nr):
         par = {}
@@ -89,6 +204,7 @@ class ImpuritySolver:
         self.run_parameters["h_int"] = h
         self.run_parameters.update(run_parameters)
         self.run_parameters.update(self._get_internal_parameters(loop_nr))
+        self._clear_results()
         self.cthyb.solve(**self.run_parameters)
 
     def get_results(self):
@@ -108,6 +224,8 @@ class ImpuritySolver:
                     results.update({"g_sol_iw": self.cthyb.G_iw})
         if params["measure_G_l"]:
             results.update({"g_sol_l": self.cthyb.G_l})
+            if self.legendre_noise_factor is not None:
+                results.update({"legendre_cutoffs": self.get_legendre_cutoffs()})
         if params["measure_density_matrix"]:
             results.update({"density_matrix": self.cthyb.density_matrix})
         if params["measure_pert_order"]:
@@ -136,3 +254,255 @@ class ImpuritySolver:
         if params["n_cycles"] == 0:
             results = {"average_sign": 0}
         return results
+
+
+class HubbardISolver:
+    """
+    Hubbard-I approximation, a cheap approximate solver for the first loops with the interface
+    of ImpuritySolver: the self-energy is the one of the isolated impurity, i.e. of the atomic
+    diagonalization of h_int and the local levels of the Weiss field
+    """
+    is_stochastic = False
+    init_parameters = []
+
+    def __init__(self, beta, gf_struct, n_iw, *args, **kwargs):
+        self.gf_struct = gf_struct
+        self.beta = beta
+        self.n_iw = n_iw
+        self.run_parameters = {}
+        self.blocknames = [bn[0] for bn in gf_struct]
+        self.blocksizes = [len(b[1]) for b in gf_struct]
+        self.atom = None
+
+    def _init_new_giw(self):
+        return MatsubaraGreensFunction(self.blocknames, self.blocksizes, self.beta, self.n_iw)
+
+    def run(self, weiss_field, hamiltonian, loop_nr, **run_parameters):
+        self.g0_iw = self._init_new_giw()
+        self.g0_iw << weiss_field
+        h = hamiltonian if isinstance(
+            hamiltonian, Operator) else hamiltonian.get_h_int()
+        self.run_parameters["h_int"] = h
+        self.run_parameters.update(run_parameters)
+        levels = get_local_levels(self.g0_iw)
+        h_loc = Operator() + h
+        for bn, inds in self.gf_struct:
+            for (i_pos, i), (j_pos, j) in itt.product(enumerate(inds), enumerate(inds)):
+                h_loc += levels[bn][i_pos, j_pos] * CDag(bn, i) * C(bn, j)
+        self.atom = AtomDiag(h_loc, [(bn, i) for bn, inds in self.gf_struct for i in inds])
+        g_atom = atomic_g_iw(self.atom, self.beta, self.gf_struct, self.n_iw)
+        self.se = self._init_new_giw()
+        self.g_iw = self._init_new_giw()
+        for bn, b in self.se:
+            b << iOmega_n - levels[bn] - inverse(g_atom[bn])
+            self.g_iw[bn] << inverse(inverse(self.g0_iw[bn]) - b)
+
+    def get_g_iw(self, *args, **kwargs):
+        return self.g_iw
+
+    def get_se(self, *args, **kwargs):
+        return self.se
+
+    def get_results(self):
+        return {"g0_iw": self.g0_iw.get_as_BlockGf(),
+                "h_loc_diagonalization": self.atom,
+                "density_matrix": atomic_density_matrix(self.atom, self.beta),
+                "average_sign": 1,
+                "approximate_solver": "hubbard_i"}
+
+
+class EDSolver:
+    """
+    exact diagonalization of the impurity coupled to n_bath_sites bath sites per block, whose
+    energies and real hybridizations are fitted to the Weiss field on the Matsubara frequencies
+    below omega_fit (default all). Free of noise, but feasible for few orbitals only. Fits with
+    an rms residual above max_bath_fit_error are reported.
+    """
+    is_stochastic = False
+    init_parameters = ["n_bath_sites", "omega_fit", "max_bath_fit_error"]
+
+    def __init__(self, beta, gf_struct, n_iw, n_bath_sites=4, omega_fit=None, max_bath_fit_error=1e-2):
+        self.gf_struct = gf_struct
+        self.beta = beta
+        self.n_iw = n_iw
+        self.n_bath_sites = n_bath_sites
+        self.omega_fit = omega_fit
+        self.max_bath_fit_error = max_bath_fit_error
+        self.run_parameters = {}
+        self.blocknames = [bn[0] for bn in gf_struct]
+        self.blocksizes = [len(b[1]) for b in gf_struct]
+        self.bath = {}
+        self.fit_errors = {}
+        self.atom = None
+
+    def _init_new_giw(self):
+        return MatsubaraGreensFunction(self.blocknames, self.blocksizes, self.beta, self.n_iw)
+
+    def run(self, weiss_field, hamiltonian, loop_nr, **run_parameters):
+        self.g0_iw = self._init_new_giw()
+        self.g0_iw << weiss_field
+        h = hamiltonian if isinstance(
+            hamiltonian, Operator) else hamiltonian.get_h_int()
+        self.run_parameters["h_int"] = h
+        self.run_parameters.update(run_parameters)
+        levels = get_local_levels(self.g0_iw)
+        iw = 1j * (2 * np.arange(self.n_iw) + 1) * np.pi / self.beta
+        if self.omega_fit is not None:
+            iw = iw[iw.imag <= self.omega_fit]
+        fops = [(bn, i) for bn, inds in self.gf_struct for i in inds]
+        h_imp = Operator() + h
+        for bn, inds in self.gf_struct:
+            data = self.g0_iw[bn].data[self.n_iw:self.n_iw + len(iw)]
+            delta = iw[:, None, None] * np.identity(len(inds)) - levels[bn] - np.linalg.inv(data)
+            energies, hybridizations, self.fit_errors[bn] = fit_bath(
+                iw, delta, self.n_bath_sites, self.bath.get(bn))
+            self.bath[bn] = (energies, hybridizations)
+            if self.max_bath_fit_error is not None and self.fit_errors[bn] > self.max_bath_fit_error and mpi.is_master_node():
+                print "warning: bath fit error", self.fit_errors[bn], "of block", bn, "exceeds", self.max_bath_fit_error, "consider more bath sites"
+            bath = bn+"_bath"
+            fops += [(bath, k) for k in range(self.n_bath_sites)]
+            for (i_pos, i), (j_pos, j) in itt.product(enumerate(inds), enumerate(inds)):
+                h_imp += levels[bn][i_pos, j_pos] * CDag(bn, i) * C(bn, j)
+            for k in range(self.n_bath_sites):
+                h_imp += energies[k] * CDag(bath, k) * C(bath, k)
+                for i_pos, i in enumerate(inds):
+                    h_imp += hybridizations[k, i_pos] * (CDag(bn, i) * C(bath, k) + CDag(bath, k) * C(bn, i))
+        self.atom = AtomDiag(h_imp, fops)
+        g_atom = atomic_g_iw(self.atom, self.beta, self.gf_struct, self.n_iw)
+        iw_mesh = 1j * (2 * np.arange(-self.n_iw, self.n_iw) + 1) * np.pi / self.beta
+        self.g_iw = self._init_new_giw()
+        self.se = self._init_new_giw()
+        for bn, b in self.se:
+            energies, hybridizations = self.bath[bn]
+            g0_inv = (iw_mesh[:, None, None] * np.identity(b.data.shape[1]) - levels[bn]
+                      - get_hybridization(iw_mesh, energies, hybridizations))
+            self.g_iw[bn].data[:, :, :] = g_atom[bn].data
+            b.data[:, :, :] = g0_inv - np.linalg.inv(g_atom[bn].data)
+
+    def get_g_iw(self, *args, **kwargs):
+        return self.g_iw
+
+    def get_se(self, *args, **kwargs):
+        return self.se
+
+    def get_results(self):
+        return {"g0_iw": self.g0_iw.get_as_BlockGf(),
+                "bath_parameters": dict([(bn, {"energies": e, "hybridizations": v})
+                                         for bn, (e, v) in self.bath.items()]),
+                "bath_fit_error": max(self.fit_errors.values()),
+                "average_sign": 1}
+
+
+def make_solver(parameters, beta, gf_struct, n_iw):
+    """
+    the solver backend of the parameter solver (default cthyb) initialized with the parameters
+    it needs
+    """
+    name = parameters["solver"] or "cthyb"
+    assert name in solvers.keys(), "solver must be one of "+str(solvers.keys())
+    backend = solvers[name]
+    return backend(beta, gf_struct, n_iw, **dict([(par, parameters[par]) for par in backend.init_parameters]))
+
+
+def fit_bath(iw, delta, n_bath_sites, start=None):
+    """
+    the energies e_k and real hybridizations V_ki of Delta_ij(iw) = sum_k V_ki V_kj / (iw - e_k)
+    fitted to delta (frequency, i, j) by least squares and the rms of the residual
+    start: (energies, hybridizations) to start from, e.g. the fit of the previous loop
+    """
+    n_orbs = delta.shape[1]
+    if start is None:
+        moment = np.maximum(np.diag((iw[-1] * delta[-1]).real), 1e-4)
+        scale = np.sqrt(np.mean(moment))
+        start = (np.linspace(-2 * scale, 2 * scale, n_bath_sites),
+                 np.tile(np.sqrt(moment / n_bath_sites), (n_bath_sites, 1)))
+
+    def get_residual(x):
+        residual = (get_hybridization(iw, x[:n_bath_sites], x[n_bath_sites:].reshape(n_bath_sites, n_orbs))
+                    - delta).ravel()
+        return np.concatenate([residual.real, residual.imag])
+    result = least_squares(get_residual, np.concatenate([start[0], start[1].ravel()]))
+    energies, hybridizations = result.x[:n_bath_sites], result.x[n_bath_sites:].reshape(n_bath_sites, n_orbs)
+    return energies, hybridizations, np.sqrt(np.mean(result.fun**2))
+
+
+def get_hybridization(iw, energies, hybridizations):
+    """
+    sum_k V_ki V_kj / (iw - e_k) with the axes frequency, i, j
+    """
+    return np.einsum('ki,kj,nk->nij', hybridizations, hybridizations, 1. / (iw[:, None] - energies[None, :]))
+
+
+def get_local_levels(weiss_field):
+    """
+    the hermitian part of the local levels e of G0^-1(iw) = iw - e - Delta(iw) per block at the
+    largest Matsubara frequency, where the hybridization has decayed
+    """
+    levels = {}
+    for bn, b in weiss_field:
+        iw_max = 1j * (2 * (len(b.mesh) // 2 - 1) + 1) * np.pi / b.mesh.beta
+        e = iw_max * np.identity(b.data.shape[1]) - np.linalg.inv(b.data[-1])
+        levels[bn] = .5 * (e + e.conj().T)
+    return levels
+
+
+solvers = {"cthyb": ImpuritySolver, "hubbard_i": HubbardISolver, "ed": EDSolver}
+
+
+def estimate_legendre_noise(data, n_tail=None):
+    """
+    a heuristic for the Monte Carlo noise of Legendre coefficients (l, i, j): the rms of the
+    last n_tail (default a third) of them, where the coefficients of G should have decayed.
+    The solver reduces the measurements of the ranks, i.e. there are no bins to estimate the
+    error from. If n_l is too small for G_l to decay, e.g. at low temperature, the tail holds
+    signal and the noise is overestimated.
+    """
+    if n_tail is None:
+        n_tail = max(data.shape[0] // 3, 2)
+    return np.sqrt(np.mean(np.absolute(data[-n_tail:])**2, axis=0))
+
+
+def estimate_legendre_noise_from_tau(data, beta):
+    """
+    the noise of Legendre coefficients (i, j) from the noise of the binned measurement of
+    G(tau) (tau, i, j). G is smooth on the scale of the bins, so the noise sigma per bin is
+    estimated from the second differences, which have the variance 6 sigma^2. Projected onto
+    G_l = sqrt(2l+1) int dtau P_l(x(tau)) G(tau) white noise gives sigma beta / sqrt(n_tau - 1)
+    for every l. The edge bins are half bins and not used.
+    """
+    d2 = data[3:-1] - 2 * data[2:-2] + data[1:-3]
+    sigma = np.sqrt(np.mean(np.absolute(d2)**2, axis=0) / 6.)
+    return sigma * beta / np.sqrt(data.shape[0] - 1)
+
+
+def get_legendre_cutoff(data, noise, noise_factor=3, n_min=4):
+    """
+    the number of leading Legendre coefficients (l, i, j) to keep: the coefficients after the
+    last pair l, l + 1 whose rms in units of the noise (i, j) exceeds noise_factor are taken as
+    noise. Pairs are compared, since symmetries can cancel every other coefficient. At least
+    n_min are kept.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.where(noise > 0, np.absolute(data) / noise, np.where(data != 0, np.inf, 0))
+    chi2 = np.mean(ratios.reshape(data.shape[0], -1)**2, axis=1)
+    significant = np.sqrt(.5 * (chi2[:-1] + chi2[1:])) > noise_factor
+    indices = np.nonzero(significant)[0]
+    n_keep = indices[-1] + 2 if len(indices) > 0 else 0
+    return int(min(max(n_keep, n_min), data.shape[0]))
+
+
+def get_matsubara_errors(noise, n_l, n_omega):
+    """
+    the errors (frequency, i, j) of G(iw_n) = sum_l T_nl G_l, 0 <= n < n_omega, for independent
+    errors noise (i, j) of the n_l coefficients
+    """
+    t = legendre_to_matsubara_matrix(0, n_omega, n_l)
+    return np.sqrt(np.sum(np.absolute(t)**2, axis=1))[:, None, None] * noise[None, :, :]
+
+
+def get_density_error(noise, n_l, beta):
+    """
+    the error of the density of the diagonal elements of noise from
+    n = -G(beta) = -sum_l sqrt(2l+1) G_l / beta
+    """
+    return np.sqrt(np.sum(np.diag(noise)**2) * np.sum(2 * np.arange(n_l) + 1.)) / beta
@@ -0,0 +1,129 @@
+import numpy as np
+from collections import deque
+
+
+class AndersonMixer:
+    """
+    Anderson (Pulay) mixing of the input x_in and the output x_out of flattened arrays using
+    the residuals x_out - x_in of the last history loops. The step is linear, i.e.
+    x_in + coeff * (x_out - x_in) as MatsubaraGreensFunction.mix, and the history is restarted,
+    if the rms of the residual is below noise, e.g. the Monte Carlo noise, or if it grew since
+    the last loop, because then the history extrapolates noise. Cycle sets noise to the
+    propagated error estimate of the solver if that is larger.
+    """
+
+    def __init__(self, coeff=1, history=5, noise=0):
+        self.coeff = 1 if coeff is None else coeff
+        self.accelerated = False
+        self.noise = 0 if noise is None else noise
+        self.x_in = deque(maxlen=history + 1)
+        self.residuals = deque(maxlen=history + 1)
+
+    def __call__(self, x_in, x_out):
+        residual = x_out - x_in
+        if self.is_noise_dominated(residual):
+            self.reset()
+        self.append(x_in, residual)
+        self.accelerated = len(self.residuals) > 1
+        if not self.accelerated:
+            return x_in + self.coeff * residual
+        dx = np.array([x2 - x1 for x1, x2 in zip(list(self.x_in)[:-1], list(self.x_in)[1:])]).T
+        df = np.array([f2 - f1 for f1, f2 in zip(list(self.residuals)[:-1], list(self.residuals)[1:])]).T
+        gamma = self._solve(_as_real(df), _as_real(residual))
+        return x_in + self.coeff * residual - (dx + self.coeff * df).dot(gamma)
+
+    def _solve(self, df, residual):
+        return np.linalg.lstsq(df, residual, rcond=None)[0]
+
+    def append(self, x_in, residual):
+        self.x_in.append(np.array(x_in))
+        self.residuals.append(np.array(residual))
+
+    def reset(self):
+        self.x_in.clear()
+        self.residuals.clear()
+
+    def is_noise_dominated(self, residual):
+        rms = get_rms(residual)
+        if rms <= self.noise:
+            return True
+        return len(self.residuals) > 0 and rms > get_rms(self.residuals[-1])
+
+    def get_residual(self):
+        return self.residuals[-1]
+
+    def seed(self, storage):
+        """
+        restores the history from the residuals and self-energies of the last loops of storage
+        """
+        self.reset()
+        n_loops = min(storage.get_completed_loops() - 1, self.residuals.maxlen)
+        for loop in range(-n_loops, 0):
+            residual = storage.load("mixer_residual", loop)
+            if residual is None:
+                self.reset()
+                continue
+            self.append(flatten(storage.load("se_imp_iw", loop - 1)), residual)
+
+
+class BroydenMixer(AndersonMixer):
+    """
+    modified Broyden mixing (D. D. Johnson, PRB 38, 12807), i.e. Anderson mixing with
+    normalized residual differences and the regularization w0
+    """
+
+    def __init__(self, coeff=1, history=5, noise=0, w0=.01):
+        AndersonMixer.__init__(self, coeff, history, noise)
+        self.w0 = w0
+
+    def _solve(self, df, residual):
+        norms = np.sqrt(np.sum(df**2, axis=0))
+        df = df / norms
+        a = df.T.dot(df) + self.w0**2 * np.identity(df.shape[1])
+        return np.linalg.solve(a, df.T.dot(residual)) / norms
+
+
+def make_mixer(parameters):
+    """
+    the mixer of the parameters mixer, mix, mixer_history and mixer_noise, None for linear
+    mixing, which MatsubaraGreensFunction.mix does
+    """
+    name = parameters["mixer"]
+    if name in [None, "linear"]:
+        return None
+    assert name in mixers.keys(), "mixer must be one of "+str(["linear"] + mixers.keys())
+    return mixers[name](parameters["mix"], parameters["mixer_history"], parameters["mixer_noise"])
+
+
+def flatten(g):
+    """
+    the data of all blocks of a BlockGf (or a list of block arrays) as one array
+    """
+    if isinstance(g, list):
+        return np.concatenate([data.ravel() for data in g])
+    return np.concatenate([b.data.ravel() for bn, b in g])
+
+
+def unflatten(x, g):
+    """
+    writes the array x of flatten into the blocks of g
+    """
+    i = 0
+    for bn, b in g:
+        b.data[:, :, :] = x[i:i + b.data.size].reshape(b.data.shape)
+        i += b.data.size
+
+
+def get_rms(x):
+    return np.sqrt(np.mean(np.absolute(x)**2))
+
+
+def _as_real(x):
+    """
+    complex vectors as real vectors of twice the length, such that the mixing coefficients
+    are real
+    """
+    return np.concatenate([x.real, x.imag]) if np.iscomplexobj(x) else x
+
+
+mixers = {"anderson": AndersonMixer, "broyden": BroydenMixer}
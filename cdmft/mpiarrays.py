@@ -0,0 +1,155 @@
+import os
+import uuid
+import tempfile
+import numpy as np
+from mpi4py import MPI
+from pytriqs.gf import Gf, BlockGf, GfImFreq, GfImTime, GfLegendre, MeshImFreq, MeshImTime, MeshLegendre
+
+
+def bcast(obj, root=0, shared=False, comm=None):
+    """
+    broadcasts like mpi.bcast, but numpy arrays and (Block)Gfs on Matsubara, imaginary time and
+    Legendre meshes are not pickled. Their structure is sent once, the receivers allocate them
+    and the data arrays are broadcasted as buffers. Other objects are pickled.
+    shared: numpy arrays are shared read-only by the ranks of a node, see bcast_shared
+    comm: default MPI.COMM_WORLD
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    if comm.size == 1:
+        return obj
+    header = None
+    if comm.rank == root:
+        header = get_header(obj)
+    header = comm.bcast(header, root=root)
+    if header is None:
+        return comm.bcast(obj, root=root)
+    if shared and header[0] == "ndarray" and root == 0:
+        return bcast_shared(obj, comm=comm)
+    if comm.rank != root:
+        obj = allocate(header)
+    for array, (shape, dtype) in zip(get_arrays(obj), get_array_headers(header)):
+        _bcast_array(comm, array, shape, dtype, root)
+    return obj
+
+
+def get_header(obj):
+    """
+    the structure of obj that allocate needs, None for objects that are to be pickled
+    """
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in 'biufc':
+        return ("ndarray", obj.shape, obj.dtype.str)
+    if type(obj) == BlockGf:
+        blocks = [(bn, get_header(b)) for bn, b in obj]
+        if any([h is None for bn, h in blocks]):
+            return None
+        return ("BlockGf", blocks)
+    if not isinstance(obj, Gf):
+        return None
+    for kind, (mesh_type, gf_type) in _gf_types.items():
+        if isinstance(obj.mesh, mesh_type):
+            mesh = obj.mesh
+            n_points = len(mesh) // 2 if mesh_type == MeshImFreq else len(mesh)
+            return (kind, [i for i in obj.indices], mesh.beta, getattr(mesh, "statistic", "Fermion"),
+                    n_points, obj.data.shape, obj.data.dtype.str)
+    return None
+
+
+def allocate(header):
+    if header[0] == "ndarray":
+        return np.empty(header[1], dtype=header[2])
+    if header[0] == "BlockGf":
+        return BlockGf(name_list=[bn for bn, h in header[1]],
+                       block_list=[allocate(h) for bn, h in header[1]], make_copies=False)
+    kind, indices, beta, statistic, n_points = header[:5]
+    return _gf_types[kind][1](indices=indices, beta=beta, statistic=statistic, n_points=n_points)
+
+
+def get_arrays(obj):
+    if isinstance(obj, np.ndarray):
+        return [obj]
+    if isinstance(obj, BlockGf):
+        return [b.data for bn, b in obj]
+    return [obj.data]
+
+
+def get_array_headers(header):
+    if header[0] == "ndarray":
+        return [(header[1], header[2])]
+    if header[0] == "BlockGf":
+        return [h[5:7] for bn, h in header[1]]
+    return [header[5:7]]
+
+
+def _bcast_array(comm, array, shape, dtype, root):
+    """
+    broadcasts into array directly if it is a contiguous writeable buffer of the sent layout
+    """
+    assert tuple(array.shape) == tuple(shape), "allocated array doesn't match the broadcasted one"
+    if array.flags.c_contiguous and array.flags.writeable and array.dtype.str == dtype:
+        comm.Bcast(array, root=root)
+    else:
+        buf = np.ascontiguousarray(array, dtype=dtype) if comm.rank == root else np.empty(shape, dtype=dtype)
+        comm.Bcast(buf, root=root)
+        if comm.rank != root:
+            array[...] = buf
+
+
+def bcast_shared(array, directory=None, comm=None):
+    """
+    broadcasts a numpy array from rank 0 such that all ranks of a node share one copy: it is sent to
+    one rank per node, which writes it into a memory-mapped file in directory (default /dev/shm),
+    the other ranks of the node map that file. The file is unlinked once all have mapped it,
+    the memory is released with the last reference. All ranks get read-only arrays.
+    comm: default MPI.COMM_WORLD
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    if comm.size == 1:
+        return array
+    node_comm, leaders_comm = _get_node_comms(comm)
+    header, file_name = None, None
+    if comm.rank == 0:
+        header, file_name = (array.shape, array.dtype.str), _get_node_file_name(directory)
+    header, file_name = comm.bcast((header, file_name), root=0)
+    file_name += "_"+MPI.Get_processor_name()+".npy"
+    if leaders_comm != MPI.COMM_NULL:
+        shared = np.lib.format.open_memmap(file_name, mode='w+', dtype=header[1], shape=header[0])
+        if comm.rank == 0:
+            shared[...] = array
+        leaders_comm.Bcast(shared, root=0)
+        shared.flush()
+    node_comm.Barrier()
+    if leaders_comm == MPI.COMM_NULL:
+        shared = np.load(file_name, mmap_mode='r')
+    node_comm.Barrier()
+    if leaders_comm != MPI.COMM_NULL:
+        os.remove(file_name)
+        shared = shared.view()
+        shared.flags.writeable = False
+    return shared
+
+
+def _get_node_comms(comm):
+    """
+    the ranks of a node and the first rank of every node, rank 0 leads its node. They are
+    created once per communicator, which has to live as long as the process, e.g. COMM_WORLD
+    """
+    if id(comm) not in _node_comms:
+        node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED, key=comm.rank)
+        leaders_comm = comm.Split(0 if node_comm.rank == 0 else MPI.UNDEFINED, key=comm.rank)
+        _node_comms[id(comm)] = (node_comm, leaders_comm)
+    return _node_comms[id(comm)]
+
+
+def _get_node_file_name(directory):
+    if directory is None:
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "cdmft_"+uuid.uuid4().hex)
+
+
+_node_comms = {}
+
+_gf_types = {"ImFreq": (MeshImFreq, GfImFreq),
+             "ImTime": (MeshImTime, GfImTime),
+             "Legendre": (MeshLegendre, GfLegendre)}
@@ -10,7 +10,7 @@ class DMFTParameters:
     def __init__(self, parameter_dict={}, **kwargs):
         self.solver_run = ["n_cycles", "partition_method", "quantum_numbers", "length_cycle", "n_warmup_cycles", "random_name", "max_time", "verbosity", "move_shift", "move_double", "use_trace_estimator", "measure_G_tau", "measure_G_l", "measure_pert_order",
                            "measure_density_matrix", "use_norm_as_weight", "performance_analysis", "proposal_prob", "imag_threshold", "perform_post_proc", "perform_tail_fit", "fit_min_n", "fit_max_n", "fit_min_w", "fit_max_w", "fit_max_moment", "move_global", "move_global_prob"]
-        all_parameternames = ["beta", "n_iw", "n_tau", "n_l", "mix", "make_g0_tau_real", "filling",
+        all_parameternames = ["beta", "n_iw", "n_tau", "n_l", "mix", "mixer", "mixer_history", "mixer_noise", "n_warmup_loops", "solver", "n_bath_sites", "omega_fit", "max_bath_fit_error", "legendre_noise_factor", "make_g0_tau_real", "filling",
                               "block_symmetries", "dmu_max", "squeeze_dmu_max", "dmu_max_squeeze_factor"] + self.solver_run
         measure_g2_parameters = ["measure_g2_inu", "measure_g2_legendre", "measure_g2_pp", "measure_g2_ph",
                                  "measure_g2_block_order", "measure_g2_n_iw", "measure_g2_n_inu", "measure_g2_n_l", "measure_g_pp_tau", "measure_g2_blocks"]
@@ -127,6 +127,15 @@ class DefaultDMFTParameters(DMFTParameters):
                    "n_tau": 10001,
                    "n_l": 30,
                    "mix": 1,
+                   "mixer": "linear",  # "anderson", "broyden"
+                   "mixer_history": 5,
+                   "mixer_noise": 0,
+                   "n_warmup_loops": 0,  # loops solved by Hubbard-I
+                   "solver": "cthyb",  # "ed", "hubbard_i"
+                   "n_bath_sites": 4,  # per block, ed only
+                   "omega_fit": None,  # ed only, fits the bath below this Matsubara frequency, default all
+                   "max_bath_fit_error": 1e-2,  # ed only, warns if the bath fit is worse
+                   "legendre_noise_factor": None,  # e.g. 3 cuts G_l where it is noise
                    "make_g0_tau_real": False,
                    "filling": None,
                    "block_symmetries": [],
@@ -186,6 +195,15 @@ class MeasureG2DMFTParameters(DMFTParameters):
                    "n_tau": 10001,
                    "n_l": 30,
                    "mix": 1,
+                   "mixer": "linear",  # "anderson", "broyden"
+                   "mixer_history": 5,
+                   "mixer_noise": 0,
+                   "n_warmup_loops": 0,  # loops solved by Hubbard-I
+                   "solver": "cthyb",  # "ed", "hubbard_i"
+                   "n_bath_sites": 4,  # per block, ed only
+                   "omega_fit": None,  # ed only, fits the bath below this Matsubara frequency, default all
+                   "max_bath_fit_error": 1e-2,  # ed only, warns if the bath fit is worse
+                   "legendre_noise_factor": None,  # e.g. 3 cuts G_l where it is noise
                    "make_g0_tau_real": False,
                    "filling": None,
                    "block_symmetries": [],
@@ -241,6 +259,15 @@ class TestDMFTParameters(DMFTParameters):
                    "n_tau": 10001,
                    "n_l": 30,
                    "mix": 1,
+                   "mixer": "linear",  # "anderson", "broyden"
+                   "mixer_history": 5,
+                   "mixer_noise": 0,
+                   "n_warmup_loops": 0,  # loops solved by Hubbard-I
+                   "solver": "cthyb",  # "ed", "hubbard_i"
+                   "n_bath_sites": 4,  # per block, ed only
+                   "omega_fit": None,  # ed only, fits the bath below this Matsubara frequency, default all
+                   "max_bath_fit_error": 1e-2,  # ed only, warns if the bath fit is worse
+                   "legendre_noise_factor": None,  # e.g. 3 cuts G_l where it is noise
                    "make_g0_tau_real": False,
                    "filling": None,
                    "block_symmetries": [],
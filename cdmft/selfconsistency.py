@@ -1,9 +1,13 @@
 from mpi4py import MPI
+import numpy as np
+import itertools as itt
 from time import time
 
 from schemes.common import GLocalCommon
-from impuritysolver import ImpuritySolver
-from convergence import DMuMaxSqueezer
+from impuritysolver import HubbardISolver, make_solver
+from convergence import DMuMaxSqueezer, LoopHistory, get_orbital_data, get_static
+from mixing import make_mixer, flatten, unflatten
+from solvertuning import get_histogram_mean
 
 
 class Cycle:
@@ -20,9 +24,11 @@ class Cycle:
             if kwargkey in ['global_moves', 'quantum_numbers']:
                 p[kwargkey] = kwargs[kwargkey]
         self.storage = loopstorage
+        self.storage.repair()
         g0 = self.g0 = weiss_field
-        self.imp_solver = ImpuritySolver(
-            g0.mesh.beta, g0.gf_struct, g0.n_iw, p['n_tau'], p['n_l'])
+        self.imp_solver = self.main_solver = make_solver(
+            p, g0.mesh.beta, g0.gf_struct, g0.n_iw)
+        self.warmup_solver = None
         self.g_loc = g_local
         self.g_loc.filling = self.p['filling']
         self.g_loc.dmu_max = self.p['dmu_max']
@@ -32,31 +38,114 @@ class Cycle:
         self.mu = mu
         self.se = self_energy
         self.dmumaxsqueezer = DMuMaxSqueezer(self.g_loc, self.g_imp, par=p)
+        self.history = LoopHistory(latest_only=["se_imp_iw"])
+        self._history_is_seeded = False
+        self.mixer = make_mixer(p)
+        self.scheduler = None
+        self.tuner = None
 
     def add_convergence_criterion(self, criterion):
+        """
+        criteria with a history attribute read the loops from the history of the cycle
+        """
+        if hasattr(criterion, "history") and criterion.history is None:
+            criterion.history = self.history
+            self.history.resize(max(self.history.size, -min(criterion.loops)))
+            self._history_is_seeded = False
         self.convergence_criteria.append(criterion)
 
+    def set_tuner(self, tuner):
+        """
+        tuner adapts the solver parameters before every loop to the statistics of the last solve,
+        e.g. solvertuning.CTHYBTuner
+        """
+        self.tuner = tuner
+
+    def set_scheduler(self, scheduler):
+        """
+        scheduler decides n_cycles of every loop, e.g. solvertuning.CycleScheduler
+        """
+        self.scheduler = scheduler
+        self._history_is_seeded = False
+
     def run(self, n_loops, save_loops=True):
         """
         parameters are taken from initialization
         """
+        self.start_run()
         for i in range(n_loops):
+            if self.scheduler is not None and self.scheduler.is_exhausted():
+                self.report("Budget of solver cycles spent.")
+                break
             loop_nr = self.storage.get_completed_loops()
+            self.select_solver(loop_nr)
             self.report("DMFT loop nr. "+str(loop_nr)+":")
             self.start_time = time()
             self.mu = self.g_loc.set(self.se, self.mu)
             self.g0.calc_selfconsistency(self.g_loc, self.se, self.mu)
             self.prepare_impurity_run()
             self.imp_solver.run(self.g0, self.h_int,
-                                loop_nr, **self.p.run_solver())
+                                loop_nr, **self.get_solver_parameters())
             self.g_imp << self.imp_solver.get_g_iw()
             self.process_impurity_results()
+            self.update_history()
+            if self.scheduler is not None:
+                self.scheduler.update(self.get_n_cycles_done(), self.history)
             if save_loops:
                 self.save()
             self.report("Loop done.")
             if self.is_converged():
                 break
 
+    def start_run(self):
+        """
+        seeds the loop history from the archive once, e.g. on restart, the self-energy might
+        have been changed since the last run
+        """
+        if not self._history_is_seeded:
+            self.history.seed(self.storage, self.g_imp.n_iw)
+            if self.mixer is not None:
+                self.mixer.seed(self.storage)
+            if self.scheduler is not None:
+                self.scheduler.seed(self.storage)
+            self._history_is_seeded = True
+        self.history.drop("se_imp_iw")
+
+    def update_history(self):
+        quantities = {"g_loc_iw": get_orbital_data(self.g_loc), "g_imp_iw": get_orbital_data(self.g_imp),
+                      "g_imp_static": get_static(self.g_imp), "se_imp_iw": [b.data.copy() for bn, b in self.se]}
+        if self.has_error_estimates():
+            errors = self.imp_solver.get_g_iw_errors()
+            quantities["g_imp_iw_error"] = np.concatenate(
+                [errors[bn].reshape(errors[bn].shape[0], -1) for bn in self.g_imp.blocknames], axis=1)
+        self.history.append(**quantities)
+
+    def has_error_estimates(self):
+        return self.imp_solver.is_stochastic and self.p["measure_G_l"] and self.p["n_cycles"] > 0
+
+    def select_solver(self, loop_nr):
+        """
+        the loops of the archive before n_warmup_loops are solved in the Hubbard-I approximation,
+        the following by the solver of the parameters
+        """
+        if self.p["n_warmup_loops"] and loop_nr < self.p["n_warmup_loops"]:
+            if self.warmup_solver is None:
+                self.warmup_solver = HubbardISolver(self.g0.mesh.beta, self.g0.gf_struct, self.g0.n_iw)
+            self.imp_solver = self.warmup_solver
+        else:
+            self.imp_solver = self.main_solver
+
+    def get_n_cycles_done(self):
+        if not self.imp_solver.is_stochastic:
+            return 0
+        return self.imp_solver.run_parameters["n_cycles"]
+
+    def get_solver_parameters(self):
+        parameters = self.p.run_solver()
+        if self.scheduler is not None:
+            parameters["n_cycles"] = self.scheduler.get_n_cycles()
+        return parameters
+
     def is_converged(self):
         if len(self.convergence_criteria) == 0:
             iscon = False
@@ -78,26 +167,107 @@ class Cycle:
                         "mu": self.mu,
                         "density": self.g_imp.total_density(),
                         "loop_time": time() - self.start_time})
-        self.storage.save_loop(results)
+        summary = {"occupations": self.get_occupations(),
+                   "g_imp_static": self.get_g_imp_static()}
+        if self.has_error_estimates():
+            results["g_sol_l_error"] = self.imp_solver.get_g_l_errors()
+            results["density_error"] = summary["density_error"] = self.imp_solver.get_density_error()
+        if "legendre_cutoffs" in results:
+            summary["legendre_cutoffs"] = results["legendre_cutoffs"]
+        if self.scheduler is not None:
+            results["solver_schedule"] = self.scheduler.get_state()
+            summary["n_cycles"] = results["solver_schedule"]["n_cycles"]
+        if self.mixer is not None:
+            results["mixer_residual"] = self.mixer.get_residual()
+            summary["mixer_accelerated"] = self.mixer.accelerated
+        if "perturbation_order_total" in results.keys():
+            order = get_histogram_mean(results["perturbation_order_total"])
+            if order is not None:
+                summary["perturbation_order_mean"] = order
+        self.storage.save_loop(results, summary=summary)
         self.report_variable(average_sign=results["average_sign"],
                              density=results["density"],
                              loop_time=results["loop_time"])
 
+    def get_occupations(self):
+        """
+        static occupations of g_imp, the labels match Evaluation.get_g_static_diags
+        """
+        occupations = {}
+        for bn, b in self.g_imp:
+            for i in range(b.data.shape[1]):
+                occupations[bn+'_'+str(i)+str(i)] = b[i, i].density().real
+        return occupations
+
+    def get_g_imp_static(self):
+        """
+        all static elements of g_imp, the labels match Evaluation.get_g_static
+        """
+        static = {}
+        for bn, b in self.g_imp:
+            for i, j in itt.product(*[range(b.data.shape[1])] * 2):
+                static[bn+'_'+str(i)+str(j)] = b[i, j].density()
+        return static
+
     def process_impurity_results(self):
         """
         processes the impurity results on the level of the self-energy,
         updates g_imp accordingly
         """
         self.se << self.imp_solver.get_se()
-        self.se.mix(self.p["mix"])
+        if self.mixer is None:
+            self.se.mix(self.p["mix"], self.history.latest("se_imp_iw"))
+        else:
+            self.mix()
         self.se.symmetrize(self.p["block_symmetries"])
         self.g_imp.calc_dyson(self.g0, self.se)
         self.g_loc.dmu_max = self.dmumaxsqueezer(self.g_loc.dmu_max)
 
+    def mix(self):
+        """
+        accelerated mixing of the self-energy with the mixer of the parameters
+        """
+        se_in = self.history.latest("se_imp_iw")
+        if se_in is None:
+            se_in = self.se._gf_lastloop
+        if self.has_error_estimates():
+            self.mixer.noise = max(self.p["mixer_noise"], self.get_se_noise())
+        unflatten(self.mixer(flatten(se_in), flatten(self.se)), self.se)
+
+    def get_se_noise(self):
+        """
+        rms of the Monte Carlo error of the self-energy of the solver, propagated from the
+        errors of G_iw as independent errors by dSigma = G^-1 dG G^-1
+        """
+        errors = self.imp_solver.get_g_iw_errors()
+        variances = []
+        for bn, b in self.imp_solver.get_g_iw():
+            g_inv = np.absolute(np.linalg.inv(b.data[b.data.shape[0] // 2:]))**2
+            variances.append(np.einsum('wik,wkl,wlj->wij', g_inv, errors[bn]**2, g_inv).ravel())
+        return np.sqrt(np.mean(np.concatenate(variances)))
+
     def prepare_impurity_run(self):
         if self.p["make_g0_tau_real"]:
             self.g0.make_g_tau_real(self.p["n_tau"])
-        self.se.prepare_mix()
+        if self.tuner is not None and self.imp_solver.is_stochastic:
+            self.tune_solver()
+        if self.history.latest("se_imp_iw") is None:
+            self.se.prepare_mix()
+
+    def tune_solver(self):
+        """
+        the statistics are taken from the last solve of this run or else from the archive
+        """
+        if "n_cycles" in self.main_solver.run_parameters:
+            results = self.main_solver.get_results()
+            statistics = dict([(name, results.get(name)) for name in self.tuner.statistics])
+        elif self.storage.get_completed_loops() > 0:
+            statistics = dict([(name, self.storage.load(name, -1)) for name in self.tuner.statistics])
+        else:
+            return
+        for name, value in self.tuner(statistics, self.p).items():
+            self.report("tuning "+name+": "+str(self.p[name])+" -> "+str(value))
+            self.p[name] = value
 
     def report(self, text):
         comm = MPI.COMM_WORLD
@@ -119,17 +289,25 @@ class CycleCCDMFTG(Cycle):
         """
         parameters are taken from initialization
         """
+        self.start_run()
         for i in range(n_loops):
+            if self.scheduler is not None and self.scheduler.is_exhausted():
+                self.report("Budget of solver cycles spent.")
+                break
             loop_nr = self.storage.get_completed_loops()
+            self.select_solver(loop_nr)
             self.report("DMFT loop nr. "+str(loop_nr)+":")
             self.start_time = time()
             self.mu = self.g_loc.set(self.g_imp, self.mu)
             self.g0.calc_selfconsistency(self.g_loc, self.se, self.mu)
             self.prepare_impurity_run()
             self.imp_solver.run(self.g0, self.h_int,
-                                loop_nr, **self.p.run_solver())
+                                loop_nr, **self.get_solver_parameters())
             self.g_imp << self.imp_solver.get_g_iw()
             self.process_impurity_results()
+            self.update_history()
+            if self.scheduler is not None:
+                self.scheduler.update(self.get_n_cycles_done(), self.history)
             if save_loops:
                 self.save()
             self.report("Loop done.")
@@ -0,0 +1,143 @@
+import numpy as np
+
+
+class CycleScheduler:
+    """
+    schedules n_cycles of the impurity solver. It starts with cheap solves of n_cycles_start and
+    raises n_cycles as the change of g_imp between the last two loops approaches its Monte Carlo
+    error, such that the error, falling as 1/sqrt(n_cycles), becomes at most 1/target_ratio of
+    the change. n_cycles grows at most by factor_max per loop, up to n_cycles_max, and never
+    decreases. Once budget cycles (per rank, summed over the loops) are spent, Cycle.run stops.
+    n_omega: number of positive Matsubara frequencies of g_imp that are compared
+    """
+
+    def __init__(self, n_cycles_start, n_cycles_max, target_ratio=3, factor_max=4, budget=None, n_omega=30):
+        self.n_cycles = n_cycles_start
+        self.n_cycles_max = n_cycles_max
+        self.target_ratio = target_ratio
+        self.factor_max = factor_max
+        self.budget = budget
+        self.n_omega = n_omega
+        self.n_cycles_last = 0
+        self.n_cycles_total = 0
+        self.noise_ratio = np.nan
+
+    def get_n_cycles(self):
+        n_cycles = self.n_cycles
+        if self.budget is not None:
+            n_cycles = min(n_cycles, self.budget - self.n_cycles_total)
+        return int(n_cycles)
+
+    def is_exhausted(self):
+        return self.budget is not None and self.n_cycles_total >= self.budget
+
+    def update(self, n_cycles_done, history):
+        """
+        accounts for a solve of n_cycles_done and schedules the next one using g_imp_iw and
+        g_imp_iw_error of the LoopHistory
+        """
+        self.n_cycles_last = n_cycles_done
+        self.n_cycles_total += n_cycles_done
+        error = history.latest("g_imp_iw_error")
+        if error is None or len(history) < 2:
+            return
+        gimp = history.get("g_imp_iw", [-2, -1])[:, :self.n_omega]
+        self.noise_ratio = get_rms(gimp[1] - gimp[0]) / get_rms(error[:self.n_omega])
+        if self.noise_ratio < self.target_ratio:
+            factor = min((self.target_ratio / max(self.noise_ratio, 1e-10))**2, self.factor_max)
+            self.n_cycles = min(int(self.n_cycles * factor), self.n_cycles_max)
+
+    def get_state(self):
+        return {"n_cycles": self.n_cycles_last, "n_cycles_next": self.n_cycles,
+                "n_cycles_total": self.n_cycles_total, "noise_ratio": self.noise_ratio}
+
+    def seed(self, storage):
+        """
+        continues the schedule of the last loop of storage
+        """
+        if storage.get_completed_loops() == 0:
+            return
+        state = storage.load("solver_schedule", -1)
+        if state is not None:
+            self.n_cycles = state["n_cycles_next"]
+            self.n_cycles_total = state["n_cycles_total"]
+
+
+def get_rms(x):
+    return np.sqrt(np.mean(np.absolute(x)**2))
+
+
+class CTHYBTuner:
+    """
+    derives the CTHYB parameters of the next solve from the statistics of the last one, which
+    needs measure_pert_order and performance_analysis:
+    length_cycle: length_cycle_factor times the mean perturbation order, such that a cycle
+    decorrelates the configuration
+    n_warmup_cycles: warmup_factor times the accepted insertions needed to build a configuration of
+    the mean perturbation order, in cycles
+    move_shift: off if less than min_shift_acceptance of the shift moves are accepted
+    move_double: on if less than max_insert_acceptance of the insertions are accepted
+    The tuner only switches move_double on, never off again. The autocorrelation of the
+    measurements is not measured, length_cycle is a heuristic from the perturbation order only.
+    """
+    statistics = ["perturbation_order_total", "performance_analysis"]
+
+    def __init__(self, length_cycle_factor=2, length_cycle_limits=(10, 500), warmup_factor=10,
+                 n_warmup_cycles_limits=(1000, 10**5), min_shift_acceptance=.01, max_insert_acceptance=.05):
+        self.length_cycle_factor = length_cycle_factor
+        self.length_cycle_limits = length_cycle_limits
+        self.warmup_factor = warmup_factor
+        self.n_warmup_cycles_limits = n_warmup_cycles_limits
+        self.min_shift_acceptance = min_shift_acceptance
+        self.max_insert_acceptance = max_insert_acceptance
+
+    def __call__(self, statistics, parameters):
+        """
+        the changed parameters as dict, statistics contains the results of the last solve
+        """
+        changes = {}
+        order = None
+        if statistics.get("perturbation_order_total") is not None:
+            order = get_histogram_mean(statistics["perturbation_order_total"])
+        if order is not None:
+            changes["length_cycle"] = int(np.clip(round(self.length_cycle_factor * order),
+                                                  *self.length_cycle_limits))
+        rates = {}
+        if statistics.get("performance_analysis") is not None:
+            rates = get_acceptance_rates(statistics["performance_analysis"])
+        if "shift" in rates:
+            changes["move_shift"] = bool(rates["shift"] >= self.min_shift_acceptance)
+        if "insert" in rates:
+            if rates["insert"] < self.max_insert_acceptance:
+                changes["move_double"] = True
+            if order is not None:
+                moves = self.warmup_factor * order / max(rates["insert"], 1e-3)
+                changes["n_warmup_cycles"] = int(np.clip(moves / changes["length_cycle"],
+                                                         *self.n_warmup_cycles_limits))
+        return dict([(name, value) for name, value in changes.items() if parameters[name] != value])
+
+
+def get_histogram_mean(histogram):
+    """
+    the mean of a triqs histogram, e.g. the mean perturbation order, None if it is empty
+    """
+    n = np.sum(histogram.data)
+    if n == 0:
+        return None
+    orders = np.arange(histogram.limits[0], histogram.limits[1] + 1)
+    return np.sum(orders * histogram.data) / float(n)
+
+
+def get_acceptance_rates(performance_analysis):
+    """
+    accepted over proposed moves per kind of move, e.g. insert, remove, shift, from the histograms
+    <move>_length_proposed<suffix> and <move>_length_accepted<suffix> of performance_analysis
+    """
+    counts = {"_length_proposed": {}, "_length_accepted": {}}
+    for name, histogram in performance_analysis.items():
+        for kind, kind_counts in counts.items():
+            if kind in name:
+                move = name.split(kind)[0]
+                kind_counts[move] = kind_counts.get(move, 0) + np.sum(histogram.data)
+    return dict([(move, counts["_length_accepted"].get(move, 0) / float(n_proposed))
+                 for move, n_proposed in counts["_length_proposed"].items() if n_proposed > 0])
@@ -9,6 +9,11 @@ from test_impuritysolver import TestImpuritySolver
 from test_hubbard import TestHubbard
 from test_kanamori import TestKanamori
 from test_h5interface import TestStorage
+from test_h5reader import TestArchiveReader
+from test_catalog import TestCatalog
+from test_evaluation import TestEvaluation
+from test_densitymatrix import TestDensityMatrix
+from test_mpiarrays import TestMPIArrays
 from test_transformation import TestTransformation
 from test_schemescommon import TestSchemesCommon
 from test_schemesbethe import TestSchemesBethe
@@ -18,6 +23,8 @@ from test_tightbinding import TestTightbinding
 from test_schemescdmft import TestSchemesCDMFT
 from test_setuphypercubic import TestSetupHypercubic
 from test_convergence import TestConvergence
+from test_mixing import TestMixing
+from test_solvertuning import TestSolverTuning
 from test_schemesccdmft import TestSchemesCCDMFT
 from test_schemespcdmft import TestSchemesPCDMFT
 from test_transformation2 import TestTransformation2
@@ -49,6 +56,14 @@ suite.addTest(TestImpuritySolver("test_ImpuritySolver_initialization"))
 suite.addTest(TestImpuritySolver("test_ImpuritySolver_run"))
 suite.addTest(TestImpuritySolver("test_ImpuritySolver_init_new_giw"))
 suite.addTest(TestImpuritySolver("test_ImpuritySolver_get_g_iw"))
+suite.addTest(TestImpuritySolver("test_ImpuritySolver_cached_results"))
+suite.addTest(TestImpuritySolver("test_ImpuritySolver_error_estimates"))
+suite.addTest(TestImpuritySolver("test_get_legendre_cutoff"))
+suite.addTest(TestImpuritySolver("test_estimate_legendre_noise_from_tau"))
+suite.addTest(TestImpuritySolver("test_HubbardISolver"))
+suite.addTest(TestImpuritySolver("test_approximate_solvers_index_labels"))
+suite.addTest(TestImpuritySolver("test_fit_bath"))
+suite.addTest(TestImpuritySolver("test_EDSolver"))
 suite.addTest(TestHubbard("test_HubbardSite"))
 suite.addTest(TestHubbard("test_HubbardPlaquetteMomentum"))
 suite.addTest(TestHubbard("test_HubbardPlaquetteMomentumNambu"))
@@ -58,6 +73,28 @@ suite.addTest(TestKanamori("test_KanamoriDimer"))
 suite.addTest(TestStorage("test_Storage_initialization"))
 suite.addTest(TestStorage("test_Storage_get_completed_loops"))
 suite.addTest(TestStorage("test_Storage_save_load_cut_merge"))
+suite.addTest(TestStorage("test_Storage_loop_index"))
+suite.addTest(TestStorage("test_Storage_load_slice"))
+suite.addTest(TestStorage("test_Storage_loop_summary"))
+suite.addTest(TestStorage("test_Storage_verify_repair"))
+suite.addTest(TestStorage("test_Storage_repair_interrupted_cut"))
+suite.addTest(TestStorage("test_Storage_read_only"))
+suite.addTest(TestStorage("test_Storage_compact_gfs"))
+suite.addTest(TestStorage("test_Storage_minimal"))
+suite.addTest(TestArchiveReader("test_ArchiveReader_load"))
+suite.addTest(TestArchiveReader("test_file_locking_retry_reads"))
+suite.addTest(TestCatalog("test_Catalog_update_query"))
+suite.addTest(TestEvaluation("test_Evaluation_memo"))
+suite.addTest(TestEvaluation("test_Evaluation_series"))
+suite.addTest(TestEvaluation("test_reduce_loops_ranks"))
+suite.addTest(TestEvaluation("test_Evaluation_partial_summary"))
+suite.addTest(TestEvaluation("test_Evaluation_density_matrix_blocks"))
+suite.addTest(TestDensityMatrix("test_StaticObservables"))
+suite.addTest(TestDensityMatrix("test_StaticObservables_atomic"))
+suite.addTest(TestMPIArrays("test_allocate_from_header"))
+suite.addTest(TestMPIArrays("test_bcast_shared"))
+suite.addTest(TestMPIArrays("test_bcast_ranks"))
+suite.addTest(TestMPIArrays("test_bcast_shared_ranks"))
 suite.addTest(TestTransformation("test_GfStructTransformationIndex"))
 suite.addTest(TestTransformation("test_MatrixTransformation"))
 suite.addTest(TestTransformation("test_InterfaceToBlockstructure"))
@@ -114,6 +151,15 @@ if extended:
 if extended:
     suite.addTest(TestSetupHypercubic("test_Cycle_run"))
 suite.addTest(TestConvergence("test_Criterion_init"))
+suite.addTest(TestConvergence("test_get_slopes"))
+suite.addTest(TestConvergence("test_LoopHistory"))
+suite.addTest(TestConvergence("test_Criterion_noise_limited"))
+suite.addTest(TestMixing("test_AndersonMixer"))
+suite.addTest(TestMixing("test_AndersonMixer_noise"))
+suite.addTest(TestMixing("test_make_mixer"))
+suite.addTest(TestSolverTuning("test_CycleScheduler"))
+suite.addTest(TestSolverTuning("test_CTHYBTuner"))
+suite.addTest(TestSolverTuning("test_CTHYBTuner_empty_histogram"))
 #  TODO
 # if extended:
 #    suite.addTest(TestConvergence("test_Criterion_applied"))
@@ -0,0 +1,30 @@
+import unittest, os
+from pytriqs.utility import mpi
+
+from cdmft.h5interface import Storage
+from cdmft.catalog import Catalog
+
+
+class TestCatalog(unittest.TestCase):
+
+    def test_Catalog_update_query(self):
+        for fname, beta, sign in [("test.h5", 10., .9), ("test2.h5", 40., .3)]:
+            sto = Storage(fname)
+            sto.save_loop({'beta': beta, 'average_sign': sign,
+                           'last_solve_parameters': {'n_cycles': 1000}})
+        if mpi.is_master_node():
+            cat = Catalog("test.sqlite")
+            self.assertEqual(len(cat.update(["test.h5", "test2.h5"])), 2)
+            self.assertEqual(len(cat.update(["test.h5", "test2.h5"])), 0)
+            self.assertEqual(cat.query("beta = ? and average_sign > ?", 10, .5), [os.path.abspath("test.h5")])
+            self.assertEqual(len(cat.query("solver_n_cycles = 1000 and n_loops = 1")), 2)
+            self.assertEqual(cat.get("test2.h5")["beta"], 40.)
+            cat._write_row("test3.h5", {"Beta": 20., "mtime": 0., "n_loops": 1, "U": 2., "u": 3.})
+            self.assertEqual(cat.query("beta = 20 and u = 2"), ["test3.h5"])
+            self.assertEqual(len(cat.columns()), len(set([c.lower() for c in cat.columns()])))
+            os.remove("test2.h5")
+            cat.update(["test.h5"])
+            self.assertEqual(len(cat.query()), 1)
+            cat.close()
+            os.remove("test.h5")
+            os.remove("test.sqlite")
@@ -1,6 +1,8 @@
 import unittest, os, numpy as np
 
-from cdmft.convergence import Criterion
+from scipy.stats import linregress
+
+from cdmft.convergence import Criterion, LoopHistory, get_slopes
 from cdmft.h5interface import Storage
 from cdmft.selfconsistency import Cycle
 from cdmft.setups.bethelattice import SingleBetheSetup
@@ -40,3 +42,37 @@ class TestConvergence(unittest.TestCase):
         cyc.run(20)
         self.assertTrue(sto.get_completed_loops() < 20)
         os.remove('test.h5')
+
+    def test_get_slopes(self):
+        loops = range(-8, 0)
+        y = np.random.rand(8, 5, 3)
+        slopes = get_slopes(loops, y)
+        self.assertEqual(slopes.shape, (5, 3))
+        self.assertAlmostEqual(slopes[2, 1], linregress(loops, y[:, 2, 1])[0])
+
+    def test_LoopHistory(self):
+        history = LoopHistory(size = 3, latest_only = ["se_imp_iw"])
+        for i in range(5):
+            history.append(g_imp_static = np.array([i, 2 * i]), se_imp_iw = i)
+        self.assertEqual(len(history), 3)
+        self.assertEqual(history.get("g_imp_static", [-2, -1])[:, 1].tolist(), [6, 8])
+        self.assertEqual(history.latest("se_imp_iw"), 4)
+        self.assertFalse("se_imp_iw" in history.entries[-2])
+        history.resize(4)
+        history.append(g_imp_static = np.array([5, 10]))
+        self.assertEqual(len(history), 4)
+        self.assertEqual(history.latest("se_imp_iw"), None)
+
+    def test_Criterion_noise_limited(self):
+        history = LoopHistory(size = 8)
+        random = np.random.RandomState(0)
+        for i in range(8):
+            gimp = np.ones((50, 4)) + .01 * random.randn(50, 4)
+            history.append(g_loc_iw = gimp + .01 * random.randn(50, 4), g_imp_iw = gimp,
+                           g_imp_static = np.ones(4), g_imp_iw_error = np.full((50, 4), .01))
+        sto = Storage('test.h5')
+        crit = Criterion(sto, verbose = False, history = history)
+        self.assertFalse(crit.confirms_convergence())
+        crit.noise_factor = 3
+        self.assertTrue(crit.confirms_convergence())
+        os.remove('test.h5')
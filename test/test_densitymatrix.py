@@ -0,0 +1,43 @@
+import unittest, os, numpy as np
+from pytriqs.utility import mpi
+from pytriqs.operators import n
+from pytriqs.atom_diag import AtomDiag, atomic_density_matrix, trace_rho_op
+from pytriqs.gf import BlockGf, GfImFreq
+
+from cdmft.h5interface import Storage
+from cdmft.evaluation.densitymatrix import StaticObservable, StaticObservables
+
+
+class TestDensityMatrix(unittest.TestCase):
+
+    def test_StaticObservables(self):
+        sto = Storage("test.h5")
+        atom = AtomDiag(2 * n('up', 0) * n('dn', 0) - .5 * (n('up', 0) + n('dn', 0)), [('up', 0), ('dn', 0)])
+        rhos = [atomic_density_matrix(atom, beta) for beta in [1, 10]]
+        for rho in rhos:
+            sto.save_loop({'h_loc_diagonalization': atom, 'density_matrix': rho})
+        ops = [n('up', 0), n('up', 0) * n('dn', 0)]
+        obs = StaticObservables(ops, sto, [0, -1])
+        values = obs.get_expectation_values()
+        for i_loop, rho in enumerate(rhos):
+            for i_op, op in enumerate(ops):
+                self.assertAlmostEqual(values[i_loop, i_op], trace_rho_op(rho, op, atom))
+        statewise = obs.get_expectation_values_statewise()
+        self.assertEqual(statewise.shape, (2, 4))
+        self.assertEqual(sorted(statewise[1]), [0, 0, 0, 1])
+        self.assertAlmostEqual(StaticObservable(ops[0], sto, 0).get_expectation_value(), values[0, 0])
+        if mpi.is_master_node(): os.remove("test.h5")
+
+    def test_StaticObservables_atomic(self):
+        sto = Storage("test.h5")
+        atom = AtomDiag(2 * n('up', 0) * n('dn', 0) - .5 * (n('up', 0) + n('dn', 0)), [('up', 0), ('dn', 0)])
+        for beta in [1, 10]:
+            g = BlockGf(name_list=['up'], block_list=[GfImFreq(indices=range(1), beta=beta, n_points=10)])
+            sto.save_loop({'h_loc_diagonalization': atom, 'g_loc_iw': g})
+        ops = [n('up', 0)]
+        values = StaticObservables(ops, sto, [0, 1], atomic=True).get_expectation_values()
+        for i_loop, beta in enumerate([1, 10]):
+            self.assertAlmostEqual(values[i_loop, 0], trace_rho_op(atomic_density_matrix(atom, beta), ops[0], atom))
+        values = StaticObservables(ops, sto, [0], atomic=True, beta=10).get_expectation_values()
+        self.assertAlmostEqual(values[0, 0], trace_rho_op(atomic_density_matrix(atom, 10), ops[0], atom))
+        if mpi.is_master_node(): os.remove("test.h5")
@@ -0,0 +1,86 @@
+import unittest, os, shutil, h5py, numpy as np
+from pytriqs.utility import mpi
+from pytriqs.gf import BlockGf, GfImFreq, SemiCircular
+
+from cdmft.h5interface import Storage
+from cdmft.evaluation.common import Evaluation, blocks_to_sparse, von_neumann_entropy, reduce_loops
+from test_mpiarrays import run_ranks
+
+
+class TestEvaluation(unittest.TestCase):
+
+    def test_Evaluation_memo(self):
+        sto = Storage("test.h5")
+        g = BlockGf(name_list=['up'], block_list=[GfImFreq(indices=range(2), beta=10, n_points=100)])
+        g['up'] << SemiCircular(1)
+        sto.save_loop({'g_loc_iw': g, 'g_imp_iw': g, 'density': 1.})
+        sto.save_loop({'density': .9})
+        ev = Evaluation(sto)
+        loaded = []
+        load = sto.load
+        sto.load = lambda *args: loaded.append(args[:2]) or load(*args)
+        self.assertEqual(ev.get_beta(0), 10)
+        self.assertEqual(ev.get_density(), .9)
+        self.assertEqual(ev.get_density(1), .9)
+        ev.get_g_static(0)
+        ev.get_g_static_blockdiags(0)
+        self.assertEqual(loaded, [('density', 1), ('g_imp_iw', 0)])
+        ev.memo_size = 2
+        ev.get_density(0)
+        ev.get_density(1)
+        ev.get_g_static(0)
+        self.assertEqual(loaded[2:], [('density', 0), ('density', 1), ('g_imp_iw', 0)])
+        self.assertEqual(len(ev._memo), 2)
+        if mpi.is_master_node(): os.remove("test.h5")
+
+    def test_Evaluation_series(self):
+        sto = Storage("test.h5")
+        for mu in [.1, .2, .3]:
+            sto.save_loop({'mu': mu})
+        ev = Evaluation(sto)
+        self.assertTrue(np.allclose(ev.series('mu', np.real), [.1, .2, .3]))
+        self.assertTrue(np.allclose(ev.series('mu', np.real, [-1, 0], cache_dir='series_cache'), [.3, .1]))
+        if mpi.is_master_node():
+            self.assertEqual(len(os.listdir('series_cache')), 1)
+            shutil.rmtree('series_cache')
+        if mpi.is_master_node(): os.remove("test.h5")
+
+    def test_reduce_loops_ranks(self):
+        loaded = [[], []]
+        def reduce_on_rank(comm):
+            load = lambda loop: loaded[comm.rank].append(loop) or .1 * loop
+            return reduce_loops(load, np.real, range(5), comm)
+        results = run_ranks(reduce_on_rank)
+        self.assertEqual(loaded, [[0, 2, 4], [1, 3]])
+        self.assertTrue(np.allclose(results[0], [0, .1, .2, .3, .4]))
+        self.assertTrue(results[1] is None)
+
+    def test_Evaluation_partial_summary(self):
+        sto = Storage("test.h5")
+        for mu in [.1, .2]:
+            sto.save_loop({'mu': mu, 'density': 1.})
+        if mpi.is_master_node():
+            with h5py.File("test.h5", 'a') as disk:
+                del disk["loop_summary"]
+        mpi.barrier()
+        sto.save_loop({'mu': .3, 'density': 1.})
+        self.assertTrue(np.isnan(sto.load_summary()['mu'][:2]).all())
+        summary = Evaluation(sto).get_summary()
+        self.assertTrue(np.allclose(summary['mu'], [.1, .2, .3]))
+        self.assertTrue(np.allclose(summary['density'], 1))
+        self.assertTrue(np.isnan(summary['loop_time']).all())
+        if mpi.is_master_node(): os.remove("test.h5")
+
+    def test_Evaluation_density_matrix_blocks(self):
+        class Atom:
+            full_hilbert_space_dim = 5
+            def flatten_block_index(self, i_block, i):
+                return [0, 1, 3][i_block] + i
+        blocks = [np.array([[.5]]), np.array([[.2, .1], [.1, .2]]), np.zeros([2, 2])]
+        rho = blocks_to_sparse(blocks, Atom()).toarray()
+        self.assertTrue(np.allclose(rho[1:3, 1:3], blocks[1]))
+        self.assertEqual(rho[0, 0], .5)
+        self.assertTrue(np.allclose(rho[3:, :], 0))
+        p = np.linalg.eigvalsh(rho)
+        p = p[p > 0]
+        self.assertTrue(np.allclose(von_neumann_entropy(blocks), -np.sum(p * np.log(p))))
@@ -1,5 +1,6 @@
-import unittest, os
+import unittest, os, h5py, numpy as np
 from pytriqs.utility import mpi
+from pytriqs.gf import BlockGf, GfImFreq, SemiCircular, inverse
 
 from cdmft.h5interface import Storage
 
@@ -35,3 +36,144 @@ class TestStorage(unittest.TestCase):
         self.assertEqual(sto.get_completed_loops(), 2)
         if mpi.is_master_node(): os.remove("test.h5")
         if mpi.is_master_node(): os.remove("test2.h5")
+
+    def test_Storage_loop_index(self):
+        sto = Storage("test.h5")
+        for l in range(4):
+            sto.save_loop({'l': l})
+        sto.cut_loop(1)
+        self.assertEqual(sto.get_completed_loops(), 3)
+        self.assertEqual(sto.load('l', 1), 2)
+        self.assertEqual(sto.load('l', -1), 3)
+        sto.reorder_loops([-1, 0, 1])
+        self.assertEqual(sto.load('l', 0), 3)
+        self.assertEqual(sto.load('l', -1), 2)
+        sto.save_loop({'l': 4})
+        self.assertEqual(sto.load('l'), 4)
+        sto2 = Storage("test2.h5")
+        sto2.save_loop({'l': 5})
+        sto.merge(sto2)
+        self.assertEqual(sto.get_completed_loops(), 5)
+        self.assertEqual(sto.load('l'), 5)
+        sto.merge(sto2, link=True)
+        self.assertEqual(sto.get_completed_loops(), 6)
+        self.assertEqual(sto.load('l'), 5)
+        if mpi.is_master_node(): os.remove("test.h5")
+        if mpi.is_master_node(): os.remove("test2.h5")
+
+    def test_Storage_load_slice(self):
+        sto = Storage("test.h5")
+        g = BlockGf(name_list=['up'], block_list=[GfImFreq(indices=range(2), beta=10, n_points=100)])
+        for l in range(3):
+            g['up'] << SemiCircular(l + 1)
+            sto.save_loop({'g': g})
+        gslice = sto.load_slice('g', range(3), 'up', (0, 0), (0, 30))
+        self.assertEqual(gslice.shape, (3, 30))
+        self.assertTrue(np.allclose(gslice[-1], g['up'].data[100:130, 0, 0]))
+        gslice = sto.load_slice('g', -1, 'up', frequency_range=(-2, 2))
+        self.assertEqual(gslice.shape, (1, 4, 2, 2))
+        self.assertTrue(np.allclose(gslice[0], g['up'].data[98:102, :, :]))
+        iw = sto.load_matsubara_frequencies('g', 'up', frequency_range=(0, 30))
+        self.assertTrue(np.allclose(iw, np.array([w.imag for w in g.mesh])[100:130]))
+        self.assertRaises(AssertionError, sto.load_slice, 'g', -1, 'up', None, (0, 101))
+        if mpi.is_master_node(): os.remove("test.h5")
+
+    def test_Storage_loop_summary(self):
+        sto = Storage("test.h5")
+        for l in range(3):
+            sto.save_loop({'mu': .1 * l, 'g': [1, 2]}, summary={'occupations': {'up_00': .5, 'dn_00': .25 * l}})
+        sto.save_loop({'mu': .3, 'sign': 1.})
+        sto.cut_loop(0)
+        summary = sto.load_summary()
+        self.assertTrue(np.allclose(summary['mu'], [.1, .2, .3]))
+        self.assertEqual(summary['occupations_labels'], ['dn_00', 'up_00'])
+        self.assertTrue(np.allclose(summary['occupations'][:2], [[.25, .5], [.5, .5]]))
+        self.assertTrue(np.isnan(summary['occupations'][2]).all())
+        self.assertTrue(np.isnan(summary['sign'][:2]).all())
+        sto2 = Storage("test2.h5")
+        sto2.save_loop({'mu': .4})
+        sto.merge(sto2)
+        self.assertTrue(np.allclose(sto.load_summary()['mu'], [.1, .2, .3, .4]))
+        if mpi.is_master_node(): os.remove("test.h5")
+        if mpi.is_master_node(): os.remove("test2.h5")
+
+    def test_Storage_verify_repair(self):
+        sto = Storage("test.h5")
+        sto.save_loop({'l': 0})
+        sto.save_loop({'l': 1})
+        self.assertEqual(sto.verify(), ([], True))
+        if mpi.is_master_node():
+            with h5py.File("test.h5", 'a') as disk:
+                disk['dmft_results'].create_group('staging')
+                disk['dmft_results'].create_group('2')
+                disk['dmft_results']['2']['l'] = 2
+        self.assertEqual(sorted(sto.verify()[0]), ['2', 'staging'])
+        self.assertEqual(sorted(sto.repair()), ['2', 'staging'])
+        self.assertEqual(sto.verify(), ([], True))
+        self.assertEqual(sto.get_completed_loops(), 2)
+        sto.save_loop({'l': 3})
+        self.assertEqual(sto.load('l'), 3)
+        if mpi.is_master_node(): os.remove("test.h5")
+
+    def test_Storage_repair_interrupted_cut(self):
+        sto = Storage("test.h5")
+        for l in range(4):
+            sto.save_loop({'l': l})
+        if mpi.is_master_node():
+            with h5py.File("test.h5", 'a') as disk:
+                results = disk['dmft_results']
+                results.create_dataset('loop_index', data=np.array([0, 2, 3]), maxshape=(None,), chunks=True)
+        self.assertFalse(sto.verify()[1])
+        self.assertEqual(sto.repair(), ['1'])
+        self.assertEqual(sto.verify(), ([], True))
+        self.assertEqual(sto.get_completed_loops(), 3)
+        self.assertEqual([sto.load('l', l) for l in range(3)], [0, 2, 3])
+        if mpi.is_master_node(): os.remove("test.h5")
+
+    def test_Storage_read_only(self):
+        sto = Storage("test.h5")
+        sto.save_loop({'l': 0})
+        reader = Storage("test.h5", read_only=True)
+        self.assertEqual(reader.load('l'), 0)
+        sto.save_loop({'l': 1})
+        self.assertEqual([l for l in reader.follow(0, 0, first_loop=0)], [0, 1])
+        self.assertRaises(AssertionError, reader.save_loop, {'l': 2})
+        if mpi.is_master_node(): os.remove("test.h5")
+
+    def test_Storage_compact_gfs(self):
+        sto = Storage("test.h5", compact_gfs=['g', 'g_noisy'])
+        g = BlockGf(name_list=['up', 'dn'], block_list=[GfImFreq(indices=range(2), beta=10, n_points=200)] * 2)
+        g['up'] << SemiCircular(1)
+        g['dn'] << SemiCircular(2)
+        g['dn'] << g['dn'] + .5
+        g_noisy = g.copy()
+        g_noisy['up'].data[:, :, :] += 1e-3 * np.random.rand(*g_noisy['up'].data.shape)
+        sto.save_loop({'g': g, 'g_noisy': g_noisy})
+        g_loaded = sto.load('g')
+        for bn, b in g:
+            self.assertTrue(np.allclose(g_loaded[bn].data, b.data, atol=1e-5))
+        self.assertTrue(np.allclose(sto.load_slice('g', [0], 'dn', (0, 1), (3, 10))[0],
+                                    g['dn'].data[203:210, 0, 1], atol=1e-5))
+        self.assertTrue(np.allclose(sto.load('g_noisy')['up'].data, g_noisy['up'].data))
+        if mpi.is_master_node():
+            with h5py.File("test.h5", 'r') as disk:
+                self.assertTrue('compact_basis' in disk['dmft_results']['0']['g'])
+                self.assertFalse('compact_basis' in disk['dmft_results']['0']['g_noisy'])
+            os.remove("test.h5")
+
+    def test_Storage_minimal(self):
+        sto = Storage("test.h5", minimal=True)
+        g_weiss = BlockGf(name_list=['up'], block_list=[GfImFreq(indices=range(2), beta=10, n_points=100)])
+        g_weiss['up'] << SemiCircular(1)
+        se = g_weiss.copy()
+        se['up'] << .5
+        g_imp = inverse(inverse(g_weiss) - se)
+        sto.save_loop({'g_weiss_iw': g_weiss, 'se_imp_iw': se, 'g_imp_iw': g_imp, 'g0_iw': g_weiss})
+        self.assertTrue(np.allclose(sto.load('g_imp_iw')['up'].data, g_imp['up'].data))
+        self.assertTrue(np.allclose(sto.load('g0_iw')['up'].data, g_weiss['up'].data))
+        self.assertTrue(np.allclose(sto.load_slice('g_imp_iw', [0], 'up', (0, 1))[0], g_imp['up'].data[:, 0, 1]))
+        self.assertTrue(sto.load('g_sol_iw') is None)
+        if mpi.is_master_node():
+            with h5py.File("test.h5", 'r') as disk:
+                self.assertEqual(sorted(disk['dmft_results']['0'].keys()), ['g_weiss_iw', 'se_imp_iw'])
+            os.remove("test.h5")
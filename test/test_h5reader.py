@@ -0,0 +1,45 @@
+import unittest, os, numpy as np
+from pytriqs.utility import mpi
+from pytriqs.gf import BlockGf, GfImFreq, SemiCircular
+
+from cdmft.h5interface import Storage
+from cdmft.h5reader import ArchiveReader, file_locking, retry_reads
+
+
+class TestArchiveReader(unittest.TestCase):
+
+    def test_ArchiveReader_load(self):
+        sto = Storage("test.h5")
+        g = BlockGf(name_list=['up', 'dn'], block_list=[GfImFreq(indices=range(2), beta=10, n_points=100)] * 2)
+        g['up'] << SemiCircular(1)
+        g['dn'] << SemiCircular(2)
+        sto.save_loop({'g': g, 'mu': .5})
+        sto.save_loop({'g': g, 'mu': .7})
+        sto.cut_loop(0)
+        if mpi.is_master_node():
+            for mmap in [False, True]:
+                arch = ArchiveReader("test.h5", mmap)
+                self.assertEqual(arch.get_completed_loops(), 1)
+                self.assertEqual(arch.load('mu'), .7)
+                self.assertTrue(arch.load('nothing') is None)
+                gr = arch.load('g')
+                self.assertEqual(gr.block_names, ['up', 'dn'])
+                self.assertEqual(gr.mesh.beta, 10)
+                self.assertTrue(np.allclose(gr.mesh.points, np.array([w for w in g.mesh])))
+                for bn, b in g:
+                    self.assertTrue(np.allclose(gr[bn].data, b.data))
+            os.remove("test.h5")
+
+    def test_file_locking_retry_reads(self):
+        locking = os.environ.get("HDF5_USE_FILE_LOCKING")
+        with file_locking(False):
+            self.assertEqual(os.environ["HDF5_USE_FILE_LOCKING"], "FALSE")
+        self.assertEqual(os.environ.get("HDF5_USE_FILE_LOCKING"), locking)
+        failures = [IOError(), RuntimeError()]
+        def read(x):
+            if failures:
+                raise failures.pop()
+            return x
+        self.assertEqual(retry_reads(read, (1,), wait=0), 1)
+        failures = [IOError()] * 3
+        self.assertRaises(IOError, retry_reads, read, (1,), 3, 0)
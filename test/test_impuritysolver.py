@@ -1,8 +1,9 @@
-import unittest
+import unittest, numpy as np
 from pytriqs.operators import c, c_dag
 from pytriqs.gf import BlockGf, GfImFreq, SemiCircular, iOmega_n, inverse
 
-from cdmft.impuritysolver import ImpuritySolver
+from cdmft.impuritysolver import ImpuritySolver, HubbardISolver, EDSolver, fit_bath, get_hybridization, estimate_legendre_noise, estimate_legendre_noise_from_tau, get_legendre_cutoff, get_matsubara_errors, get_density_error
+from cdmft.compactgf import legendre_to_matsubara_matrix
 
 
 class TestImpuritySolver(unittest.TestCase):
@@ -38,3 +39,103 @@ class TestImpuritySolver(unittest.TestCase):
         g << solver.get_g_iw(False, True)
         g << solver.get_se(True, False)
         g << solver.get_se(False, True)
+
+    def test_ImpuritySolver_error_estimates(self):
+        n_l, noise = 40, .01
+        samples = noise * np.random.RandomState(0).randn(1000, n_l, 2, 2)
+        self.assertTrue(np.allclose(estimate_legendre_noise(samples[0]), noise, rtol = .5))
+        t = legendre_to_matsubara_matrix(0, 10, n_l)
+        g_iw_errors = np.std(np.einsum('nl,slij->snij', t, samples), axis = 0)
+        self.assertTrue(np.allclose(get_matsubara_errors(np.full((2, 2), noise), n_l, 10), g_iw_errors, rtol = .2))
+        densities = -np.einsum('l,slii->s', np.sqrt(2 * np.arange(n_l) + 1.), samples) / 10.
+        self.assertAlmostEqual(get_density_error(np.full((2, 2), noise), n_l, 10) / np.std(densities), 1, 1)
+
+    def test_HubbardISolver(self):
+        u, beta = 2., 10
+        gf_struct = [('up', range(1)), ('dn', range(1))]
+        solver = HubbardISolver(beta, gf_struct, 100)
+        h = u * c_dag('up', 0) * c('up', 0) * c_dag('dn', 0) * c('dn', 0)
+        g = BlockGf(name_list=['up', 'dn'],
+                    block_list=[GfImFreq(indices=range(1), beta=beta, n_points=100)] * 2)
+        g << inverse(iOmega_n + u * .5)
+        solver.run(g, h, 0)
+        se = solver.get_se()['up']
+        iw = 1j * np.pi / beta
+        self.assertAlmostEqual(se.data[100, 0, 0], u * .5 + u**2 / (4 * iw), 5)
+        self.assertEqual(solver.get_results()["average_sign"], 1)
+
+    def test_approximate_solvers_index_labels(self):
+        u, beta = 2., 10
+        gf_struct = [('up', [1]), ('dn', [1])]
+        h = u * c_dag('up', 1) * c('up', 1) * c_dag('dn', 1) * c('dn', 1)
+        g = BlockGf(name_list=['up', 'dn'],
+                    block_list=[GfImFreq(indices=[1], beta=beta, n_points=100)] * 2)
+        g << inverse(iOmega_n + u * .5 - .25 * SemiCircular(1))
+        solver = HubbardISolver(beta, gf_struct, 100)
+        solver.run(g, h, 0)
+        self.assertAlmostEqual(solver.get_g_iw()['up'].density()[0, 0].real, .5, 3)
+        solver = EDSolver(beta, gf_struct, 100, n_bath_sites=2, omega_fit=20)
+        solver.run(g, h, 0)
+        self.assertAlmostEqual(solver.get_g_iw()['up'].density()[0, 0].real, .5, 3)
+
+    def test_fit_bath(self):
+        iw = 1j * (2 * np.arange(200) + 1) * np.pi / 10.
+        energies, hybridizations = np.array([-1., -.3, .3, 1.]), np.array([[.3, .1], [.4, .2], [.4, -.2], [.3, -.1]])
+        delta = get_hybridization(iw, energies, hybridizations)
+        e, v, error = fit_bath(iw, delta, 4)
+        self.assertTrue(error < 1e-6)
+        self.assertTrue(np.allclose(get_hybridization(iw, e, v), delta, atol = 1e-5))
+
+    def test_EDSolver(self):
+        u, beta = 2., 10
+        gf_struct = [('up', range(1)), ('dn', range(1))]
+        solver = EDSolver(beta, gf_struct, 100, n_bath_sites = 2)
+        h = u * c_dag('up', 0) * c('up', 0) * c_dag('dn', 0) * c('dn', 0)
+        g = BlockGf(name_list=['up', 'dn'],
+                    block_list=[GfImFreq(indices=range(1), beta=beta, n_points=100)] * 2)
+        g << inverse(iOmega_n + u * .5 - .25 * SemiCircular(1))
+        solver.run(g, h, 0)
+        self.assertTrue(solver.get_results()["bath_fit_error"] < 1e-2)
+        g_iw = solver.get_g_iw()['up']
+        self.assertTrue((g_iw.data[100:, 0, 0].imag < 0).all())
+        self.assertAlmostEqual(g_iw.density()[0, 0].real, .5, 3)
+
+    def test_ImpuritySolver_cached_results(self):
+        solver = ImpuritySolver(10, [('u', range(2))], 100, 1000, 25)
+        h = c_dag('u', 0) * c('u', 0)
+        g = BlockGf(name_list=['u'],
+                    block_list=[GfImFreq(indices=range(2),
+                                         beta=10, n_points=100)])
+        g['u'] << SemiCircular(1)
+        solver.run(g, h, 0, n_cycles=50, length_cycle=2, n_warmup_cycles=20,
+                   verbosity=0, perform_post_proc=True, measure_G_l=True)
+        g_iw, se = solver.get_g_iw(), solver.get_se()
+        self.assertTrue(solver.get_g_iw() is g_iw)
+        self.assertTrue(solver.get_se() is se)
+        data = g_iw['u'].data.copy()
+        solver.run(g, h, 1, n_cycles=50, length_cycle=2, n_warmup_cycles=20,
+                   verbosity=0, perform_post_proc=True, measure_G_l=True)
+        self.assertTrue(solver.get_g_iw() is g_iw)
+        self.assertFalse(np.allclose(g_iw['u'].data, data))
+
+    def test_get_legendre_cutoff(self):
+        l = np.arange(40)
+        g_l = np.zeros((40, 2, 2))
+        g_l[:, 0, 0] = g_l[:, 1, 1] = np.exp(-l / 2.) * (l % 2 == 0)
+        g_l_noisy = g_l + 1e-4 * np.random.RandomState(0).randn(40, 2, 2)
+        self.assertEqual(get_legendre_cutoff(g_l_noisy, estimate_legendre_noise(g_l_noisy)), 16)
+        self.assertEqual(get_legendre_cutoff(g_l, np.zeros((2, 2))), 40)
+
+    def test_estimate_legendre_noise_from_tau(self):
+        beta, n_tau = 10., 1001
+        tau = np.linspace(0, beta, n_tau)
+        g_tau = np.zeros((n_tau, 1, 1))
+        g_tau[:, 0, 0] = -.5 * np.cosh(tau - beta / 2.) / np.cosh(beta / 2.)
+        noise = estimate_legendre_noise_from_tau(g_tau, beta)
+        self.assertTrue(noise[0, 0] < 1e-5)
+        g_tau_noisy = g_tau + 1e-2 * np.random.RandomState(0).randn(n_tau, 1, 1)
+        noise = estimate_legendre_noise_from_tau(g_tau_noisy, beta)
+        self.assertAlmostEqual(noise[0, 0], 1e-2 * beta / np.sqrt(n_tau - 1), 3)
+        l = np.arange(40)
+        g_l = np.exp(-l / 20.).reshape(40, 1, 1)
+        self.assertEqual(get_legendre_cutoff(g_l, estimate_legendre_noise_from_tau(g_tau, beta)), 40)
@@ -0,0 +1,41 @@
+import unittest, numpy as np
+
+from cdmft.mixing import AndersonMixer, BroydenMixer, make_mixer, flatten
+from cdmft.parameters import TestDMFTParameters
+
+
+class TestMixing(unittest.TestCase):
+
+    def get_n_loops(self, mixer, n_max = 1000):
+        """
+        loops to find the fixed point of a linear map with contractions close to 1
+        """
+        a = np.diag(np.linspace(.1, .95, 10))
+        b = np.arange(10) + 1j
+        x_fixed = np.linalg.solve(np.identity(10) - a, b)
+        x = np.zeros(10, dtype = complex)
+        for i in range(n_max):
+            x = mixer(x, a.dot(x) + b)
+            if np.max(np.abs(x - x_fixed)) < 1e-8:
+                break
+        return i
+
+    def test_AndersonMixer(self):
+        n_linear = self.get_n_loops(AndersonMixer(1, 0))
+        self.assertTrue(self.get_n_loops(AndersonMixer(1, 5)) < n_linear)
+        self.assertTrue(self.get_n_loops(BroydenMixer(1, 5)) < n_linear)
+
+    def test_AndersonMixer_noise(self):
+        mixer = AndersonMixer(.5, 5, noise = 1)
+        x = mixer(np.zeros(3), np.ones(3))
+        x = mixer(x, x + .1)
+        self.assertFalse(mixer.accelerated)
+        self.assertTrue(np.allclose(x, .55))
+        self.assertEqual(len(mixer.residuals), 1)
+
+    def test_make_mixer(self):
+        self.assertTrue(make_mixer(TestDMFTParameters()) is None)
+        mixer = make_mixer(TestDMFTParameters(mixer = "broyden", mixer_history = 3))
+        self.assertTrue(isinstance(mixer, BroydenMixer))
+        self.assertEqual(mixer.residuals.maxlen, 4)
+        self.assertEqual(flatten([np.ones((2, 1, 1)), np.zeros((2, 2, 2))]).shape, (10,))
@@ -0,0 +1,151 @@
+import unittest, os, tempfile, threading, copy, numpy as np
+from mpi4py import MPI
+from pytriqs.gf import BlockGf, GfImFreq, GfImTime, SemiCircular
+
+from cdmft.mpiarrays import bcast, bcast_shared, get_header, allocate, get_arrays, _bcast_array
+
+
+class ThreadComm:
+    """
+    a rank of a communicator whose ranks are threads of this process, all ranks are on one node
+    """
+
+    def __init__(self, rank, exchange):
+        self.rank = rank
+        self.size = exchange.size
+        self.exchange = exchange
+
+    def Barrier(self):
+        self.exchange.barrier()
+
+    def bcast(self, obj, root=0):
+        if self.rank == root:
+            self.exchange.data = obj
+        self.Barrier()
+        if self.rank != root:
+            obj = copy.deepcopy(self.exchange.data)
+        self.Barrier()
+        return obj
+
+    def Bcast(self, buf, root=0):
+        if self.rank == root:
+            self.exchange.data = np.array(buf)
+        self.Barrier()
+        if self.rank != root:
+            buf[...] = self.exchange.data
+        self.Barrier()
+
+    def gather(self, obj, root=0):
+        self.exchange.items[self.rank] = copy.deepcopy(obj)
+        self.Barrier()
+        objs = [self.exchange.items[rank] for rank in range(self.size)] if self.rank == root else None
+        self.Barrier()
+        return objs
+
+    def Split_type(self, split_type, key=0):
+        return self
+
+    def Split(self, color, key=0):
+        if color == MPI.UNDEFINED:
+            return MPI.COMM_NULL
+        return ThreadComm(0, Exchange(1))
+
+
+class Exchange:
+
+    def __init__(self, size):
+        self.size = size
+        self.data = None
+        self.items = {}
+        self.condition = threading.Condition()
+        self.n_waiting = 0
+        self.generation = 0
+
+    def barrier(self):
+        with self.condition:
+            generation = self.generation
+            self.n_waiting += 1
+            if self.n_waiting == self.size:
+                self.n_waiting = 0
+                self.generation += 1
+                self.condition.notify_all()
+            while generation == self.generation:
+                self.condition.wait()
+
+
+def run_ranks(function, size=2):
+    """
+    function(comm) on every rank, returns the results ordered by rank
+    """
+    exchange = Exchange(size)
+    results, errors = [None] * size, []
+    def run(rank):
+        try:
+            results[rank] = function(ThreadComm(rank, exchange))
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=run, args=(rank,)) for rank in range(size)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert not any([thread.is_alive() for thread in threads]), "ranks are deadlocked"
+    if errors:
+        raise errors[0]
+    return results
+
+
+class TestMPIArrays(unittest.TestCase):
+
+    def test_allocate_from_header(self):
+        g = BlockGf(name_list=['up', 'dn'], block_list=[GfImFreq(indices=range(2), beta=10, n_points=100)] * 2)
+        g['up'] << SemiCircular(1)
+        g_tau = GfImTime(indices=range(3), beta=10, n_points=201)
+        for obj in [g, g_tau, np.arange(6.).reshape(2, 3)]:
+            received = allocate(get_header(obj))
+            for array, array_sent in zip(get_arrays(received), get_arrays(obj)):
+                self.assertEqual(array.shape, array_sent.shape)
+                array[...] = array_sent
+            for array, array_sent in zip(get_arrays(received), get_arrays(obj)):
+                self.assertTrue(np.allclose(array, array_sent))
+        self.assertEqual(allocate(get_header(g)).mesh.beta, 10)
+        self.assertTrue(get_header({'a': 1}) is None)
+        self.assertTrue(np.allclose(bcast(g)['up'].data, g['up'].data))
+
+    def test_bcast_shared(self):
+        a = np.arange(12.).reshape(3, 4)
+        shared = bcast_shared(a)
+        self.assertTrue(np.allclose(shared, a))
+        self.assertTrue(np.allclose(bcast(a, shared=True), a))
+
+    def test_bcast_ranks(self):
+        g = BlockGf(name_list=['up', 'dn'], block_list=[GfImFreq(indices=range(2), beta=10, n_points=100)] * 2)
+        g['up'] << SemiCircular(1)
+        a = np.arange(12.).reshape(3, 4)
+        for obj in [a, g, {'a': 1}]:
+            received = run_ranks(lambda comm: bcast(obj if comm.rank == 0 else None, comm=comm))
+            self.assertTrue(received[0] is obj)
+            if isinstance(obj, dict):
+                self.assertEqual(received[1], obj)
+            else:
+                for array, array_sent in zip(get_arrays(received[1]), get_arrays(obj)):
+                    self.assertTrue(np.allclose(array, array_sent))
+        cases = [(a[:, ::2], np.zeros((3, 2))), (a.astype(np.float32), np.zeros((3, 4))),
+                 (a, np.zeros((3, 8))[:, ::2])]
+        for sent, received in cases:
+            run_ranks(lambda comm: _bcast_array(comm, sent if comm.rank == 0 else received,
+                                                sent.shape, sent.dtype.str, 0))
+            self.assertTrue(np.allclose(received, sent))
+
+    def test_bcast_shared_ranks(self):
+        a = np.arange(12.).reshape(3, 4)
+        directory = tempfile.mkdtemp()
+        shared = run_ranks(lambda comm: bcast_shared(a if comm.rank == 0 else None, directory, comm))
+        for array in shared:
+            self.assertTrue(np.allclose(array, a))
+            self.assertFalse(array.flags.writeable)
+        self.assertEqual(os.listdir(directory), [])
+        os.rmdir(directory)
+        shared = run_ranks(lambda comm: bcast(a if comm.rank == 0 else None, shared=True, comm=comm))
+        self.assertTrue(np.allclose(shared[1], a))
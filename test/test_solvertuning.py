@@ -0,0 +1,61 @@
+import unittest, numpy as np
+
+from cdmft.solvertuning import CycleScheduler, CTHYBTuner, get_acceptance_rates, get_histogram_mean
+from cdmft.convergence import LoopHistory
+
+
+class Histogram:
+
+    def __init__(self, data, limits = None):
+        self.data = np.array(data, dtype = float)
+        self.limits = (0, len(data) - 1) if limits is None else limits
+
+
+class TestSolverTuning(unittest.TestCase):
+
+    def test_CycleScheduler(self):
+        scheduler = CycleScheduler(1000, 10**5, budget = 5000)
+        history = LoopHistory()
+        history.append(g_imp_iw = np.zeros((50, 4)), g_imp_iw_error = np.full((50, 4), .01))
+        scheduler.update(scheduler.get_n_cycles(), history)
+        self.assertEqual(scheduler.get_n_cycles(), 1000)
+        history.append(g_imp_iw = np.full((50, 4), 1.), g_imp_iw_error = np.full((50, 4), .01))
+        scheduler.update(scheduler.get_n_cycles(), history)
+        self.assertEqual(scheduler.get_n_cycles(), 1000)
+        history.append(g_imp_iw = np.full((50, 4), 1.015), g_imp_iw_error = np.full((50, 4), .01))
+        scheduler.update(scheduler.get_n_cycles(), history)
+        self.assertEqual(scheduler.n_cycles, 4000)
+        self.assertEqual(scheduler.get_n_cycles(), 2000)
+        self.assertFalse(scheduler.is_exhausted())
+        scheduler.update(scheduler.get_n_cycles(), history)
+        self.assertTrue(scheduler.is_exhausted())
+        self.assertEqual(scheduler.get_state()["n_cycles_total"], 5000)
+
+    def test_CTHYBTuner(self):
+        analysis = {"insert_length_proposed_0": Histogram([50, 50]),
+                    "insert_length_accepted_0": Histogram([1, 1]),
+                    "shift_length_proposed": Histogram([100]),
+                    "shift_length_accepted": Histogram([0])}
+        rates = get_acceptance_rates(analysis)
+        self.assertAlmostEqual(rates["insert"], .02)
+        self.assertAlmostEqual(rates["shift"], 0)
+        statistics = {"perturbation_order_total": Histogram([0, 0, 1, 0, 1]),
+                      "performance_analysis": analysis}
+        parameters = {"length_cycle": 50, "n_warmup_cycles": 5000, "move_shift": True, "move_double": False}
+        changes = CTHYBTuner()(statistics, parameters)
+        self.assertEqual(changes["length_cycle"], 10)
+        self.assertEqual(changes["n_warmup_cycles"], 1000)
+        self.assertFalse(changes["move_shift"])
+        self.assertTrue(changes["move_double"])
+        parameters.update(changes)
+        self.assertEqual(CTHYBTuner()(statistics, parameters), {})
+        self.assertEqual(CTHYBTuner()({"perturbation_order_total": None}, parameters), {})
+
+    def test_CTHYBTuner_empty_histogram(self):
+        self.assertTrue(get_histogram_mean(Histogram([0, 0, 0])) is None)
+        analysis = {"insert_length_proposed": Histogram([100]),
+                    "insert_length_accepted": Histogram([1])}
+        statistics = {"perturbation_order_total": Histogram([0, 0, 0]),
+                      "performance_analysis": analysis}
+        parameters = {"length_cycle": 50, "n_warmup_cycles": 5000, "move_shift": True, "move_double": False}
+        self.assertEqual(CTHYBTuner()(statistics, parameters), {"move_double": True})